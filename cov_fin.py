@@ -1,5 +1,4 @@
 import streamlit as st
-from pdf2image import convert_from_path
 st.set_page_config(layout="wide")
 
 st.markdown("""
@@ -67,333 +66,57 @@ footer {
 <div class="main-content">
 """, unsafe_allow_html=True)
 
-import streamlit as st
-import io, base64
-from pdf2image import convert_from_path
-
-def display_pdf_as_images(pdf_file, width=850):
-    images = convert_from_path(pdf_file)
-
-    for img in images:
-        buf = io.BytesIO()
-        img.save(buf, format="PNG")
-        buf.seek(0)
-        
-        img_b64 = base64.b64encode(buf.read()).decode("utf-8")
-        st.markdown(
-            f"""
-            <div style="text-align:center;">
-                <img src="data:image/png;base64,{img_b64}"
-                     style="max-width:{width}px; margin:0 auto;"/>
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
-
-
-if "kraj" not in st.session_state:
-    st.session_state.kraj = None
-
-col1, col2, col3, col4, col5 = st.columns(5)
-
-with col1:
-    if st.button("Izrael"):
-        st.session_state.kraj = "Izrael"
-with col2:
-    if st.button("Polska"):
-        st.session_state.kraj = "Polska"
-with col3:
-    if st.button("Niemcy"):
-        st.session_state.kraj = "Niemcy"
-with col4:
-    if st.button("Austria"):
-        st.session_state.kraj = "Austria"
-with col5:
-    if st.button("Włochy"):
-        st.session_state.kraj = "Włochy"
-if st.session_state.kraj == "Włochy":
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Dzienny rozkład nowych przypadków/zgonów/zmiany w liczbie aktywnych"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Italy/daily.pdf", width=850)
-    
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Rozkład parametrów w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Italy/params1_20102020.pdf", width=850)
-    
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Rozkład parametrów w okresie 2020-10-21 do 2021-08-16"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Italy/params_2_after_20102020.pdf", width=850)
-
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Obwiednia minmax w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Italy/plot_fitting_20102020.pdf", width=850)
-
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Obwiednia minmax w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Italy/plot_after_20102020.pdf", width=850)
+import os
 
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Wynik 1000 dopasowan w okresie 2020-05-10 do 2020-06-13 + 21-dniowe przewidywanie"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Italy/1000repetitions_2020_05_10.pdf", width=850)
+from covid_project.constants import RESULTS_DIR
+from covid_project.manifest import MANIFEST_PATH, ResultsManifest
+from covid_project.page_store import render_pdf
 
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Wynik 1000 dopasowan w okresie 2021-04-04 do 2021-05-07 + 21-dniowe przewidywanie"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Italy/1000_repetitions_2021_.pdf", width=850)
 
-if st.session_state.kraj == "Izrael":
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Dzienny rozkład nowych przypadków/zgonów/zmiany w liczbie aktywnych"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Izrael/daily.pdf", width=850)
-    
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Rozkład parametrów w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Izrael/params1_20102020.pdf", width=850)
-    
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Rozkład parametrów w okresie 2020-10-21 do 2021-08-16"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Izrael/params_2_after_20102020.pdf", width=850)
+@st.cache_data(show_spinner=False)
+def load_pages(pdf_file, width, mtime_ns, size):
+    # Pre-rendered pages (python -m covid_project.page_store render); mtime/size
+    # in the key reload a PDF re-generated while the viewer is running
+    return render_pdf(pdf_file, width=width)
 
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Obwiednia minmax w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Izrael/plot_fitting_20102020.pdf", width=850)
 
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Obwiednia minmax w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Izrael/plot_after_20102020.pdf", width=850)
-
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Wynik 1000 dopasowan w okresie 2020-05-10 do 2020-06-13 + 21-dniowe przewidywanie"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Izrael/1000repetitions_2020_05_10.pdf", width=850)
-
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Wynik 1000 dopasowan w okresie 2021-04-04 do 2021-05-07 + 21-dniowe przewidywanie"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Izrael/1000_repetitions_2021_.pdf", width=850)
-
-elif st.session_state.kraj == "Polska":
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Dzienny rozkład nowych przypadków/zgonów/zmiany w liczbie aktywnych"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Poland/daily.pdf", width=850)
-    
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Rozkład parametrów w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Poland/params_1_before_20_10_2020.pdf", width=850)
-    
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Rozkład parametrów w okresie 2020-10-21 do 2021-08-16"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Poland/params_2_after_20_10_2020.pdf", width=850)
-
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Obwiednia minmax w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Poland/minmax_before_20_10_2020.pdf", width=850)
-
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Obwiednia minmax w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Poland/minmax_after_20_10_2020.pdf", width=850)
-
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Wynik 1000 dopasowan w okresie 2020-05-10 do 2020-06-13 + 21-dniowe przewidywanie"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Poland/1000_repetitions_fitting_2020_05_10.pdf", width=850)
-
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Wynik 1000 dopasowan w okresie 2021-04-04 do 2021-05-07 + 21-dniowe przewidywanie"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Poland/1000_repetitions_fitting_2021_04_04.pdf", width=850)
-
-elif st.session_state.kraj == "Niemcy":
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Dzienny rozkład nowych przypadków/zgonów/zmiany w liczbie aktywnych"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Germany/daily.pdf", width=850)
-    
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Rozkład parametrów w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Germany/params1_20102020.pdf", width=850)
-    
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Rozkład parametrów w okresie 2020-10-21 do 2021-08-16"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Germany/params_2_after_20102020.pdf", width=850)
+def display_pdf_as_images(pdf_file, width=850):
+    stat = os.stat(pdf_file)
+    for page in load_pages(pdf_file, width, stat.st_mtime_ns, stat.st_size):
+        st.image(page, width=width)
 
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Obwiednia minmax w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Germany/plot_fitting_20102020.pdf", width=850)
 
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Obwiednia minmax w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Germany/plot_after_20102020.pdf", width=850)
+@st.cache_data(show_spinner=False)
+def load_manifest(path, mtime_ns):
+    # Written by the pipeline (covid_project/manifest.py); reloaded when it changes
+    return ResultsManifest(path).data
 
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Wynik 1000 dopasowan w okresie 2020-05-10 do 2020-06-13 + 21-dniowe przewidywanie"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Germany/1000repetitions_2020_05_10.pdf", width=850)
 
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Wynik 1000 dopasowan w okresie 2021-04-04 do 2021-05-07 + 21-dniowe przewidywanie"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Germany/1000_repetitions_2021_.pdf", width=850)
+def show_figure(country, figure):
+    # The figure is decoded only once its section is opened
+    with st.expander(figure["title"]):
+        if st.toggle("Pokaż wykres", key=f"{country}/{figure['kind']}"):
+            display_pdf_as_images(
+                os.path.join(RESULTS_DIR, country, figure["file"]), width=850
+            )
 
-elif st.session_state.kraj == "Austria":
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Dzienny rozkład nowych przypadków/zgonów/zmiany w liczbie aktywnych"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Austria/daily.pdf", width=850)
-    
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Rozkład parametrów w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Austria/params1_20102020.pdf", width=850)
-    
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Rozkład parametrów w okresie 2020-10-21 do 2021-08-16"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Austria/params_2_after_20102020.pdf", width=850)
 
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Obwiednia minmax w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Austria/plot_fitting_20102020.pdf", width=850)
+if not os.path.exists(MANIFEST_PATH):
+    st.error(f"Brak {MANIFEST_PATH} - uruchom najpierw obliczenia.")
+    st.stop()
+manifest = load_manifest(MANIFEST_PATH, os.stat(MANIFEST_PATH).st_mtime_ns)
+countries = manifest["countries"]
 
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Obwiednia minmax w okresie 2020-03-18 do 2020-10-20"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Austria/plot_after_20102020.pdf", width=850)
+if "kraj" not in st.session_state:
+    st.session_state.kraj = None
 
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Wynik 1000 dopasowan w okresie 2020-05-10 do 2020-06-13 + 21-dniowe przewidywanie"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Austria/1000repetitions_2020_05_10.pdf", width=850)
+for col, (country, entry) in zip(st.columns(len(countries)), countries.items()):
+    with col:
+        if st.button(entry["label"]):
+            st.session_state.kraj = country
 
-    st.markdown(
-        "<h4 style='text-align: center; font-size:18px;'>"
-        "Wynik 1000 dopasowan w okresie 2021-04-04 do 2021-05-07 + 21-dniowe przewidywanie"
-        "</h4>", 
-        unsafe_allow_html=True
-    )
-    display_pdf_as_images("results/Austria/1000_repetitions_2021_.pdf", width=850)
+if st.session_state.kraj in countries:
+    for figure in countries[st.session_state.kraj]["figures"]:
+        show_figure(st.session_state.kraj, figure)
 
 st.markdown("</div>", unsafe_allow_html=True)
@@ -0,0 +1,317 @@
+"""
+Batch driver: fits and plots every country over one shared pool of worker processes.
+
+The countries are the data/<Country>_preprocessed.csv files with a row in the config
+table (COUNTRY_CONFIG): label, results directory, population, split date, the two
+multi-run windows and the fit settings. Every country has the jobs runs_1 and runs_2
+(multiple_runs_fit_sird, batched) and windows_before and windows_after
+(window_wise_fitting before/after the split date), with the settings of main()
+(country_jobs, also used by work_queue.py). The tasks of all countries run on one
+executor.FitExecutor (batches of runs, single windows); the figures of a country are
+drawn as soon as its last job finished, into results/<results_dir>/, and listed in
+the results manifest.
+
+The fits are seeded like the serial drivers and stored in the fit cache, so a run
+that was interrupted skips the tasks already fitted when started again.
+
+Command line (run from the repository root):
+
+    python -m covid_project.batch
+    python -m covid_project.batch --countries Poland Italy --workers 8
+    python -m covid_project.batch --backend cuda --workers 2   # one per GPU
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from .data_loader import country_csv, load_country
+from .envelope import WindowEnvelope
+from .executor import FitExecutor
+from .fit_cache import FitCache
+from .manifest import ResultsManifest
+from .plotting import (
+    plot_all_trajectories_SIRD,
+    plot_compartments_fits,
+    plot_params_wresults,
+)
+from covid_project.constants import (
+    COUNTRY_CONFIG,
+    DATA_DIR,
+    MAX_ITER,
+    NUM_PARTICLES,
+    RESULTS_DIR,
+    RUNS_PER_BATCH,
+)
+
+CSV_SUFFIX = "_preprocessed.csv"
+INT_COLUMNS = ("forecast_days", "num_runs", "window_size", "step", "cost_type")
+DATE_COLUMNS = ("split_date", "start_1", "end_1", "start_2", "end_2")
+
+# Figure files in results/<results_dir>/ (the names main() uses)
+FIGURE_FILES = {
+    "runs_1": "1000repetitions_2020_05_10.pdf",
+    "runs_2": "1000_repetitions_2021_.pdf",
+    "envelope_before": "plot_fitting_20102020.pdf",
+    "envelope_after": "plot_after_20102020.pdf",
+    "params_before": "params1_20102020.pdf",
+    "params_after": "params_2_after_20102020.pdf",
+}
+
+
+def discover_countries(data_dir=DATA_DIR):
+    """Countries with a data/<Country>_preprocessed.csv, sorted."""
+    paths = glob.glob(os.path.join(data_dir, f"*{CSV_SUFFIX}"))
+    return sorted(os.path.basename(path)[: -len(CSV_SUFFIX)] for path in paths)
+
+
+def load_config(path=COUNTRY_CONFIG):
+    """{country: settings} of the config table (integers and Timestamps parsed)."""
+    table = pd.read_csv(path, dtype={"country": str, "label": str, "results_dir": str})
+    config = {}
+    for row in table.to_dict("records"):
+        settings = dict(row, population=float(row["population"]))
+        for name in INT_COLUMNS:
+            settings[name] = int(row[name])
+        for name in DATE_COLUMNS:
+            settings[name] = pd.to_datetime(row[name])
+        config[settings.pop("country")] = settings
+    return config
+
+
+def country_jobs(
+    country,
+    settings,
+    series,
+    n_particles=NUM_PARTICLES,
+    max_iter=MAX_ITER,
+    backend="numba",
+    runs_per_batch=RUNS_PER_BATCH,
+    seed=0,
+):
+    """
+    {job: (kind, country, options)} of one country (its CountrySeries `series`) for
+    FitExecutor.run_jobs, as main() fits them: windows_before and windows_after (no
+    such job if the series ends at the split date), runs_1 and runs_2. The options
+    hold plain types (dates as strings), so they can also go to work_queue.py.
+    """
+    common = dict(
+        population=settings["population"],
+        cost_type=settings["cost_type"],
+        n_particles=n_particles,
+        max_iter=max_iter,
+        backend=backend,
+        seed=seed,
+    )
+    windows = dict(common, window_size=settings["window_size"], step=settings["step"])
+    split = settings["split_date"]
+    jobs = {"windows_before": ("windows", country, dict(windows, end_date=str(split)))}
+    # After: from the first day past the split date (the rest of the series)
+    cut = series.span(end=split).stop
+    if cut < len(series):
+        start = str(series.dates[cut])
+        jobs["windows_after"] = ("windows", country, dict(windows, start_date=start))
+    for k in (1, 2):
+        jobs[f"runs_{k}"] = (
+            "runs",
+            country,
+            dict(
+                common,
+                start_date=str(settings[f"start_{k}"]),
+                end_date=str(settings[f"end_{k}"]),
+                num_runs=settings["num_runs"],
+                forecast_days=settings["forecast_days"],
+                use_norm=True,
+                batched=True,
+                runs_per_batch=runs_per_batch,
+            ),
+        )
+    return jobs
+
+
+def plot_country(
+    country, settings, jobs, manifest, data_dir=DATA_DIR, results_dir=RESULTS_DIR
+):
+    """Draws the figures of one country from its finished jobs ({job: result})."""
+    series = load_country(country_csv(country, data_dir))
+    df = series.to_frame()
+    name = settings["results_dir"]
+    out_dir = os.path.join(results_dir, name)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest.country(name, settings["label"])
+
+    forecast_days = settings["forecast_days"]
+    for k, window_name in ((1, "Okno1"), (2, "Window2")):
+        fits = jobs[f"runs_{k}"]
+        if not len(fits):
+            continue
+        start, end = settings[f"start_{k}"], settings[f"end_{k}"]
+        fig = plot_all_trajectories_SIRD(
+            fits,
+            df,
+            start,
+            end,
+            forecast_days=forecast_days,
+            title=f"{window_name}: {start.date()}..{end.date()} (cost=MXSE(IRD))",
+            population=settings["population"],
+            mode="collection",
+        )
+        file = FIGURE_FILES[f"runs_{k}"]
+        fig.savefig(os.path.join(out_dir, file))
+        plt.close(fig)
+        manifest.add_figure(
+            name,
+            f"runs_{k}",
+            file,
+            start,
+            end,
+            num_runs=len(fits),
+            forecast_days=forecast_days,
+        )
+
+    split = settings["split_date"]
+    cut = series.span(end=split).stop
+    periods = (
+        ("before", series[:cut], f"(do {split:%d.%m.%Y})", 0),
+        ("after", series[cut:], f"(od {split + pd.Timedelta(days=1):%d.%m.%Y})", 1),
+    )
+    for period, part, title_suffix, ds in periods:
+        if len(part) == 0:
+            continue
+        df_part = part.to_frame()
+        dates = df_part["Last_Update"].min(), df_part["Last_Update"].max()
+        env = WindowEnvelope.from_results(jobs[f"windows_{period}"], len(df_part))
+        file = FIGURE_FILES[f"envelope_{period}"]
+        plot_compartments_fits(
+            df_part,
+            env,
+            title_suffix=title_suffix,
+            save_path=os.path.join(out_dir, file),
+            ds=ds,
+        )
+        manifest.add_figure(name, f"envelope_{period}", file, *dates)
+        file = FIGURE_FILES[f"params_{period}"]
+        plot_params_wresults(
+            df_part,
+            env,
+            title_suffix=title_suffix,
+            save_path=os.path.join(out_dir, file),
+        )
+        manifest.add_figure(name, f"params_{period}", file, *dates)
+        plt.close("all")
+
+
+def run_batch(
+    countries=None,
+    config_path=COUNTRY_CONFIG,
+    data_dir=DATA_DIR,
+    results_dir=RESULTS_DIR,
+    workers=None,
+    threads_per_worker=1,
+    **job_options,
+):
+    """
+    Fits and plots the countries (default: all discovered with a config row) on one
+    FitExecutor of `workers` processes (default: one per CPU) of threads_per_worker
+    numba threads each. job_options: see country_jobs (backend, seed, ...).
+    """
+    config = load_config(config_path)
+    available = discover_countries(data_dir)
+    if countries is None:
+        countries = available
+    for country in countries:
+        if country not in available:
+            raise ValueError(f"No {country_csv(country, data_dir)}")
+    missing = [country for country in countries if country not in config]
+    for country in missing:
+        print(f"[WARN] {country}: no row in {config_path}, skipped")
+    countries = [country for country in countries if country not in missing]
+
+    series = {
+        country: load_country(country_csv(country, data_dir)) for country in countries
+    }
+    names, jobs = [], []
+    pending = {country: 0 for country in countries}
+    for country in countries:
+        for job, spec in country_jobs(
+            country, config[country], series[country], **job_options
+        ).items():
+            names.append((country, job))
+            jobs.append(spec)
+            pending[country] += 1
+    print(f"[INFO] {len(jobs)} jobs of {len(countries)} countries: {countries}")
+
+    results = {country: {} for country in countries}
+    manifest = ResultsManifest(os.path.join(results_dir, "manifest.json"))
+    t0 = time.perf_counter()
+    with FitExecutor(
+        series, workers, threads_per_worker=threads_per_worker, cache=FitCache()
+    ) as executor:
+        for index, result in executor.completed_jobs(jobs):
+            country, job = names[index]
+            results[country][job] = result
+            pending[country] -= 1
+            if pending[country] == 0:
+                settings = config[country]
+                plot_country(
+                    country,
+                    settings,
+                    results.pop(country),
+                    manifest,
+                    data_dir,
+                    results_dir,
+                )
+                manifest.save()
+                out_dir = os.path.join(results_dir, settings["results_dir"])
+                print(
+                    f"[INFO] {country} done after {time.perf_counter() - t0:.1f} s, "
+                    f"figures in {out_dir}"
+                )
+    return countries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m covid_project.batch")
+    parser.add_argument("--countries", nargs="+", help="default: all in data/")
+    parser.add_argument("--config", default=COUNTRY_CONFIG)
+    parser.add_argument("--data", default=DATA_DIR)
+    parser.add_argument("--results", default=RESULTS_DIR)
+    parser.add_argument("--workers", type=int, help="processes (default: CPU count)")
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--runs-per-batch", type=int, default=RUNS_PER_BATCH)
+    parser.add_argument(
+        "--backend", choices=("cuda", "numba", "numpy"), default="numba"
+    )
+    parser.add_argument("--n-particles", type=int, default=NUM_PARTICLES)
+    parser.add_argument("--max-iter", type=int, default=MAX_ITER)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.backend == "cuda" and args.workers is None:
+        # Every worker opens a CUDA context; one per CPU would crowd the GPU(s)
+        parser.error("--backend cuda needs --workers (the number of GPUs)")
+
+    plt.switch_backend("Agg")  # figures are only saved
+    run_batch(
+        args.countries,
+        config_path=args.config,
+        data_dir=args.data,
+        results_dir=args.results,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+        runs_per_batch=args.runs_per_batch,
+        n_particles=args.n_particles,
+        max_iter=args.max_iter,
+        backend=args.backend,
+        seed=args.seed,
+    )
+    print("\n[DONE] Skrypt zakończył działanie.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
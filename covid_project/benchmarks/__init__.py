@@ -0,0 +1,6 @@
+"""Benchmark suite of the fitting, simulation and plotting hot paths (see __main__.py)."""
+
+from .cases import PRESETS
+from .runner import compare_results, machine_metadata, run_suite
+
+__all__ = ["PRESETS", "compare_results", "machine_metadata", "run_suite"]
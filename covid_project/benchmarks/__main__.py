@@ -0,0 +1,61 @@
+"""
+Command line of the benchmark suite (run from the repository root):
+
+    python -m covid_project.benchmarks run --preset cpu --out bench.json
+    python -m covid_project.benchmarks compare baseline.json bench.json --threshold 0.1
+
+`compare` exits with status 1 if any case got slower than the threshold allows.
+"""
+
+import argparse
+import sys
+
+from .cases import PRESETS
+from .runner import compare_results, print_comparison, run_suite
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m covid_project.benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="time the benchmark cases")
+    run.add_argument("--preset", choices=sorted(PRESETS), default="smoke")
+    run.add_argument("--country", default="Poland", help="a row of the country config")
+    run.add_argument("--backends", nargs="+", help="override the preset backends")
+    run.add_argument("--integrators", nargs="+", help="override the preset integrators")
+    run.add_argument("--only", nargs="+", help="case groups, e.g. pso simulate_batch")
+    run.add_argument("--repeat", type=int, help="timed calls per case")
+    run.add_argument("--out", default="bench.json", help="JSON results file")
+
+    cmp = sub.add_parser("compare", help="flag regressions against a baseline")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=0.10)
+    cmp.add_argument("--stat", choices=("median", "min"), default="median")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        run_suite(
+            args.preset,
+            args.country,
+            backends=args.backends,
+            integrators=args.integrators,
+            only=args.only,
+            repeat=args.repeat,
+            out_path=args.out,
+        )
+        return 0
+
+    rows = compare_results(args.baseline, args.current, args.threshold, args.stat)
+    print_comparison(rows)
+    n_regressions = sum(row[-1] == "regression" for row in rows)
+    if n_regressions:
+        print(f"[FAIL] {n_regressions} regression(s) above {args.threshold:.0%}")
+        return 1
+    print("[OK] No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""Benchmark cases and size presets (see runner.py)."""
+
+import itertools
+
+import matplotlib
+
+matplotlib.use("Agg")  # no windows: plt.show() is a no-op while benchmarking
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+
+from covid_project.batch import load_config  # noqa: E402
+from covid_project.constants import COUNTRY_CONFIG, PARAM_BOUNDS  # noqa: E402
+from covid_project.data_loader import country_csv, load_covid_data  # noqa: E402
+from covid_project.plotting import (  # noqa: E402
+    plot_all_trajectories_SIRD,
+    plot_compartments_fits,
+    plot_params_wresults,
+)
+from covid_project.pso_fitting import run_pso_sird_gpu  # noqa: E402
+from covid_project.sird_simulation import simulate_sird, simulate_sird_batch  # noqa: E402
+from covid_project.window_fitting import (  # noqa: E402
+    multiple_runs_fit_sird,
+    window_data,
+    window_wise_fitting,
+)
+
+# Sweeps per preset. "smoke" and "cpu" run on a machine without a GPU in seconds/minutes,
+# "full" uses the sizes of main.py (NUM_PARTICLES, MAX_ITER, 1000 runs).
+PRESETS = {
+    "smoke": {
+        "backends": ["numpy", "numba"],
+        "integrators": ["euler", "rk4"],
+        "n_particles": [200],
+        "max_iter": [5],
+        "num_runs": 4,
+        "window_step": 14,
+        "sim_batch": 1000,
+        "plot_runs": 20,
+        "repeat": 1,
+    },
+    "cpu": {
+        "backends": ["numpy", "numba"],
+        "integrators": ["euler", "rk2", "rk4", "rk45"],
+        "n_particles": [500, 2000],
+        "max_iter": [10, 30],
+        "num_runs": 20,
+        "window_step": 7,
+        "sim_batch": 10_000,
+        "plot_runs": 200,
+        "repeat": 3,
+    },
+    "full": {
+        "backends": ["cuda", "numba"],
+        "integrators": ["euler", "rk2", "rk4", "rk45"],
+        "n_particles": [1000, 10_000],
+        "max_iter": [50, 100],
+        "num_runs": 1000,
+        "window_step": 7,
+        "sim_batch": 100_000,
+        "plot_runs": 1000,
+        "repeat": 3,
+    },
+}
+
+
+class Case:
+    """One benchmark: `name` (unique key of the results), its parameters and a callable."""
+
+    def __init__(self, name, params, fn):
+        self.name = name
+        self.params = params
+        self.fn = fn
+
+
+def _pso_inputs(df, start, end, population, cost_type):
+    """PSO inputs of the start..end window, as multiple_runs_fit_sird builds them."""
+    dfw = df[(df["Last_Update"] >= start) & (df["Last_Update"] <= end)]
+    return dict(
+        window_data(
+            dfw["Active"].to_numpy(dtype=float),
+            dfw["Recovered"].to_numpy(dtype=float),
+            dfw["Deaths"].to_numpy(dtype=float),
+            population,
+            rescale=True,
+        ),
+        Npop=population,
+        cost_type=cost_type,
+        use_norm=True,
+    )
+
+
+def build_cases(
+    preset,
+    country="Poland",
+    backends=None,
+    integrators=None,
+    only=None,
+    config_path=COUNTRY_CONFIG,
+):
+    """
+    List of Case objects for the preset (a PRESETS key or a dict of the same shape),
+    on the data, population and first fitting window of `country` (its row of the
+    country config, as main() fits it).
+    backends/integrators override the preset sweep; only: case groups to keep
+    (first part of the case name, e.g. "pso", "window_wise", "simulate_batch").
+    """
+    cfg = dict(PRESETS[preset] if isinstance(preset, str) else preset)
+    if backends is not None:
+        cfg["backends"] = backends
+    if integrators is not None:
+        cfg["integrators"] = integrators
+
+    settings = load_config(config_path)[country]
+    fit_start, fit_end = settings["start_1"], settings["end_1"]
+    population = settings["population"]
+    cost_type = settings["cost_type"]
+    df = load_covid_data(country_csv(country))
+    df_windows = df[df["Last_Update"] <= settings["split_date"]].copy()
+    pso_kwargs = _pso_inputs(df, fit_start, fit_end, population, cost_type)
+    n_small, it_small = min(cfg["n_particles"]), min(cfg["max_iter"])
+    cases = []
+
+    # PSO alone
+    for backend, integrator, n, it in itertools.product(
+        cfg["backends"], cfg["integrators"], cfg["n_particles"], cfg["max_iter"]
+    ):
+        cases.append(
+            Case(
+                f"pso/{backend}/{integrator}/p{n}/i{it}",
+                dict(backend=backend, integrator=integrator, n_particles=n, max_iter=it),
+                lambda b=backend, g=integrator, n=n, it=it: run_pso_sird_gpu(
+                    n_particles=n,
+                    max_iter=it,
+                    backend=b,
+                    integrator=g,
+                    seed=0,
+                    **pso_kwargs,
+                ),
+            )
+        )
+
+    # Pipelines of main.py
+    for backend, integrator in itertools.product(cfg["backends"], cfg["integrators"]):
+        params = dict(
+            backend=backend, integrator=integrator, n_particles=n_small, max_iter=it_small
+        )
+        cases.append(
+            Case(
+                f"multiple_runs/{backend}/{integrator}/r{cfg['num_runs']}",
+                dict(params, num_runs=cfg["num_runs"]),
+                lambda p=params: multiple_runs_fit_sird(
+                    df,
+                    fit_start,
+                    fit_end,
+                    num_runs=cfg["num_runs"],
+                    cost_type=cost_type,
+                    forecast_days=settings["forecast_days"],
+                    population=population,
+                    batched=True,
+                    **p,
+                ),
+            )
+        )
+        cases.append(
+            Case(
+                f"window_wise/{backend}/{integrator}/s{cfg['window_step']}",
+                dict(params, step=cfg["window_step"]),
+                lambda p=params: window_wise_fitting(
+                    df_windows,
+                    population=population,
+                    step=cfg["window_step"],
+                    seed=0,
+                    batched=True,
+                    **p,
+                ),
+            )
+        )
+
+    # Simulation of fitted parameter sets
+    rng = np.random.default_rng(0)
+    # (plausible ranges of the fitted values, columns in PARAM_BOUNDS order)
+    fitted = np.column_stack([
+        rng.uniform(lo, hi, cfg["sim_batch"])
+        for lo, hi in ((0.05, 0.5), (0.05, 0.5), (0, 10), (10, 36), (0, 0.1), (0, 0.01))
+    ])
+    ic = (pso_kwargs["S0"], pso_kwargs["I0"], pso_kwargs["R0"], pso_kwargs["D0"])
+    for integrator in cfg["integrators"]:
+        cases.append(
+            Case(
+                f"simulate/{integrator}/n1",
+                dict(integrator=integrator, n=1),
+                lambda g=integrator: simulate_sird(
+                    dict(zip(PARAM_BOUNDS, fitted[0])),
+                    56,
+                    *ic,
+                    Npop=population,
+                    integrator=g,
+                ),
+            )
+        )
+        cases.append(
+            Case(
+                f"simulate_batch/{integrator}/n{cfg['sim_batch']}",
+                dict(integrator=integrator, n=cfg["sim_batch"]),
+                lambda g=integrator: simulate_sird_batch(
+                    fitted, 56, *ic, Npop=population, integrator=g
+                ),
+            )
+        )
+
+    # Plotting (inputs are simulated once here, only the drawing is timed)
+    n_plot = cfg["plot_runs"]
+    traj = simulate_sird_batch(fitted[:n_plot], 56, *ic, Npop=population)
+    all_traj = [tuple(run) for run in traj]
+    wresults = []
+    for start_day in range(0, len(df_windows) - 36 + 1, cfg["window_step"]):
+        row = df_windows.iloc[start_day]
+        S_fit, I_fit, R_fit, D_fit = simulate_sird(
+            dict(zip(PARAM_BOUNDS, fitted[start_day])),
+            36,
+            population - (row["Active"] + row["Recovered"] + row["Deaths"]),
+            row["Active"],
+            row["Recovered"],
+            row["Deaths"],
+            Npop=population,
+        )
+        wresults.append({
+            "start_day": start_day,
+            "best_params": dict(zip(PARAM_BOUNDS, fitted[start_day])),
+            "S_fit": S_fit,
+            "I_fit": I_fit,
+            "R_fit": R_fit,
+            "D_fit": D_fit,
+        })
+
+    def closing(fn):
+        def run():
+            fn()
+            plt.close("all")
+
+        return run
+
+    for mode in ("lines", "collection", "density"):
+        cases.append(
+            Case(
+                f"plot_all_trajectories/r{n_plot}"
+                + ("" if mode == "lines" else f"/{mode}"),
+                dict(num_runs=n_plot, mode=mode),
+                closing(
+                    lambda mode=mode: plot_all_trajectories_SIRD(
+                        all_traj,
+                        df,
+                        fit_start,
+                        fit_end,
+                        forecast_days=settings["forecast_days"],
+                        population=population,
+                        mode=mode,
+                    )
+                ),
+            )
+        )
+    cases += [
+        Case(
+            f"plot_compartments_fits/w{len(wresults)}",
+            dict(num_windows=len(wresults)),
+            closing(lambda: plot_compartments_fits(df_windows, wresults)),
+        ),
+        Case(
+            f"plot_params_wresults/w{len(wresults)}",
+            dict(num_windows=len(wresults)),
+            closing(lambda: plot_params_wresults(df_windows, wresults)),
+        ),
+    ]
+
+    if only is not None:
+        cases = [case for case in cases if case.name.split("/")[0] in only]
+    return cases, cfg["repeat"]
@@ -0,0 +1,153 @@
+"""Running the benchmark cases, saving the results (JSON) and comparing two result files."""
+
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numba
+import numpy as np
+from numba import cuda
+
+from .cases import build_cases
+
+
+def machine_metadata():
+    """Where and on what the results were measured."""
+    meta = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "hostname": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "numba": numba.__version__,
+        "numba_threads": numba.get_num_threads(),
+        "cuda_device": None,
+        "git_commit": None,
+    }
+    if cuda.is_available():
+        meta["cuda_device"] = cuda.get_current_device().name.decode()
+    try:
+        meta["git_commit"] = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return meta
+
+
+def run_suite(
+    preset="smoke",
+    country="Poland",
+    backends=None,
+    integrators=None,
+    only=None,
+    repeat=None,
+    out_path=None,
+):
+    """
+    Times every case of the preset: one untimed warm-up call (JIT compilation,
+    GPU context) and `repeat` timed calls. Cases with backend "cuda" are skipped
+    when no GPU is available.
+    Returns {"metadata", "preset", "results"} and writes it to out_path (JSON) if given.
+    """
+    cases, preset_repeat = build_cases(preset, country, backends, integrators, only)
+    repeat = preset_repeat if repeat is None else repeat
+    has_gpu = cuda.is_available()
+
+    results = []
+    for case in cases:
+        if case.params.get("backend") == "cuda" and not has_gpu:
+            print(f"[SKIP] {case.name} (no CUDA device)")
+            continue
+
+        case.fn()
+        times = []
+        for _ in range(repeat):
+            t_start = time.perf_counter()
+            case.fn()
+            times.append(time.perf_counter() - t_start)
+
+        results.append({
+            "name": case.name,
+            "params": case.params,
+            "times": times,
+            "min": min(times),
+            "median": statistics.median(times),
+        })
+        print(f"[BENCH] {case.name:<45} median {results[-1]['median']:9.4f} s")
+
+    report = {
+        "metadata": machine_metadata(),
+        "preset": preset if isinstance(preset, str) else "custom",
+        "repeat": repeat,
+        "results": results,
+    }
+    if out_path is not None:
+        with open(out_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Results saved to {out_path}")
+    return report
+
+
+def compare_results(baseline, current, threshold=0.10, stat="median"):
+    """
+    Compares two reports (dicts from run_suite or paths to their JSON files) case by case.
+    Returns a list of rows (name, baseline time, current time, ratio, status), where
+    status is "regression" if current > baseline * (1 + threshold), "faster" if
+    current < baseline / (1 + threshold), otherwise "ok"; cases present in only
+    one report are "new" or "missing".
+    """
+    reports = []
+    for report in (baseline, current):
+        if not isinstance(report, dict):
+            with open(report) as f:
+                report = json.load(f)
+        reports.append(report)
+    base = {r["name"]: r[stat] for r in reports[0]["results"]}
+    curr = {r["name"]: r[stat] for r in reports[1]["results"]}
+
+    rows = []
+    for name in list(base) + [n for n in curr if n not in base]:
+        if name not in curr:
+            rows.append((name, base[name], None, None, "missing"))
+            continue
+        if name not in base:
+            rows.append((name, None, curr[name], None, "new"))
+            continue
+        ratio = curr[name] / base[name] if base[name] > 0 else float("inf")
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append((name, base[name], curr[name], ratio, status))
+
+    # Timings from different machines are not comparable
+    keys = ("hostname", "processor", "cuda_device", "numba_threads")
+    meta_b, meta_c = reports[0]["metadata"], reports[1]["metadata"]
+    differing = [k for k in keys if meta_b.get(k) != meta_c.get(k)]
+    if differing:
+        print(f"[WARN] Reports come from different machines ({', '.join(differing)})")
+    return rows
+
+
+def print_comparison(rows):
+    """Table of compare_results rows."""
+
+    def fmt(x):
+        return "-" if x is None else f"{x:.4f}"
+
+    print(f"{'case':<45} {'baseline':>10} {'current':>10} {'ratio':>7}  status")
+    for name, b, c, ratio, status in rows:
+        print(f"{name:<45} {fmt(b):>10} {fmt(c):>10} {fmt(ratio):>7}  {status}")
@@ -0,0 +1,86 @@
+"""
+Append-only checkpoints of long fitting jobs (multiple_runs_fit_sird, window_wise_fitting).
+
+The file is JSONL: a header with the signature of the job inputs, then one record per
+finished unit of work (a run, a batch of runs or a window) with its result and the
+state of the driver's RNG after it. Records are flushed and fsync'ed one by one, so a
+killed process loses at most the unit it was working on.
+"""
+
+import json
+import os
+
+from .fit_cache import fit_key
+
+
+class Checkpoint:
+    """
+    Checkpoint file of one job. With resume=True an existing file is loaded (it must
+    have been written for the same inputs, see job_signature) and new records are
+    appended to it; otherwise the file is started anew.
+    done: index -> record of the finished units.
+    """
+
+    def __init__(self, path, signature, resume=False):
+        self.path = path
+        self.signature = signature
+        self.done = {}
+        self.rng_state = None
+        if resume and os.path.exists(path):
+            self._load()
+        else:
+            self._write({"kind": "header", "signature": signature}, mode="w")
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            lines = f.read().split(b"\n")
+
+        valid_bytes = 0
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # The last line may be cut by a kill in the middle of a write
+                break
+            valid_bytes += len(line) + 1
+        if not records or records[0].get("kind") != "header":
+            raise ValueError(f"{self.path} is not a checkpoint file")
+        if records[0]["signature"] != self.signature:
+            raise ValueError(
+                f"{self.path} was written for different inputs; "
+                "remove it or run without resume"
+            )
+
+        # Drop a cut last line so that new records start on a line of their own
+        with open(self.path, "r+b") as f:
+            f.truncate(valid_bytes)
+
+        for record in records[1:]:
+            self.done[record["index"]] = record
+            if "rng_state" in record:
+                self.rng_state = record["rng_state"]
+
+    def _write(self, record, mode="a"):
+        with open(self.path, mode) as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def save(self, index, rng=None, **data):
+        """Records finished unit `index` with its data (JSON-serializable)."""
+        record = {"index": index, **data}
+        if rng is not None:
+            record["rng_state"] = rng.bit_generator.state
+        self._write(record)
+        self.done[index] = record
+
+    def restore_rng(self, rng):
+        """Puts rng into the state saved with the last finished unit (if any)."""
+        if self.rng_state is not None:
+            rng.bit_generator.state = self.rng_state
+
+
+def job_signature(**inputs):
+    """Signature of the inputs a checkpoint was written for (see fit_cache.fit_key)."""
+    return fit_key(**inputs)
@@ -9,3 +9,29 @@ NUM_PARTICLES = 10_000  # Number of particles
 
 DT = 0.5  # sub step = 0.5 => 2 Euler sub steps for 1 day
 SUBSTEPS = 2  # 2 sub-steps of 0.5 = 1 day
+INTEGRATOR = "euler"  # SIRD time integrator: "euler", "rk2", "rk4" or "rk45" (adaptive)
+RK45_RTOL = 1e-6  # Relative tolerance of the adaptive RK45 integrator
+RK45_ATOL = 1e-3  # Absolute tolerance of the adaptive RK45 integrator (people)
+
+BACKEND = "cuda"  # Cost evaluator: "cuda" (GPU), "numba" or "numpy" (CPU)
+RUNS_PER_BATCH = 50  # PSO runs advanced together by run_pso_sird_batched
+
+FIT_CACHE_DIR = ".fit_cache"  # On-disk cache of PSO fits (fit_cache.py)
+FIT_CACHE_MAX_MB = 512  # Size limit of the fit cache (least recently used are removed)
+CHECKPOINT_DIR = ".checkpoints"  # Job checkpoints of main(), in <country>/ (checkpoint.py)
+DATA_DIR = "data"  # Preprocessed CSVs: data/<Country>_preprocessed.csv
+COUNTRY_CONFIG = "data/countries.csv"  # Population, dates and fit settings per country
+DATA_CACHE_DIR = ".data_cache"  # Binary columnar cache of the CSVs (data_loader.py)
+RESULTS_DIR = "results"  # Figures of every country: results/<Country>/*.pdf
+PAGE_STORE_DIR = ".page_store"  # Pre-rendered pages of the result PDFs (page_store.py)
+
+# Fitted SIRD parameters and their default PSO bounds (lower, upper).
+# The order is the order of rows in the PSO particle matrix.
+PARAM_BOUNDS = {
+    "beta1": (0.0, 1.5),
+    "beta2": (0.0, 1.5),
+    "t1": (0.0, 10.0),
+    "t2": (10.0, 36.0),
+    "gamma": (0.0, 0.3),
+    "mu": (0.0, 0.05),
+}
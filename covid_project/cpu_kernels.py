@@ -0,0 +1,152 @@
+"""CPU counterparts of the kernels from gpu_kernels.py (NumPy, vectorized over particles)."""
+
+import numpy as np
+
+from covid_project.constants import INTEGRATOR
+from covid_project.integrators import integrator_code, sird_advance_numpy
+
+
+def sird_euler_cpu(  # noqa: PLR0912, PLR0915
+    beta1_array,
+    beta2_array,
+    t1_array,
+    t2_array,
+    gamma_array,
+    mu_array,
+    dt,
+    substeps,
+    Npop,
+    days,
+    I_emp,
+    R_emp,
+    D_emp,
+    cost_type,
+    S0,
+    I0,
+    R0,
+    D0,
+    use_norm,
+    i_min,
+    i_rng,
+    r_min,
+    r_rng,
+    d_min,
+    d_rng,
+    offsets=None,
+    integrator=INTEGRATOR,
+):
+    """
+    Same model and cost as sird_euler_gpu, but all particles are advanced together
+    as (n_particles,) arrays, one day and one sub step at a time.
+    S0/I0/R0/D0 may be per-particle arrays; with `offsets` (per-particle int array)
+    particle p is compared with I_emp/R_emp/D_emp[offsets[p] : offsets[p] + days]
+    (the CPU counterpart of sird_euler_windows_gpu).
+    integrator: "euler" (in-place sub steps below), "rk2", "rk4" or "rk45"
+    (integrators.sird_advance_numpy).
+    Returns the cost array of shape (n_particles,).
+    """
+    beta1 = np.asarray(beta1_array, dtype=np.float64)
+    beta2 = np.asarray(beta2_array, dtype=np.float64)
+    t1 = np.asarray(t1_array, dtype=np.float64)
+    t2 = np.asarray(t2_array, dtype=np.float64)
+    gamma_ = np.asarray(gamma_array, dtype=np.float64)
+    mu_ = np.asarray(mu_array, dtype=np.float64)
+    n_particles = beta1.size
+
+    # Stan początkowy
+    S = np.array(np.broadcast_to(S0, n_particles), dtype=np.float64)
+    I = np.array(np.broadcast_to(I0, n_particles), dtype=np.float64)
+    R = np.array(np.broadcast_to(R0, n_particles), dtype=np.float64)
+    D = np.array(np.broadcast_to(D0, n_particles), dtype=np.float64)
+
+    # Akumulatory błędów
+    err = np.zeros(n_particles, dtype=np.float64)
+    max_err = np.zeros(n_particles, dtype=np.float64)
+
+    # Bufory pomocnicze (bez alokacji w pętli)
+    beta_t = np.empty(n_particles, dtype=np.float64)
+    frac = np.empty(n_particles, dtype=np.float64)
+    new_inf = np.empty(n_particles, dtype=np.float64)
+    removal = gamma_ + mu_
+    slope = beta2 - beta1
+    span = t2 - t1 + 1e-8
+    di = np.empty(n_particles, dtype=np.float64)
+    dr = np.empty(n_particles, dtype=np.float64)
+    dd = np.empty(n_particles, dtype=np.float64)
+    sq = np.empty(n_particles, dtype=np.float64)
+    in_place_euler = integrator_code(integrator) == 0
+
+    for day_idx in range(days):
+        # Określenie beta(t) - stałe w obrębie dnia
+        np.subtract(day_idx, t1, out=frac)
+        np.divide(frac, span, out=frac)
+        np.multiply(frac, slope, out=beta_t)
+        np.add(beta_t, beta1, out=beta_t)
+        np.copyto(beta_t, beta1, where=day_idx < t1)
+        np.copyto(beta_t, beta2, where=day_idx >= np.maximum(t1, t2))
+
+        if not in_place_euler:
+            S, I, R, D = sird_advance_numpy(
+                integrator, S, I, R, D, beta_t, gamma_, mu_, Npop, dt, substeps
+            )
+        else:
+            # -- Euler substeps --
+            for _ in range(substeps):
+                # new_inf = beta_t * (S * I / Npop)
+                np.multiply(S, I, out=new_inf)
+                np.divide(new_inf, Npop, out=new_inf)
+                np.multiply(new_inf, beta_t, out=new_inf)
+
+                dI = new_inf - removal * I
+                dR = gamma_ * I
+                dD = mu_ * I
+
+                S -= new_inf * dt
+                I += dI * dt
+                R += dR * dt
+                D += dD * dt
+
+                for X in (S, I, R, D):
+                    np.clip(X, 0.0, 1e15, out=X)
+
+        # -- błąd dobowy --
+        emp_idx = day_idx if offsets is None else offsets + day_idx
+        if use_norm == 1:
+            di.fill(0.0)
+            dr.fill(0.0)
+            dd.fill(0.0)
+            if i_rng > 1e-12:
+                np.subtract(I, i_min, out=di)
+                np.divide(di, i_rng, out=di)
+                np.subtract(di, I_emp[emp_idx], out=di)
+            if r_rng > 1e-12:
+                np.subtract(R, r_min, out=dr)
+                np.divide(dr, r_rng, out=dr)
+                np.subtract(dr, R_emp[emp_idx], out=dr)
+            if d_rng > 1e-12:
+                np.subtract(D, d_min, out=dd)
+                np.divide(dd, d_rng, out=dd)
+                np.subtract(dd, D_emp[emp_idx], out=dd)
+        else:
+            np.subtract(I, I_emp[emp_idx], out=di)
+            np.subtract(R, R_emp[emp_idx], out=dr)
+            np.subtract(D, D_emp[emp_idx], out=dd)
+
+        if cost_type == 3:
+            # max( (D-D_emp)^2 )
+            np.multiply(dd, dd, out=sq)
+            np.maximum(max_err, sq, out=max_err)
+        else:
+            np.multiply(di, di, out=sq)
+            sq += dr * dr
+            sq += dd * dd
+            if cost_type in (20, 30):
+                # max squared error (dla IRD)
+                np.maximum(max_err, sq, out=max_err)
+            else:
+                # sum MSE
+                err += sq
+
+    if cost_type in (20, 3, 30):
+        return max_err
+    return err / days
@@ -1,9 +1,190 @@
-"""Let's load our covid_data that is ready to go."""
+"""Let's load our covid_data that is ready to go.
 
+load_covid_data gives the pandas DataFrame (for plotting); load_country gives a
+CountrySeries of read-only NumPy columns, cached per country in a binary .npz
+(DATA_CACHE_DIR) and reused while the source CSV is unchanged (same mtime and
+size, or else the same SHA-256). Date ranges of a CountrySeries are zero-copy
+views, so the fitting drivers slice windows without pandas masks or copies.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
 import pandas as pd
 
+from covid_project.constants import DATA_CACHE_DIR, DATA_DIR
+
+DATA_CACHE_VERSION = 1
+COLUMNS = ("Confirmed", "Active", "Recovered", "Deaths")
+
+
+def country_csv(country, data_dir=DATA_DIR):
+    """Path of the preprocessed CSV of a country, e.g. data/Poland_preprocessed.csv."""
+    return os.path.join(data_dir, f"{country}_preprocessed.csv")
 
-def load_covid_data(csv_path="data/covid-19-preprocessed.csv"):
-    df = pd.read_csv(csv_path, parse_dates=["Last_Update"])
+
+def load_covid_data(csv_path=country_csv("Poland")):
+    df = pd.read_csv(csv_path)
+    # Some of the CSVs have a "Date" column and the old index as the first column
+    df = df.drop(columns=[c for c in df.columns if c.startswith("Unnamed")])
+    df = df.rename(columns={"Date": "Last_Update"})
+    df["Last_Update"] = pd.to_datetime(df["Last_Update"])
     df = df.sort_values("Last_Update")
     return df.reset_index(drop=True)
+
+
+class CountrySeries:
+    """
+    Sorted dates (datetime64[ns]) and float64 columns (COLUMNS, zeros if missing
+    in the CSV) of one country.
+    """
+
+    def __init__(self, dates, columns):
+        self.dates = dates
+        self.columns = columns
+
+    @classmethod
+    def from_frame(cls, df):
+        """From a DataFrame with Last_Update (sorted here if it is not)."""
+        dates = df["Last_Update"].to_numpy(dtype="datetime64[ns]")
+        order = None
+        if np.any(dates[1:] < dates[:-1]):
+            order = np.argsort(dates, kind="stable")
+        columns = {}
+        for name in COLUMNS:
+            col = (
+                df[name].to_numpy(dtype=np.float64)
+                if name in df.columns
+                else np.zeros(len(df))
+            )
+            columns[name] = col if order is None else col[order]
+        return cls(dates if order is None else dates[order], columns)
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def active(self):
+        return self.columns["Active"]
+
+    @property
+    def recovered(self):
+        return self.columns["Recovered"]
+
+    @property
+    def deaths(self):
+        return self.columns["Deaths"]
+
+    def span(self, start=None, end=None):
+        """Index slice of the days with start <= date <= end (None: open end)."""
+        first, last = 0, len(self)
+        if start is not None:
+            first = int(np.searchsorted(self.dates, _ns(start), "left"))
+        if end is not None:
+            last = int(np.searchsorted(self.dates, _ns(end), "right"))
+        return slice(first, last)
+
+    def between(self, start=None, end=None):
+        """CountrySeries of the days with start <= date <= end, as views."""
+        return self[self.span(start, end)]
+
+    def __getitem__(self, index):
+        """CountrySeries of a slice of days (views of the arrays)."""
+        return CountrySeries(
+            self.dates[index], {name: col[index] for name, col in self.columns.items()}
+        )
+
+    def to_frame(self):
+        """DataFrame like load_covid_data (e.g. for the plotting functions)."""
+        return pd.DataFrame({"Last_Update": self.dates, **self.columns})
+
+
+def _ns(date):
+    return np.datetime64(pd.Timestamp(date), "ns")
+
+
+def as_country_series(data):
+    """CountrySeries of a CountrySeries or a DataFrame (see load_covid_data)."""
+    return data if isinstance(data, CountrySeries) else CountrySeries.from_frame(data)
+
+
+_loaded = {}  # (abspath, mtime_ns, size) -> CountrySeries, per process
+
+
+def load_country(country_or_csv, cache_dir=DATA_CACHE_DIR, data_dir=DATA_DIR):
+    """
+    CountrySeries of a country ("Poland") or of a CSV path, from the .npz cache
+    (built from the CSV when missing or stale). The arrays are read-only and
+    shared by every call in the process.
+    """
+    csv_path = (
+        country_or_csv
+        if country_or_csv.endswith(".csv")
+        else country_csv(country_or_csv, data_dir)
+    )
+    st = os.stat(csv_path)
+    key = (os.path.abspath(csv_path), st.st_mtime_ns, st.st_size)
+    if key not in _loaded:
+        _loaded[key] = _load_cached(csv_path, st, cache_dir)
+    return _loaded[key]
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _load_cached(csv_path, st, cache_dir):
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    cache_path = os.path.join(cache_dir, f"{stem}.npz")
+    source = {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+    series = meta = None
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("version") == DATA_CACHE_VERSION:
+                series = CountrySeries(
+                    data["dates"].view("datetime64[ns]"),
+                    {name: data[name] for name in COLUMNS},
+                )
+
+    if series is not None and {k: meta[k] for k in source} != source:
+        # Touched but maybe not changed (e.g. a fresh checkout): compare contents
+        sha256 = _file_sha256(csv_path)
+        if sha256 == meta["sha256"]:
+            _save_cache(cache_path, series, {**meta, **source})
+        else:
+            series = None
+    if series is None:
+        series = CountrySeries.from_frame(load_covid_data(csv_path))
+        meta = {
+            "version": DATA_CACHE_VERSION,
+            "source": csv_path,
+            "sha256": _file_sha256(csv_path),
+            **source,
+        }
+        _save_cache(cache_path, series, meta)
+
+    for arr in (series.dates, *series.columns.values()):
+        arr.flags.writeable = False
+    return series
+
+
+def _save_cache(cache_path, series, meta):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".npz")
+    with os.fdopen(fd, "wb") as f:
+        np.savez(
+            f,
+            meta=np.array(json.dumps(meta)),
+            dates=series.dates.view(np.int64),
+            **series.columns,
+        )
+    os.replace(tmp_path, cache_path)
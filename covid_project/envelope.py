@@ -0,0 +1,135 @@
+"""
+Streaming envelopes of fitted curves over global days.
+
+Curves (windows or runs) are added one by one as the fits finish; per series and
+global day the aggregator keeps the running min/max and a fixed-size reservoir
+sample from which the quantile bands (e.g. 5/50/95%) are computed. Memory is
+bounded by n_series x n_days x capacity; the quantiles are exact as long as no day
+got more than `capacity` curves.
+"""
+
+import numpy as np
+
+from covid_project.constants import PARAM_BOUNDS
+from .sird_simulation import beta_curve
+
+QUANTILES = (0.05, 0.5, 0.95)
+RESERVOIR_SIZE = 256  # samples kept per series and day for the quantiles
+
+
+class EnvelopeAggregator:
+    """Min/max and approximate quantiles of the series `names` on days 0..n_days-1."""
+
+    def __init__(
+        self, n_days, names, quantiles=QUANTILES, capacity=RESERVOIR_SIZE, seed=0
+    ):
+        self.n_days = n_days
+        self.names = list(names)
+        self.quantiles = tuple(quantiles)
+        self.capacity = capacity
+        self.count = np.zeros(n_days, dtype=np.int64)
+        self.min = np.full((len(self.names), n_days), np.inf)
+        self.max = np.full((len(self.names), n_days), -np.inf)
+        self._reservoir = np.full((len(self.names), n_days, capacity), np.nan)
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, start_day, values):
+        """values: (n_series, L) curve starting at global day start_day (cut to n_days)."""
+        values = np.asarray(values, dtype=np.float64)
+        first = max(start_day, 0)
+        last = min(start_day + values.shape[1], self.n_days)
+        if last <= first:
+            return
+        values = values[:, first - start_day : last - start_day]
+        days = slice(first, last)
+
+        np.fmin(self.min[:, days], values, out=self.min[:, days])
+        np.fmax(self.max[:, days], values, out=self.max[:, days])
+
+        # Reservoir sampling, vectorized over the days of the curve
+        seen = self.count[days]
+        slot = np.where(seen < self.capacity, seen, self._rng.integers(0, seen + 1))
+        keep = slot < self.capacity
+        self._reservoir[:, first + np.flatnonzero(keep), slot[keep]] = values[:, keep]
+        self.count[days] += 1
+
+    def add_batch(self, start_days, values):
+        """values: (N, n_series, L) curves; start_days: scalar or (N,)."""
+        start_days = np.broadcast_to(start_days, len(values))
+        for start_day, curve in zip(start_days, values):
+            self.add(int(start_day), curve)
+
+    def _index(self, name):
+        return self.names.index(name)
+
+    def min_max(self, name):
+        """(min, max) arrays of one series; NaN on days without any curve."""
+        k = self._index(name)
+        empty = self.count == 0
+        return (
+            np.where(empty, np.nan, self.min[k]),
+            np.where(empty, np.nan, self.max[k]),
+        )
+
+    def quantile(self, name, q):
+        """Approximate q-quantile of one series per day; NaN on days without curves."""
+        out = np.full(self.n_days, np.nan)
+        filled = self.count > 0
+        samples = self._reservoir[self._index(name), filled]
+        out[filled] = np.nanquantile(samples, q, axis=-1)
+        return out
+
+    def envelope(self, name):
+        """{"min": ..., "max": ..., q: ... for q in quantiles} of one series."""
+        lo, hi = self.min_max(name)
+        env = {"min": lo, "max": hi}
+        for q in self.quantiles:
+            env[q] = self.quantile(name, q)
+        return env
+
+
+class WindowEnvelope(EnvelopeAggregator):
+    """
+    Envelopes of window_wise_fitting results: the fitted S, I, R, D and the
+    parameter curves beta(t), gamma, mu, R0(t) = beta(t) / (gamma + mu).
+    Pass one as window_wise_fitting(envelope=...) to fill it while fitting.
+    """
+
+    SERIES = ("S", "I", "R", "D", "beta", "gamma", "mu", "R0")
+
+    def __init__(self, n_days, **kwargs):
+        super().__init__(n_days, self.SERIES, **kwargs)
+
+    def add_windows(self, start_days, params_matrix, trajectories):
+        """params_matrix: (W, n_params); trajectories: (W, 4, window_size) S, I, R, D."""
+        params_matrix = np.asarray(params_matrix, dtype=np.float64)
+        trajectories = np.asarray(trajectories, dtype=np.float64)
+        W, _, L = trajectories.shape
+        names = list(PARAM_BOUNDS)
+        beta = beta_curve(params_matrix, L)
+        gamma_ = np.broadcast_to(params_matrix[:, [names.index("gamma")]], (W, L))
+        mu_ = np.broadcast_to(params_matrix[:, [names.index("mu")]], (W, L))
+        r0 = beta / np.maximum(gamma_ + mu_, 1e-12)
+        curves = np.concatenate(
+            [trajectories, np.stack([beta, gamma_, mu_, r0], axis=1)], axis=1
+        )
+        self.add_batch(start_days, curves)
+
+    def add_fits(self, fits):
+        """Adds a fit_results.WindowFits."""
+        self.add_windows(fits.start_days, fits.params, fits.trajectories())
+
+    @classmethod
+    def from_results(cls, wresults, n_days, **kwargs):
+        """Envelope of a window_wise_fitting result (WindowFits or list of dicts)."""
+        env = cls(n_days, **kwargs)
+        if hasattr(wresults, "trajectories"):
+            env.add_fits(wresults)
+            return env
+        for res in wresults:
+            env.add_windows(
+                [res["start_day"]],
+                [[res["best_params"][name] for name in PARAM_BOUNDS]],
+                [[res[f"{c}_fit"] for c in "SIRD"]],
+            )
+        return env
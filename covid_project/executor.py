@@ -0,0 +1,425 @@
+"""
+Process-pool executor of independent PSO fits, for machines without a GPU.
+
+The runs (or batches of runs) of multiple_runs_fit_sird and the windows of
+window_wise_fitting are independent fits, and so are the jobs of different
+countries. FitExecutor spreads them over worker processes (CPU backends):
+
+- the I/R/D columns of the countries are copied once into one
+  multiprocessing.shared_memory block that every worker maps when it starts; a task
+  only names the country and its day range, so no array is pickled per task;
+- at most max_in_flight tasks are submitted at a time;
+- the seeds of the tasks are drawn here in the order of the serial drivers, so the
+  results do not depend on the number of workers and equal those of
+  multiple_runs_fit_sird / window_wise_fitting(compact=True) with the same seed;
+- the workers send back parameter matrices and costs only, assembled into
+  fit_results.RunFits / WindowFits; completed_jobs yields every job as soon as it is
+  done (batch.py draws the figures of a country meanwhile).
+
+    with FitExecutor({"Poland": load_country("Poland")}, workers=8) as ex:
+        runs = ex.multiple_runs("Poland", "2020-05-10", "2020-06-13", seed=0)
+        before, after = ex.run_jobs(
+            [
+                ("windows", "Poland", dict(end_date="2020-10-20", seed=0)),
+                ("windows", "Poland", dict(start_date="2020-10-21", seed=0)),
+            ]
+        )
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .fit_results import RunFits, WindowFits
+from .pso_fitting import run_pso_sird_batched, run_pso_sird_gpu
+from .sird_simulation import params_to_matrix
+from .window_fitting import multi_run_settings, window_data
+from covid_project.constants import (
+    DT,
+    INTEGRATOR,
+    MAX_ITER,
+    NUM_PARTICLES,
+    RUNS_PER_BATCH,
+    SUBSTEPS,
+)
+
+SHARED_COLUMNS = ("Active", "Recovered", "Deaths")
+
+
+class SharedSeries:
+    """
+    The SHARED_COLUMNS of named CountrySeries in one shared memory block.
+    spec is what a process needs to map it (see attach_series).
+    """
+
+    def __init__(self, series):
+        total = sum(len(s) for s in series.values()) * len(SHARED_COLUMNS)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(total, 1) * 8)
+        block = np.ndarray((total,), dtype=np.float64, buffer=self._shm.buf)
+        layout = {}
+        offset = 0
+        for key, s in series.items():
+            layout[key] = (offset, len(s))
+            for name in SHARED_COLUMNS:
+                block[offset : offset + len(s)] = s.columns[name]
+                offset += len(s)
+        del block  # no view may outlive the mapping
+        self.spec = (self._shm.name, layout)
+
+    def close(self):
+        """Unmaps and frees the block."""
+        self._shm.close()
+        self._shm.unlink()
+
+
+def attach_series(spec):
+    """(handle, {key: (I, R, D)}) read-only views of a SharedSeries block."""
+    name, layout = spec
+    shm = shared_memory.SharedMemory(name=name)
+    columns = {}
+    for key, (offset, n) in layout.items():
+        shape = (len(SHARED_COLUMNS), n)
+        block = np.ndarray(shape, np.float64, buffer=shm.buf, offset=offset * 8)
+        block.flags.writeable = False
+        columns[key] = tuple(block)
+    return shm, columns
+
+
+_worker = {}  # state of a worker process, set by _init_worker
+
+
+def _init_worker(spec, threads, cache):
+    _worker["shm"], _worker["columns"] = attach_series(spec)
+    _worker["cache"] = cache
+    if threads:
+        import numba
+
+        numba.set_num_threads(threads)
+
+
+def run_task(task, I_emp, R_emp, D_emp, cache=None, backend=None):
+    """
+    Fits one planned task (see plan_runs, plan_windows) on the I/R/D columns of its
+    country: num_runs runs, or one window, on days first..last-1. backend overrides
+    the planned one (e.g. "cuda" on a GPU node). Returns the (num_runs, n_params)
+    parameter matrix and the final costs.
+    """
+    kind, key, first, last, settings, seed, num_runs = task
+    pso = dict(settings["pso"], backend=backend or settings["pso"]["backend"])
+    pso_kwargs = {
+        **pso,
+        "cache": cache if seed is not None else None,
+        **window_data(
+            I_emp[first:last],
+            R_emp[first:last],
+            D_emp[first:last],
+            pso["Npop"],
+            settings["rescale"],
+        ),
+        **settings["options"],
+    }
+    if kind == "runs" and settings["batched"]:
+        fits = run_pso_sird_batched(num_runs, seed=seed, **pso_kwargs)
+    else:
+        fits = [run_pso_sird_gpu(seed=seed, **pso_kwargs)]
+    return (
+        params_to_matrix([gbest_params for gbest_params, *_ in fits]),
+        np.array([hist[-1] for _, hist, *_ in fits], dtype=np.float64),
+    )
+
+
+def _fit_task(task):
+    return run_task(task, *_worker["columns"][task[1]], _worker["cache"])
+
+
+class FitExecutor:
+    """
+    Pool of `workers` processes (default: one per CPU) with threads_per_worker numba
+    threads each, fitting jobs on the countries of `series` ({key: CountrySeries}).
+    cache: a fit_cache.FitCache shared by the workers (seeded fits only).
+    Use it as a context manager, or call close().
+    """
+
+    def __init__(
+        self, series, workers=None, max_in_flight=None, threads_per_worker=1, cache=None
+    ):
+        self.series = dict(series)
+        self.workers = workers or os.cpu_count()
+        self.max_in_flight = max_in_flight or 2 * self.workers
+        self._shared = SharedSeries(self.series)
+        self._pool = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._shared.spec, threads_per_worker, cache),
+        )
+
+    def close(self):
+        self._pool.shutdown()
+        self._shared.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def multiple_runs(self, key, start_date, end_date, **options):
+        """multiple_runs_fit_sird(series[key], ..., compact=True), see plan_runs."""
+        (result,) = self.run_jobs(
+            [("runs", key, dict(start_date=start_date, end_date=end_date, **options))]
+        )
+        return result
+
+    def window_wise(self, key, **options):
+        """window_wise_fitting(series[key], ..., compact=True), see plan_windows."""
+        (result,) = self.run_jobs([("windows", key, options)])
+        return result
+
+    def run_jobs(self, jobs):
+        """
+        Results of several jobs (kind, key, options), kind "runs" or "windows", e.g. all
+        jobs of several countries; their tasks share the pool.
+        """
+        results = [None] * len(jobs)
+        for index, result in self.completed_jobs(jobs):
+            results[index] = result
+        return results
+
+    def completed_jobs(self, jobs):
+        """
+        Yields (index, result) of every job of run_jobs as soon as its last task has
+        finished (the tasks are submitted in the order of the jobs).
+        """
+        plans = [
+            PLANNERS[kind](self.series[key], key, **options)
+            for kind, key, options in jobs
+        ]
+        owner = []  # (job, position in the job) of every task
+        for index, (tasks, assemble) in enumerate(plans):
+            owner.extend((index, k) for k in range(len(tasks)))
+            if not tasks:
+                yield index, assemble([])
+        parts = [[None] * len(tasks) for tasks, _ in plans]
+        left = [len(tasks) for tasks, _ in plans]
+        tasks = [task for tasks, _ in plans for task in tasks]
+        for i, result in self.imap(_fit_task, tasks):
+            index, k = owner[i]
+            parts[index][k] = result
+            left[index] -= 1
+            if left[index] == 0:
+                yield index, plans[index][1](parts[index])
+
+    def map(self, function, items):
+        """[function(item) for item in items] in the pool, max_in_flight at a time."""
+        items = list(items)
+        results = [None] * len(items)
+        for i, result in self.imap(function, items):
+            results[i] = result
+        return results
+
+    def imap(self, function, items):
+        """Yields (i, function(items[i])) in order of completion, see map."""
+        items = list(items)
+        pending = {}
+        next_item = 0
+        while next_item < len(items) or pending:
+            while next_item < len(items) and len(pending) < self.max_in_flight:
+                future = self._pool.submit(function, items[next_item])
+                pending[future] = next_item
+                next_item += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+
+def plan_runs(
+    series,
+    key,
+    start_date,
+    end_date,
+    num_runs=1000,
+    cost_type=20,
+    use_norm=True,
+    n_particles=NUM_PARTICLES,
+    max_iter=MAX_ITER,
+    forecast_days=0,
+    population=38e6,
+    DT=DT,
+    SUBSTEPS=SUBSTEPS,
+    backend="numba",
+    batched=False,
+    runs_per_batch=RUNS_PER_BATCH,
+    pso_options=None,
+    integrator=INTEGRATOR,
+    seed=None,
+):
+    """
+    (tasks, assemble) of multiple_runs_fit_sird on the CountrySeries `series`, called
+    `key` in the tasks (same arguments): one task per run or batch of runs.
+    assemble(results of the tasks) gives the RunFits.
+    """
+    span = series.span(start_date, end_date)
+    days_window = span.stop - span.start
+    if days_window < 2:
+        print(f"[WARN] Za mało danych w oknie: {start_date}..{end_date}")
+        empty = RunFits.empty(
+            days_window,
+            forecast_days,
+            dt=DT,
+            substeps=SUBSTEPS,
+            population=population,
+            integrator=integrator,
+        )
+        return [], lambda parts: empty
+
+    window = series[span]
+    data = window_data(window.active, window.recovered, window.deaths, population)
+    settings = dict(
+        pso=multi_run_settings(
+            population,
+            use_norm,
+            n_particles,
+            max_iter,
+            cost_type,
+            DT,
+            SUBSTEPS,
+            backend,
+            integrator,
+            None,
+        ),
+        rescale=use_norm,
+        options=pso_options or {},
+        batched=batched,
+    )
+    rng = np.random.default_rng(seed)
+    unit = runs_per_batch if batched else 1
+    tasks = [
+        (
+            "runs",
+            key,
+            span.start,
+            span.stop,
+            settings,
+            None if seed is None else int(rng.integers(2**63)),
+            min(unit, num_runs - first_run),
+        )
+        for first_run in range(0, num_runs, unit)
+    ]
+
+    def assemble(parts):
+        return RunFits(
+            np.concatenate([params for params, _ in parts]),
+            tuple(data[name] for name in ("S0", "I0", "R0", "D0")),
+            np.concatenate([cost for _, cost in parts]),
+            days_window,
+            forecast_days,
+            dt=DT,
+            substeps=SUBSTEPS,
+            population=population,
+            integrator=integrator,
+        )
+
+    return tasks, assemble
+
+
+def plan_windows(
+    series,
+    key,
+    start_date=None,
+    end_date=None,
+    population=38e6,
+    window_size=36,
+    step=3,
+    cost_type=30,
+    n_particles=NUM_PARTICLES,
+    max_iter=MAX_ITER,
+    use_norm=False,
+    i_min=0.0,
+    i_rng=1.0,
+    r_min=0.0,
+    r_rng=1.0,
+    d_min=0.0,
+    d_rng=1.0,
+    DT=DT,
+    SUBSTEPS=SUBSTEPS,
+    backend="numba",
+    pso_options=None,
+    seed=None,
+    integrator=INTEGRATOR,
+):
+    """
+    (tasks, assemble) of window_wise_fitting (same arguments; no warm start, which
+    chains the windows) on the days start_date..end_date of `series`: one task per
+    window. assemble(results of the tasks) gives the WindowFits.
+    """
+    span = series.span(start_date, end_date)
+    settings = dict(
+        pso=dict(
+            dt=DT,
+            substeps=SUBSTEPS,
+            Npop=population,
+            n_particles=n_particles,
+            max_iter=max_iter,
+            cost_type=cost_type,
+            use_norm=use_norm,
+            i_min=i_min,
+            i_rng=i_rng,
+            r_min=r_min,
+            r_rng=r_rng,
+            d_min=d_min,
+            d_rng=d_rng,
+            backend=backend,
+            integrator=integrator,
+        ),
+        rescale=False,
+        options=pso_options or {},
+        batched=False,
+    )
+    rng = np.random.default_rng(seed)
+    start_days = np.arange(0, span.stop - span.start - window_size + 1, step)
+    tasks = [
+        (
+            "window",
+            key,
+            span.start + int(start_day),
+            span.start + int(start_day) + window_size,
+            settings,
+            None if seed is None else int(rng.integers(2**63)),
+            1,
+        )
+        for start_day in start_days
+    ]
+    first = span.start + start_days
+    initial = np.column_stack(
+        [
+            population
+            - (series.active[first] + series.recovered[first] + series.deaths[first]),
+            series.active[first],
+            series.recovered[first],
+            series.deaths[first],
+        ]
+    )
+
+    def assemble(parts):
+        if not parts:
+            return WindowFits.empty(window_size)
+        return WindowFits(
+            start_days,
+            np.concatenate([params for params, _ in parts]),
+            initial,
+            np.concatenate([cost for _, cost in parts]),
+            window_size,
+            dt=DT,
+            substeps=SUBSTEPS,
+            population=population,
+            integrator=integrator,
+        )
+
+    return tasks, assemble
+
+
+PLANNERS = {"runs": plan_runs, "windows": plan_windows}
@@ -0,0 +1,179 @@
+"""
+Content-addressed on-disk cache of PSO fit results.
+
+The key is a SHA-256 of everything that determines a fit (empirical arrays, initial
+conditions, population, cost type, normalization, bounds, integrator, dt/substeps,
+particle and iteration counts, seed, ...). Every entry is one JSON file; the least
+recently used entries are removed when the cache grows over max_bytes.
+
+Command line (run from the repository root):
+
+    python -m covid_project.fit_cache info
+    python -m covid_project.fit_cache clear
+    python -m covid_project.fit_cache prune --max-mb 100
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from covid_project.constants import FIT_CACHE_DIR, FIT_CACHE_MAX_MB
+
+CACHE_VERSION = 1  # bump when the format of the entries or the fit itself changes
+PRUNE_TO = 0.9  # put() prunes down to this fraction of max_bytes, then counts again
+
+
+def _feed(h, value):
+    """Feeds a canonical byte representation of value into the hash h."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, np.ndarray) or hasattr(value, "__array__"):
+        arr = np.ascontiguousarray(np.asarray(value))
+        h.update(f"array:{arr.dtype.str}:{arr.shape}:".encode())
+        h.update(arr.tobytes())
+    elif isinstance(value, dict):
+        h.update(b"dict:")
+        for k in sorted(value):
+            _feed(h, k)
+            _feed(h, value[k])
+        h.update(b";")
+    elif isinstance(value, (list, tuple)):
+        h.update(f"seq:{len(value)}:".encode())
+        for v in value:
+            _feed(h, v)
+    else:
+        h.update(f"{type(value).__name__}:{value!r};".encode())
+
+
+def fit_key(**inputs):
+    """Hex SHA-256 key of the fit inputs (arrays, scalars, dicts, lists)."""
+    h = hashlib.sha256(f"fit-cache-v{CACHE_VERSION};".encode())
+    _feed(h, inputs)
+    return h.hexdigest()
+
+
+class FitCache:
+    """
+    Directory of cached fits: <directory>/<key[:2]>/<key>.json.
+    Reading an entry refreshes its mtime, which is the LRU order of prune().
+    put() scans the directory only when the size counted since the last scan goes
+    over max_bytes (entries written by other processes are seen at that scan).
+    """
+
+    def __init__(self, directory=FIT_CACHE_DIR, max_bytes=FIT_CACHE_MAX_MB * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # bytes at the last scan plus the writes since, None: unknown
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Cached value or None."""
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            # Marks the entry as recently used; another process may prune it meanwhile
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Stores a JSON-serializable value (written atomically), pruning if needed."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(value, f)
+            written = f.tell()
+        os.replace(tmp_path, path)
+        if self._size is not None:
+            self._size += written
+        if self._size is None or self._size > self.max_bytes:
+            self.prune(int(PRUNE_TO * self.max_bytes))
+
+    def invalidate(self, key):
+        """Removes one entry; returns True if it existed."""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def entries(self):
+        """List of (mtime, size, path) of all entries, oldest first."""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for sub in os.scandir(self.directory):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".json"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def prune(self, max_bytes=None):
+        """Removes the least recently used entries until the total size fits max_bytes."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # already removed by another process sharing the cache
+            total -= size
+            removed += 1
+        self._size = total
+        return removed
+
+    def clear(self):
+        """Removes every entry; returns their number."""
+        entries = self.entries()
+        for _, _, path in entries:
+            os.remove(path)
+        self._size = 0
+        return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m covid_project.fit_cache")
+    parser.add_argument("command", choices=("info", "clear", "prune"))
+    parser.add_argument("--dir", default=FIT_CACHE_DIR)
+    parser.add_argument("--max-mb", type=float, default=FIT_CACHE_MAX_MB)
+    args = parser.parse_args(argv)
+
+    cache = FitCache(args.dir, int(args.max_mb * 2**20))
+    if args.command == "info":
+        entries = cache.entries()
+        size = sum(size for _, size, _ in entries)
+        print(f"[INFO] {args.dir}: {len(entries)} entries, {size / 2**20:.2f} MB")
+    elif args.command == "clear":
+        print(f"[INFO] Removed {cache.clear()} entries from {args.dir}")
+    else:
+        print(f"[INFO] Removed {cache.prune()} entries from {args.dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
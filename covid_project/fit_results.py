@@ -0,0 +1,248 @@
+"""
+Compact results of the fitting drivers (multiple_runs_fit_sird, window_wise_fitting).
+
+Only the fitted parameter matrix, the initial states and the final costs are kept in
+contiguous arrays; the S, I, R, D trajectories are simulated on demand with
+simulate_sird_batch, in chunks, optionally as float32 or into a memory-mapped
+(runs, 4, days) block. Memory grows with runs x n_params, not runs x 4 x days.
+"""
+
+import numpy as np
+
+from covid_project.constants import INTEGRATOR, PARAM_BOUNDS
+from .sird_simulation import forecast_params, simulate_sird_batch
+
+CHUNK_RUNS = 4096  # runs simulated at once (float64 temporaries of the chunk only)
+
+
+def _output_block(shape, dtype, path):
+    """Result array of the trajectories: in memory, or a .npy memmap at path."""
+    if path is None:
+        return np.empty(shape, dtype=dtype)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+
+class _CompactFits:
+    """Common part: params (N, n_params) in PARAM_BOUNDS order, initial (N, 4), cost (N,)."""
+
+    _fields = ("params", "initial", "cost")
+    _scalars = ()
+    _settings = ("dt", "substeps", "population", "integrator")
+
+    def __init__(self, params, initial, cost, dt, substeps, population, integrator):
+        self.params = np.ascontiguousarray(params, dtype=np.float64)
+        self.initial = np.ascontiguousarray(
+            np.broadcast_to(initial, (len(self.params), 4)), dtype=np.float64
+        )
+        self.cost = np.ascontiguousarray(cost, dtype=np.float64)
+        self.dt = dt
+        self.substeps = substeps
+        self.population = population
+        self.integrator = integrator
+
+    def __len__(self):
+        return len(self.params)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self._fields)
+
+    def best_params(self, index):
+        """Parameter dict of one fit."""
+        return dict(zip(PARAM_BOUNDS, self.params[index].tolist()))
+
+    def _simulate(self, params, days, initial, out):
+        return simulate_sird_batch(
+            params,
+            days,
+            *initial.T,
+            dt=self.dt,
+            substeps=self.substeps,
+            Npop=self.population,
+            out=out,
+            integrator=self.integrator,
+        )
+
+    def trajectories(self, dtype=np.float64, path=None, chunk=CHUNK_RUNS):
+        """
+        (N, 4, days) array of S, I, R, D of every fit, simulated chunk by chunk.
+        dtype: e.g. np.float32 to halve the memory; path: write into a .npy memmap.
+        """
+        out = _output_block((len(self), 4, self.days), dtype, path)
+        for first in range(0, len(self), chunk):
+            sl = slice(first, first + chunk)
+            out[sl] = self._simulate_rows(sl)
+        if path is not None:
+            out.flush()
+        return out
+
+    def save(self, path):
+        """Stores the arrays and the simulation settings in an .npz file."""
+        np.savez(
+            path,
+            **{name: getattr(self, name) for name in self._fields},
+            **{name: np.asarray(getattr(self, name)) for name in self._settings},
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            kwargs = {name: data[name] for name in data.files}
+        for name in cls._settings:
+            kwargs[name] = kwargs[name].item()
+        return cls(**kwargs)
+
+
+class RunFits(_CompactFits):
+    """
+    multiple_runs_fit_sird(compact=True): N runs fitted to the same window of
+    days_window days (the same initial state), plus forecast_days of forecast
+    (constant beta2 from the last day of the fit, see forecast_params).
+    """
+
+    _scalars = ("days_window", "forecast_days")
+    _settings = _CompactFits._settings + _scalars
+
+    def __init__(
+        self,
+        params,
+        initial,
+        cost,
+        days_window,
+        forecast_days=0,
+        dt=0.5,
+        substeps=2,
+        population=38e6,
+        integrator=INTEGRATOR,
+    ):
+        super().__init__(params, initial, cost, dt, substeps, population, integrator)
+        self.days_window = days_window
+        self.forecast_days = forecast_days
+
+    @classmethod
+    def empty(cls, days_window, forecast_days=0, **settings):
+        """No runs (the window has too few days); settings: dt, substeps, ..."""
+        return cls(
+            np.empty((0, len(PARAM_BOUNDS))),
+            np.empty((0, 4)),
+            [],
+            days_window,
+            forecast_days,
+            **settings,
+        )
+
+    @classmethod
+    def concatenate(cls, parts):
+        """One RunFits of the runs of several (e.g. fitted in separate processes)."""
+        first = parts[0]
+        return cls(
+            np.concatenate([part.params for part in parts]),
+            np.concatenate([part.initial for part in parts]),
+            np.concatenate([part.cost for part in parts]),
+            **{name: getattr(first, name) for name in cls._settings},
+        )
+
+    @property
+    def days(self):
+        return self.days_window + self.forecast_days
+
+    def _simulate_rows(self, sl):
+        params = self.params[sl]
+        block = np.empty((len(params), 4, self.days))
+        self._simulate(
+            params, self.days_window, self.initial[sl], block[:, :, : self.days_window]
+        )
+        if self.forecast_days > 0:
+            self._simulate(
+                forecast_params(params),
+                self.forecast_days,
+                block[:, :, self.days_window - 1],
+                block[:, :, self.days_window :],
+            )
+        return block
+
+    def __getitem__(self, index):
+        """(S, I, R, D) of one run, like an element of the list result."""
+        return tuple(self._simulate_rows(slice(index, index + 1))[0])
+
+    def __iter__(self):
+        for first in range(0, len(self), CHUNK_RUNS):
+            yield from (
+                tuple(run)
+                for run in self._simulate_rows(slice(first, first + CHUNK_RUNS))
+            )
+
+    def to_list(self):
+        """The list-of-(S, I, R, D)-tuples result of multiple_runs_fit_sird."""
+        return [tuple(run) for run in self.trajectories()]
+
+
+class WindowFits(_CompactFits):
+    """
+    window_wise_fitting(compact=True): one fit per window of window_size days
+    starting at start_days[w], each from its own initial state.
+    """
+
+    _fields = _CompactFits._fields + ("start_days",)
+    _scalars = ("window_size",)
+    _settings = _CompactFits._settings + _scalars
+
+    def __init__(
+        self,
+        start_days,
+        params,
+        initial,
+        cost,
+        window_size,
+        dt=0.5,
+        substeps=2,
+        population=38e6,
+        integrator=INTEGRATOR,
+    ):
+        super().__init__(params, initial, cost, dt, substeps, population, integrator)
+        self.start_days = np.ascontiguousarray(start_days, dtype=np.int64)
+        self.window_size = window_size
+
+    @classmethod
+    def empty(cls, window_size):
+        """No windows (the series is shorter than one window)."""
+        return cls(
+            [], np.empty((0, len(PARAM_BOUNDS))), np.empty((0, 4)), [], window_size
+        )
+
+    @property
+    def days(self):
+        return self.window_size
+
+    def _simulate_rows(self, sl):
+        return self._simulate(self.params[sl], self.days, self.initial[sl], None)
+
+    def _window_dict(self, w, trajectory):
+        S_fit, I_fit, R_fit, D_fit = trajectory
+        return {
+            "start_day": int(self.start_days[w]),
+            "best_params": self.best_params(w),
+            "cost": float(self.cost[w]),
+            "S_fit": S_fit,
+            "I_fit": I_fit,
+            "R_fit": R_fit,
+            "D_fit": D_fit,
+        }
+
+    def __getitem__(self, w):
+        """Result dict of one window, like an element of the list result."""
+        return self._window_dict(w, self._simulate_rows(slice(w, w + 1))[0])
+
+    def __iter__(self):
+        for first in range(0, len(self), CHUNK_RUNS):
+            block = self._simulate_rows(slice(first, first + CHUNK_RUNS))
+            for k, trajectory in enumerate(block):
+                yield self._window_dict(first + k, trajectory)
+
+    def to_list(self, cost_histories=None):
+        """The list-of-dicts result of window_wise_fitting (with cost_history if given)."""
+        results = list(self)
+        if cost_histories is not None:
+            for res, hist in zip(results, cost_histories):
+                res["cost_history"] = hist
+        return results
@@ -1,10 +1,119 @@
 """All computing kernels using Numba/CUDA and related structures are located here."""
 
-from numba import cuda
+from numba import cuda, float32, int32, njit, prange
+from numba.cuda.random import xoroshiro128p_uniform_float32
+
+from covid_project.integrators import sird_advance
+
+PSO_THREADS = 128  # Threads per block of the PSO kernels (also the shared-memory size)
+
+
+def sird_particle_cost(  # noqa: PLR0912
+    beta1,
+    beta2,
+    t1,
+    t2,
+    gamma_,
+    mu_,
+    S,
+    I,
+    R,
+    D,
+    offset,
+    dt,
+    substeps,
+    Npop,
+    days,
+    I_emp,
+    R_emp,
+    D_emp,
+    cost_type,
+    use_norm,
+    i_min,
+    i_rng,
+    r_min,
+    r_rng,
+    d_min,
+    d_rng,
+    integrator,
+):
+    """
+    Simulation + cost of one particle, starting from (S, I, R, D) and
+    compared with I_emp/R_emp/D_emp[offset : offset + days].
+    integrator: integrator code (integrators.INTEGRATORS; 0 = Euler).
+    Plain Python, compiled below both as a CUDA device function and for the CPU.
+    """
+    # Akumulatory błędów dla MSE:
+    err_I = 0.0
+    err_R = 0.0
+    err_D = 0.0
+
+    # Do obliczania max-square-error:
+    max_err_ird_sq = 0.0
+    max_err_d_sq = 0.0
+
+    # Symulacja day po day
+    for day_idx in range(days):
+        # Określenie beta(t) - stałe w obrębie dnia
+        if day_idx < t1:
+            beta_t = beta1
+        elif day_idx < t2:
+            frac = (day_idx - t1) / (t2 - t1 + 1e-8)
+            beta_t = beta1 + frac * (beta2 - beta1)
+        else:
+            beta_t = beta2
+
+        # -- krok czasowy (Euler / RK2 / RK4 / RK45, np. 2 subkroki = 1 dzień) --
+        S, I, R, D = sird_advance(
+            integrator, S, I, R, D, beta_t, gamma_, mu_, Npop, dt, substeps
+        )
+
+        # -- błąd dobowy --
+        emp_idx = offset + day_idx
+        if use_norm == 1:
+            # Normalizacja
+            di = 0.0
+            dr = 0.0
+            dd = 0.0
+            if i_rng > 1e-12:
+                di = (I - i_min) / i_rng - I_emp[emp_idx]
+            if r_rng > 1e-12:
+                dr = (R - r_min) / r_rng - R_emp[emp_idx]
+            if d_rng > 1e-12:
+                dd = (D - d_min) / d_rng - D_emp[emp_idx]
+        else:
+            di = I - I_emp[emp_idx]
+            dr = R - R_emp[emp_idx]
+            dd = D - D_emp[emp_idx]
+
+        if cost_type == 10:
+            # sum MSE
+            err_I += di * di
+            err_R += dr * dr
+            err_D += dd * dd
+        elif cost_type == 20 or cost_type == 30:
+            # max squared error (dla IRD)
+            sum_sq = di * di + dr * dr + dd * dd
+            max_err_ird_sq = max(sum_sq, max_err_ird_sq)
+        elif cost_type == 3:
+            # max( (D-D_emp)^2 )
+            sq = dd * dd
+            max_err_d_sq = max(sq, max_err_d_sq)
+
+    # -- Po pętli day_idx --
+    if cost_type == 20 or cost_type == 30:
+        return max_err_ird_sq
+    if cost_type == 3:
+        return max_err_d_sq
+    return (err_I + err_R + err_D) / days
+
+
+sird_particle_cost_gpu = cuda.jit(device=True)(sird_particle_cost)
+sird_particle_cost_cpu = njit(fastmath=True, cache=True)(sird_particle_cost)
 
 
 @cuda.jit
-def sird_euler_gpu(  # noqa: PLR0912
+def sird_euler_gpu(
     beta1_array,
     beta2_array,
     t1_array,
@@ -31,111 +140,335 @@ def sird_euler_gpu(  # noqa: PLR0912
     r_rng,
     d_min,
     d_rng,
+    integrator,
 ):
     pid = cuda.grid(1)
     if pid < beta1_array.size:
-        beta1 = beta1_array[pid]
-        beta2 = beta2_array[pid]
-        t1 = t1_array[pid]
-        t2 = t2_array[pid]
-        gamma_ = gamma_array[pid]
-        mu_ = mu_array[pid]
-
-        # Stan początkowy
-        S = S0
-        I = I0
-        R = R0
-        D = D0
-
-        # Akumulatory błędów dla MSE:
-        err_I = 0.0
-        err_R = 0.0
-        err_D = 0.0
-
-        # Do obliczania max-square-error:
-        max_err_ird_sq = 0.0
-        max_err_d_sq = 0.0
-
-        # Symulacja day po day
-        for day_idx in range(days):
-            # -- Euler substeps (np. 2 subkroki = 1 dzień) --
-            for _ in range(substeps):
-                # Określenie beta(t)
-                if day_idx < t1:
-                    beta_t = beta1
-                elif day_idx < t2:
-                    frac = (day_idx - t1) / (t2 - t1 + 1e-8)
-                    beta_t = beta1 + frac * (beta2 - beta1)
-                else:
-                    beta_t = beta2
-
-                dS = -beta_t * (S * I / Npop)
-                dI = beta_t * (S * I / Npop) - (gamma_ + mu_) * I
-                dR = gamma_ * I
-                dD = mu_ * I
-
-                S_new = S + dS * dt
-                I_new = I + dI * dt
-                R_new = R + dR * dt
-                D_new = D + dD * dt
-
-                S_new = max(S_new, 0)
-                I_new = max(I_new, 0)
-                R_new = max(R_new, 0)
-                D_new = max(D_new, 0)
-
-                S_new = min(S_new, 1e15)
-                I_new = min(I_new, 1e15)
-                R_new = min(R_new, 1e15)
-                D_new = min(D_new, 1e15)
-
-                S, I, R, D = S_new, I_new, R_new, D_new
-
-            # -- błąd dobowy --
-            if use_norm == 1:
-                # Normalizacja
-                di = 0.0
-                dr = 0.0
-                dd = 0.0
-                if i_rng > 1e-12:
-                    di = (I - i_min) / i_rng - I_emp[day_idx]
-                if r_rng > 1e-12:
-                    dr = (R - r_min) / r_rng - R_emp[day_idx]
-                if d_rng > 1e-12:
-                    dd = (D - d_min) / d_rng - D_emp[day_idx]
-            else:
-                di = I - I_emp[day_idx]
-                dr = R - R_emp[day_idx]
-                dd = D - D_emp[day_idx]
-
-            if cost_type == 10:
-                # sum MSE
-                err_I += di * di
-                err_R += dr * dr
-                err_D += dd * dd
-
-            elif cost_type == 20:
-                # max squared error (dla IRD)
-                sum_sq = di * di + dr * dr + dd * dd
-                max_err_ird_sq = max(sum_sq, max_err_ird_sq)
-
-            elif cost_type == 3:
-                # max( (D-D_emp)^2 )
-                sq = dd * dd
-                max_err_d_sq = max(sq, max_err_d_sq)
-
-            elif cost_type == 30:
-                sum_sq = di * di + dr * dr + dd * dd
-                max_err_ird_sq = max(sum_sq, max_err_ird_sq)
-
-        # -- Po pętli day_idx --
-        if cost_type == 10:
-            cost_array[pid] = (err_I + err_R + err_D) / days
-        elif cost_type == 20:
-            cost_array[pid] = max_err_ird_sq
-        elif cost_type == 3:
-            cost_array[pid] = max_err_d_sq
-        elif cost_type == 30:
-            cost_array[pid] = max_err_ird_sq
-        else:
-            cost_array[pid] = (err_I + err_R + err_D) / days
+        cost_array[pid] = sird_particle_cost_gpu(
+            beta1_array[pid],
+            beta2_array[pid],
+            t1_array[pid],
+            t2_array[pid],
+            gamma_array[pid],
+            mu_array[pid],
+            S0,
+            I0,
+            R0,
+            D0,
+            0,
+            dt,
+            substeps,
+            Npop,
+            days,
+            I_emp,
+            R_emp,
+            D_emp,
+            cost_type,
+            use_norm,
+            i_min,
+            i_rng,
+            r_min,
+            r_rng,
+            d_min,
+            d_rng,
+            integrator,
+        )
+
+
+@cuda.jit
+def sird_euler_windows_gpu(
+    beta1_array,
+    beta2_array,
+    t1_array,
+    t2_array,
+    gamma_array,
+    mu_array,
+    offset_array,
+    S0_array,
+    I0_array,
+    R0_array,
+    D0_array,
+    cost_array,
+    dt,
+    substeps,
+    Npop,
+    days,
+    I_full,
+    R_full,
+    D_full,
+    cost_type,
+    use_norm,
+    i_min,
+    i_rng,
+    r_min,
+    r_rng,
+    d_min,
+    d_rng,
+    integrator,
+):
+    """
+    Like sird_euler_gpu, but every particle carries its own window: the offset
+    into the full I/R/D series and the initial conditions of that window.
+    """
+    pid = cuda.grid(1)
+    if pid < beta1_array.size:
+        cost_array[pid] = sird_particle_cost_gpu(
+            beta1_array[pid],
+            beta2_array[pid],
+            t1_array[pid],
+            t2_array[pid],
+            gamma_array[pid],
+            mu_array[pid],
+            S0_array[pid],
+            I0_array[pid],
+            R0_array[pid],
+            D0_array[pid],
+            offset_array[pid],
+            dt,
+            substeps,
+            Npop,
+            days,
+            I_full,
+            R_full,
+            D_full,
+            cost_type,
+            use_norm,
+            i_min,
+            i_rng,
+            r_min,
+            r_rng,
+            d_min,
+            d_rng,
+            integrator,
+        )
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def sird_euler_cpu_parallel(
+    beta1_array,
+    beta2_array,
+    t1_array,
+    t2_array,
+    gamma_array,
+    mu_array,
+    cost_array,
+    dt,
+    substeps,
+    Npop,
+    days,
+    I_emp,
+    R_emp,
+    D_emp,
+    cost_type,
+    S0,
+    I0,
+    R0,
+    D0,
+    use_norm,
+    i_min,
+    i_rng,
+    r_min,
+    r_rng,
+    d_min,
+    d_rng,
+    integrator,
+):
+    """The same per-particle loop as sird_euler_gpu, spread over CPU cores with prange."""
+    for pid in prange(beta1_array.size):
+        cost_array[pid] = sird_particle_cost_cpu(
+            beta1_array[pid],
+            beta2_array[pid],
+            t1_array[pid],
+            t2_array[pid],
+            gamma_array[pid],
+            mu_array[pid],
+            S0,
+            I0,
+            R0,
+            D0,
+            0,
+            dt,
+            substeps,
+            Npop,
+            days,
+            I_emp,
+            R_emp,
+            D_emp,
+            cost_type,
+            use_norm,
+            i_min,
+            i_rng,
+            r_min,
+            r_rng,
+            d_min,
+            d_rng,
+            integrator,
+        )
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def sird_euler_windows_cpu_parallel(
+    beta1_array,
+    beta2_array,
+    t1_array,
+    t2_array,
+    gamma_array,
+    mu_array,
+    offset_array,
+    S0_array,
+    I0_array,
+    R0_array,
+    D0_array,
+    cost_array,
+    dt,
+    substeps,
+    Npop,
+    days,
+    I_full,
+    R_full,
+    D_full,
+    cost_type,
+    use_norm,
+    i_min,
+    i_rng,
+    r_min,
+    r_rng,
+    d_min,
+    d_rng,
+    integrator,
+):
+    """CPU (prange) version of sird_euler_windows_gpu."""
+    for pid in prange(beta1_array.size):
+        cost_array[pid] = sird_particle_cost_cpu(
+            beta1_array[pid],
+            beta2_array[pid],
+            t1_array[pid],
+            t2_array[pid],
+            gamma_array[pid],
+            mu_array[pid],
+            S0_array[pid],
+            I0_array[pid],
+            R0_array[pid],
+            D0_array[pid],
+            offset_array[pid],
+            dt,
+            substeps,
+            Npop,
+            days,
+            I_full,
+            R_full,
+            D_full,
+            cost_type,
+            use_norm,
+            i_min,
+            i_rng,
+            r_min,
+            r_rng,
+            d_min,
+            d_rng,
+            integrator,
+        )
+
+
+@cuda.jit
+def pso_pbest_reduce_gpu(
+    pos, cost_array, pbest, pbest_cost, block_min_cost, block_min_idx
+):
+    """
+    Device-resident PSO, step 1: update pbest of every particle and find the
+    minimal cost (and its particle index) within every block.
+    pos/pbest have shape (n_params, n_particles).
+    """
+    s_cost = cuda.shared.array(PSO_THREADS, float32)
+    s_idx = cuda.shared.array(PSO_THREADS, int32)
+
+    pid = cuda.grid(1)
+    tid = cuda.threadIdx.x
+    n_particles = cost_array.size
+
+    c = float32(3.0e38)
+    if pid < n_particles:
+        c = cost_array[pid]
+        if c < pbest_cost[pid]:
+            pbest_cost[pid] = c
+            for k in range(pos.shape[0]):
+                pbest[k, pid] = pos[k, pid]
+    s_cost[tid] = c
+    s_idx[tid] = pid
+    cuda.syncthreads()
+
+    # Redukcja drzewiasta (argmin w bloku)
+    stride = PSO_THREADS // 2
+    while stride > 0:
+        if tid < stride:
+            other = tid + stride
+            if s_cost[other] < s_cost[tid] or (
+                s_cost[other] == s_cost[tid] and s_idx[other] < s_idx[tid]
+            ):
+                s_cost[tid] = s_cost[other]
+                s_idx[tid] = s_idx[other]
+        cuda.syncthreads()
+        stride //= 2
+
+    if tid == 0:
+        block_min_cost[cuda.blockIdx.x] = s_cost[0]
+        block_min_idx[cuda.blockIdx.x] = s_idx[0]
+
+
+@cuda.jit
+def pso_gbest_gpu(pos, block_min_cost, block_min_idx, gbest, gbest_cost):
+    """
+    Device-resident PSO, step 2 (one block): reduce the per-block minima and
+    update gbest (position and cost) if the swarm found a better point.
+    """
+    s_cost = cuda.shared.array(PSO_THREADS, float32)
+    s_idx = cuda.shared.array(PSO_THREADS, int32)
+
+    tid = cuda.threadIdx.x
+    c = float32(3.0e38)
+    idx = int32(0)
+    for b in range(tid, block_min_cost.size, PSO_THREADS):
+        if block_min_cost[b] < c:
+            c = block_min_cost[b]
+            idx = block_min_idx[b]
+    s_cost[tid] = c
+    s_idx[tid] = idx
+    cuda.syncthreads()
+
+    stride = PSO_THREADS // 2
+    while stride > 0:
+        if tid < stride:
+            other = tid + stride
+            if s_cost[other] < s_cost[tid] or (
+                s_cost[other] == s_cost[tid] and s_idx[other] < s_idx[tid]
+            ):
+                s_cost[tid] = s_cost[other]
+                s_idx[tid] = s_idx[other]
+        cuda.syncthreads()
+        stride //= 2
+
+    if tid == 0 and s_cost[0] < gbest_cost[0]:
+        gbest_cost[0] = s_cost[0]
+        for k in range(pos.shape[0]):
+            gbest[k] = pos[k, s_idx[0]]
+
+
+@cuda.jit
+def pso_move_gpu(pos, vel, pbest, gbest, rng_states, w, c1, c2, lower, upper):
+    """
+    Device-resident PSO, step 3: fused velocity update, position update and
+    clip to [lower, upper], with random numbers drawn on the device.
+    """
+    pid = cuda.grid(1)
+    if pid < pos.shape[1]:
+        for k in range(pos.shape[0]):
+            r1 = xoroshiro128p_uniform_float32(rng_states, pid)
+            r2 = xoroshiro128p_uniform_float32(rng_states, pid)
+            x = pos[k, pid]
+            v = (
+                w * vel[k, pid]
+                + c1 * r1 * (pbest[k, pid] - x)
+                + c2 * r2 * (gbest[k] - x)
+            )
+            vel[k, pid] = v
+            pos[k, pid] = min(max(x + v, lower[k]), upper[k])
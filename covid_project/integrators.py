@@ -0,0 +1,301 @@
+"""Time integrators of the SIRD model: Euler, RK2 (midpoint), RK4 and adaptive RK45.
+
+Every scheme advances (S, I, R, D) by one day (`substeps` steps of `dt`) with beta(t)
+constant within the day, and clips the state to [0, 1e15] after every step.
+- sird_advance: scalar version, plain Python registered with register_jitable, so it
+  is compiled into both the CUDA and the Numba CPU kernels (gpu_kernels.py);
+- sird_advance_numpy: the same schemes on (N,) arrays (cpu_kernels.py, sird_simulation.py).
+"""
+
+import math
+
+import numpy as np
+from numba.extending import register_jitable
+
+from covid_project.constants import RK45_RTOL, RK45_ATOL
+
+# Integrator name -> code passed to the kernels
+INTEGRATORS = {"euler": 0, "rk2": 1, "rk4": 2, "rk45": 3}
+
+
+def integrator_code(integrator):
+    """Kernel code of the integrator name ("euler", "rk2", "rk4" or "rk45")."""
+    if integrator not in INTEGRATORS:
+        raise ValueError(f"Unknown integrator: {integrator!r}")
+    return INTEGRATORS[integrator]
+
+
+# Dormand-Prince 5(4) coefficients
+_A21 = 1 / 5
+_A31, _A32 = 3 / 40, 9 / 40
+_A41, _A42, _A43 = 44 / 45, -56 / 15, 32 / 9
+_A51, _A52, _A53, _A54 = 19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729
+_A61, _A62, _A63, _A64, _A65 = (
+    9017 / 3168,
+    -355 / 33,
+    46732 / 5247,
+    49 / 176,
+    -5103 / 18656,
+)
+_B1, _B3, _B4, _B5, _B6 = 35 / 384, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84
+# 5th order minus the embedded 4th order solution
+_E1, _E3, _E4, _E5, _E6, _E7 = (
+    71 / 57600,
+    -71 / 16695,
+    71 / 1920,
+    -17253 / 339200,
+    22 / 525,
+    -1 / 40,
+)
+
+
+@register_jitable
+def sird_rhs(S, I, beta_t, gamma_, mu_, Npop):
+    """dS, dI, dR, dD of the SIRD model (scalars or arrays)."""
+    new_inf = beta_t * (S * I / Npop)
+    return -new_inf, new_inf - (gamma_ + mu_) * I, gamma_ * I, mu_ * I
+
+
+@register_jitable
+def _clamp(x):
+    return min(max(x, 0.0), 1e15)
+
+
+@register_jitable
+def _rk45_error(y0, y1, e):
+    """Error of one compartment scaled by the RK45 tolerances."""
+    return abs(e) / (RK45_ATOL + RK45_RTOL * max(abs(y0), abs(y1)))
+
+
+@register_jitable
+def _rk45_day(S, I, R, D, beta_t, gamma_, mu_, Npop, dt, substeps):
+    """
+    Adaptive Dormand-Prince 5(4): the day (dt * substeps) is covered with as few steps
+    as RK45_RTOL/RK45_ATOL allow, starting from a step of dt.
+    """
+    day = dt * substeps
+    t = 0.0
+    h = dt
+    while t < day:
+        h = min(h, day - t)
+        dS1, dI1, dR1, dD1 = sird_rhs(S, I, beta_t, gamma_, mu_, Npop)
+        dS2, dI2, dR2, dD2 = sird_rhs(
+            S + h * _A21 * dS1, I + h * _A21 * dI1, beta_t, gamma_, mu_, Npop
+        )
+        dS3, dI3, dR3, dD3 = sird_rhs(
+            S + h * (_A31 * dS1 + _A32 * dS2),
+            I + h * (_A31 * dI1 + _A32 * dI2),
+            beta_t,
+            gamma_,
+            mu_,
+            Npop,
+        )
+        dS4, dI4, dR4, dD4 = sird_rhs(
+            S + h * (_A41 * dS1 + _A42 * dS2 + _A43 * dS3),
+            I + h * (_A41 * dI1 + _A42 * dI2 + _A43 * dI3),
+            beta_t,
+            gamma_,
+            mu_,
+            Npop,
+        )
+        dS5, dI5, dR5, dD5 = sird_rhs(
+            S + h * (_A51 * dS1 + _A52 * dS2 + _A53 * dS3 + _A54 * dS4),
+            I + h * (_A51 * dI1 + _A52 * dI2 + _A53 * dI3 + _A54 * dI4),
+            beta_t,
+            gamma_,
+            mu_,
+            Npop,
+        )
+        dS6, dI6, dR6, dD6 = sird_rhs(
+            S + h * (_A61 * dS1 + _A62 * dS2 + _A63 * dS3 + _A64 * dS4 + _A65 * dS5),
+            I + h * (_A61 * dI1 + _A62 * dI2 + _A63 * dI3 + _A64 * dI4 + _A65 * dI5),
+            beta_t,
+            gamma_,
+            mu_,
+            Npop,
+        )
+        S5 = S + h * (_B1 * dS1 + _B3 * dS3 + _B4 * dS4 + _B5 * dS5 + _B6 * dS6)
+        I5 = I + h * (_B1 * dI1 + _B3 * dI3 + _B4 * dI4 + _B5 * dI5 + _B6 * dI6)
+        R5 = R + h * (_B1 * dR1 + _B3 * dR3 + _B4 * dR4 + _B5 * dR5 + _B6 * dR6)
+        D5 = D + h * (_B1 * dD1 + _B3 * dD3 + _B4 * dD4 + _B5 * dD5 + _B6 * dD6)
+        dS7, dI7, dR7, dD7 = sird_rhs(S5, I5, beta_t, gamma_, mu_, Npop)
+
+        # Błąd lokalny (norma max po przedziałach)
+        err = _rk45_error(
+            S,
+            S5,
+            h * (_E1 * dS1 + _E3 * dS3 + _E4 * dS4 + _E5 * dS5 + _E6 * dS6 + _E7 * dS7),
+        )
+        err = max(
+            err,
+            _rk45_error(
+                I,
+                I5,
+                h
+                * (_E1 * dI1 + _E3 * dI3 + _E4 * dI4 + _E5 * dI5 + _E6 * dI6 + _E7 * dI7),
+            ),
+        )
+        err = max(
+            err,
+            _rk45_error(
+                R,
+                R5,
+                h
+                * (_E1 * dR1 + _E3 * dR3 + _E4 * dR4 + _E5 * dR5 + _E6 * dR6 + _E7 * dR7),
+            ),
+        )
+        err = max(
+            err,
+            _rk45_error(
+                D,
+                D5,
+                h
+                * (_E1 * dD1 + _E3 * dD3 + _E4 * dD4 + _E5 * dD5 + _E6 * dD6 + _E7 * dD7),
+            ),
+        )
+
+        if err <= 1.0 or h <= 1e-6 * day:
+            t += h
+            S = _clamp(S5)
+            I = _clamp(I5)
+            R = _clamp(R5)
+            D = _clamp(D5)
+
+        # Nowy krok
+        if err == 0.0:
+            h *= 5.0
+        else:
+            h *= min(5.0, max(0.2, 0.9 * math.pow(err, -0.2)))
+    return S, I, R, D
+
+
+@register_jitable
+def sird_advance(scheme, S, I, R, D, beta_t, gamma_, mu_, Npop, dt, substeps):
+    """
+    One day of the SIRD model for one particle with the integrator code `scheme`
+    (see INTEGRATORS). Returns the new (S, I, R, D).
+    """
+    if scheme == 3:
+        return _rk45_day(S, I, R, D, beta_t, gamma_, mu_, Npop, dt, substeps)
+
+    for _ in range(substeps):
+        dS1, dI1, dR1, dD1 = sird_rhs(S, I, beta_t, gamma_, mu_, Npop)
+        if scheme == 0:
+            # Euler
+            dS, dI, dR, dD = dS1, dI1, dR1, dD1
+        elif scheme == 1:
+            # RK2 (punkt środkowy)
+            dS, dI, dR, dD = sird_rhs(
+                S + dS1 * (dt / 2), I + dI1 * (dt / 2), beta_t, gamma_, mu_, Npop
+            )
+        else:
+            # RK4
+            dS2, dI2, dR2, dD2 = sird_rhs(
+                S + dS1 * (dt / 2), I + dI1 * (dt / 2), beta_t, gamma_, mu_, Npop
+            )
+            dS3, dI3, dR3, dD3 = sird_rhs(
+                S + dS2 * (dt / 2), I + dI2 * (dt / 2), beta_t, gamma_, mu_, Npop
+            )
+            dS4, dI4, dR4, dD4 = sird_rhs(
+                S + dS3 * dt, I + dI3 * dt, beta_t, gamma_, mu_, Npop
+            )
+            dS = (dS1 + 2.0 * dS2 + 2.0 * dS3 + dS4) / 6.0
+            dI = (dI1 + 2.0 * dI2 + 2.0 * dI3 + dI4) / 6.0
+            dR = (dR1 + 2.0 * dR2 + 2.0 * dR3 + dR4) / 6.0
+            dD = (dD1 + 2.0 * dD2 + 2.0 * dD3 + dD4) / 6.0
+
+        S = _clamp(S + dS * dt)
+        I = _clamp(I + dI * dt)
+        R = _clamp(R + dR * dt)
+        D = _clamp(D + dD * dt)
+    return S, I, R, D
+
+
+def _rk45_day_numpy(y, beta_t, gamma_, mu_, Npop, dt, substeps):
+    """_rk45_day on a (4, N) state; every column keeps its own step size."""
+    day = dt * substeps
+    n = y.shape[1]
+    t = np.zeros(n)
+    h = np.full(n, float(dt))
+
+    active = np.arange(n)
+    while active.size:
+        yi = y[:, active]
+        hi = np.minimum(h[active], day - t[active])
+        b, g, m = beta_t[active], gamma_[active], mu_[active]
+
+        def f(state):
+            return np.array(sird_rhs(state[0], state[1], b, g, m, Npop))
+
+        k1 = f(yi)
+        k2 = f(yi + hi * (_A21 * k1))
+        k3 = f(yi + hi * (_A31 * k1 + _A32 * k2))
+        k4 = f(yi + hi * (_A41 * k1 + _A42 * k2 + _A43 * k3))
+        k5 = f(yi + hi * (_A51 * k1 + _A52 * k2 + _A53 * k3 + _A54 * k4))
+        k6 = f(yi + hi * (_A61 * k1 + _A62 * k2 + _A63 * k3 + _A64 * k4 + _A65 * k5))
+        y5 = yi + hi * (_B1 * k1 + _B3 * k3 + _B4 * k4 + _B5 * k5 + _B6 * k6)
+        k7 = f(y5)
+
+        e = hi * (_E1 * k1 + _E3 * k3 + _E4 * k4 + _E5 * k5 + _E6 * k6 + _E7 * k7)
+        scale = RK45_ATOL + RK45_RTOL * np.maximum(np.abs(yi), np.abs(y5))
+        err = np.max(np.abs(e) / scale, axis=0)
+
+        accept = (err <= 1.0) | (hi <= 1e-6 * day)
+        done = active[accept]
+        t[done] += hi[accept]
+        y[:, done] = np.clip(y5[:, accept], 0, 1e15)
+
+        with np.errstate(divide="ignore"):
+            h[active] = hi * np.where(
+                err == 0.0, 5.0, np.clip(0.9 * err**-0.2, 0.2, 5.0)
+            )
+        active = active[t[active] < day]
+    return y
+
+
+def sird_advance_numpy(integrator, S, I, R, D, beta_t, gamma_, mu_, Npop, dt, substeps):
+    """sird_advance for (N,) arrays and the integrator name; returns new arrays."""
+    scheme = integrator_code(integrator)
+    if scheme == 3:
+        n = np.broadcast(S, I, R, D, beta_t).size
+        y = np.stack([np.broadcast_to(x, n) for x in (S, I, R, D)]).astype(np.float64)
+        return tuple(
+            _rk45_day_numpy(
+                y,
+                np.broadcast_to(beta_t, n),
+                np.broadcast_to(gamma_, n),
+                np.broadcast_to(mu_, n),
+                Npop,
+                dt,
+                substeps,
+            )
+        )
+
+    for _ in range(substeps):
+        dS1, dI1, dR1, dD1 = sird_rhs(S, I, beta_t, gamma_, mu_, Npop)
+        if scheme == 0:
+            dS, dI, dR, dD = dS1, dI1, dR1, dD1
+        elif scheme == 1:
+            dS, dI, dR, dD = sird_rhs(
+                S + dS1 * (dt / 2), I + dI1 * (dt / 2), beta_t, gamma_, mu_, Npop
+            )
+        else:
+            dS2, dI2, dR2, dD2 = sird_rhs(
+                S + dS1 * (dt / 2), I + dI1 * (dt / 2), beta_t, gamma_, mu_, Npop
+            )
+            dS3, dI3, dR3, dD3 = sird_rhs(
+                S + dS2 * (dt / 2), I + dI2 * (dt / 2), beta_t, gamma_, mu_, Npop
+            )
+            dS4, dI4, dR4, dD4 = sird_rhs(
+                S + dS3 * dt, I + dI3 * dt, beta_t, gamma_, mu_, Npop
+            )
+            dS = (dS1 + 2.0 * dS2 + 2.0 * dS3 + dS4) / 6.0
+            dI = (dI1 + 2.0 * dI2 + 2.0 * dI3 + dI4) / 6.0
+            dR = (dR1 + 2.0 * dR2 + 2.0 * dR3 + dR4) / 6.0
+            dD = (dD1 + 2.0 * dD2 + 2.0 * dD3 + dD4) / 6.0
+
+        S = np.clip(S + dS * dt, 0, 1e15)
+        I = np.clip(I + dI * dt, 0, 1e15)
+        R = np.clip(R + dR * dt, 0, 1e15)
+        D = np.clip(D + dD * dt, 0, 1e15)
+    return S, I, R, D
@@ -1,132 +1,264 @@
 #!/usr/bin/env python3
+import argparse
+import os
+
 import pandas as pd
-import matplotlib.pyplot as plt
 
-from .data_loader import load_covid_data
+from .batch import FIGURE_FILES, load_config
+from .data_loader import load_country
+from .envelope import WindowEnvelope
+from .fit_cache import FitCache
+from .manifest import ResultsManifest
 from .window_fitting import multiple_runs_fit_sird, window_wise_fitting
-from .plotting import (
-    plot_all_trajectories_SIRD,
-    plot_compartments_fits,
-    plot_params_wresults,
+from .plotting import plot_compartments_fits, plot_params_wresults
+from .render import InlineRenderer, RenderPipeline, save_trajectories
+from covid_project.constants import (
+    CHECKPOINT_DIR,
+    COUNTRY_CONFIG,
+    NUM_PARTICLES,
+    MAX_ITER,
+    RESULTS_DIR,
 )
-from covid_project.constants import NUM_PARTICLES, MAX_ITER
 
 
-def main():
+def main(resume=False, country="Poland", pipelined=False, config_path=COUNTRY_CONFIG):
+    """
+    Fits and plots one country with its row of the config table (config_path):
+    population, dates, label, results directory and fit settings.
+    resume=True (--resume): continue the jobs of an interrupted run of this country
+    from CHECKPOINT_DIR/<country>/.
+    pipelined=True (--pipelined): headless; the figures are drawn by a background
+    rendering process (render.RenderPipeline) while the next fit already runs.
+    The figures are saved in results/<results_dir>/ and listed in the results manifest
+    (manifest.py) that the viewer builds its layout from.
+    """
+    config = load_config(config_path)
+    if country not in config:
+        raise ValueError(f"{country}: no row in {config_path}")
+    settings = config[country]
+    population = settings["population"]
+    num_runs = settings["num_runs"]
+    cost_type = settings["cost_type"]
+
     # 1) Load the data
-    csv_path = "data/covid-19-preprocessed.csv"
-    df = load_covid_data(csv_path)
-    print("[INFO] Data loaded. Rows =", len(df))
+    series = load_country(country)
+    df = series.to_frame()
+    print("[INFO] Data loaded. Rows =", len(series))
+
+    # Seeded fits are reused from the on-disk cache when nothing has changed
+    cache = FitCache()
+    checkpoint_dir = os.path.join(CHECKPOINT_DIR, country)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    name = settings["results_dir"]
+    out_dir = os.path.join(RESULTS_DIR, name)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = ResultsManifest()
+    manifest.country(name, settings["label"])
+    renderer = RenderPipeline() if pipelined else InlineRenderer()
 
-    start_date_1 = pd.to_datetime("2020-05-10")
-    end_date_1 = pd.to_datetime("2020-06-13")
-    start_date_2 = pd.to_datetime("2021-04-04")
-    end_date_2 = pd.to_datetime("2021-05-08")
-    forecast_days = 21
+    start_date_1 = settings["start_1"]
+    end_date_1 = settings["end_1"]
+    start_date_2 = settings["start_2"]
+    end_date_2 = settings["end_2"]
+    forecast_days = settings["forecast_days"]
 
     all_traj_1 = multiple_runs_fit_sird(
-        df,
+        series,
         start_date_1,
         end_date_1,
-        num_runs=1000,
-        cost_type=30,
+        num_runs=num_runs,
+        cost_type=cost_type,
         use_norm=True,
         n_particles=NUM_PARTICLES,
         max_iter=MAX_ITER,
         forecast_days=forecast_days,
-        population=38e6,
-    )
-    fig1 = plot_all_trajectories_SIRD(
-        all_traj_1,
-        df,
-        start_date_1,
-        end_date_1,
-        forecast_days=forecast_days,
-        title=f"Okno1: {start_date_1.date()}..{end_date_1.date()} (cost=MXSE(IRD))",
+        population=population,
+        batched=True,
+        seed=0,
+        cache=cache,
+        checkpoint=os.path.join(checkpoint_dir, "runs_1.jsonl"),
+        resume=resume,
+        compact=True,
     )
-    if fig1 is not None:
-        plt.show(fig1)
-        fig1.savefig("1000repetitions_2020_05_10.pdf")
-        plt.close(fig1)
+    if len(all_traj_1):
+        renderer.submit(
+            save_trajectories,
+            os.path.join(out_dir, FIGURE_FILES["runs_1"]),
+            all_traj_1,
+            df,
+            start_date_1,
+            end_date_1,
+            forecast_days=forecast_days,
+            title=f"Okno1: {start_date_1.date()}..{end_date_1.date()}"
+            " (cost=MXSE(IRD))",
+            population=population,
+            mode="collection",
+        )
+        manifest.add_figure(
+            name,
+            "runs_1",
+            FIGURE_FILES["runs_1"],
+            start_date_1,
+            end_date_1,
+            num_runs=num_runs,
+            forecast_days=forecast_days,
+        )
 
     all_traj_2 = multiple_runs_fit_sird(
-        df,
+        series,
         start_date_2,
         end_date_2,
-        num_runs=1000,
-        cost_type=30,
+        num_runs=num_runs,
+        cost_type=cost_type,
         use_norm=True,
         n_particles=NUM_PARTICLES,
         max_iter=MAX_ITER,
         forecast_days=forecast_days,
-        population=38e6,
+        population=population,
+        batched=True,
+        seed=0,
+        cache=cache,
+        checkpoint=os.path.join(checkpoint_dir, "runs_2.jsonl"),
+        resume=resume,
+        compact=True,
     )
-    fig2 = plot_all_trajectories_SIRD(
-        all_traj_2,
-        df,
-        start_date_2,
-        end_date_2,
-        forecast_days=forecast_days,
-        title=f"Window2: {start_date_2.date()}..{end_date_2.date()} (cost=MXSE(IRD))",
-    )
-    if fig2 is not None:
-        plt.show(fig2)
-        fig2.savefig("1000_repetitions_2021_.pdf")
-        plt.close(fig2)
+    if len(all_traj_2):
+        renderer.submit(
+            save_trajectories,
+            os.path.join(out_dir, FIGURE_FILES["runs_2"]),
+            all_traj_2,
+            df,
+            start_date_2,
+            end_date_2,
+            forecast_days=forecast_days,
+            title=f"Window2: {start_date_2.date()}..{end_date_2.date()}"
+            " (cost=MXSE(IRD))",
+            population=population,
+            mode="collection",
+        )
+        manifest.add_figure(
+            name,
+            "runs_2",
+            FIGURE_FILES["runs_2"],
+            start_date_2,
+            end_date_2,
+            num_runs=num_runs,
+            forecast_days=forecast_days,
+        )
 
     # 3) Przykład: Okienkowe dopasowanie (window_wise_fitting)
-    df_before = df[df["Last_Update"] <= "2020-10-20"].copy()
-    wresults_before = window_wise_fitting(
-        df=df_before,
-        population=38e6,
-        window_size=36,
-        step=7,
-        cost_type=30,
+    split = settings["split_date"]
+    suffix_before = f"(do {split:%d.%m.%Y})"
+    suffix_after = f"(od {split + pd.Timedelta(days=1):%d.%m.%Y})"
+    cut = series.span(end=split).stop
+    series_before, series_after = series[:cut], series[cut:]
+    df_before = series_before.to_frame()
+    dates_before = df_before["Last_Update"].min(), df_before["Last_Update"].max()
+    # Envelopes filled window by window while fitting
+    env_before = WindowEnvelope(len(df_before))
+    window_wise_fitting(
+        df=series_before,
+        population=population,
+        window_size=settings["window_size"],
+        step=settings["step"],
+        cost_type=cost_type,
         n_particles=NUM_PARTICLES,
         max_iter=MAX_ITER,
         use_norm=False,
+        seed=0,
+        cache=cache,
+        checkpoint=os.path.join(checkpoint_dir, "windows_before.jsonl"),
+        resume=resume,
+        compact=True,
+        envelope=env_before,
     )
-    plot_compartments_fits(
+    renderer.submit(
+        plot_compartments_fits,
         df_before,
-        wresults_before,
-        title_suffix="(do 20.10.2020)",
-        save_path="plot_fitting_20102020.pdf",
+        env_before,
+        title_suffix=suffix_before,
+        save_path=os.path.join(out_dir, FIGURE_FILES["envelope_before"]),
+    )
+    manifest.add_figure(
+        name,
+        "envelope_before",
+        FIGURE_FILES["envelope_before"],
+        *dates_before,
     )
 
-    df_after = df[df["Last_Update"] > "2020-10-20"].copy()
-    wresults_after = window_wise_fitting(
-        df=df_after,
-        population=38e6,
-        window_size=36,
-        step=7,
-        cost_type=30,
+    df_after = series_after.to_frame()
+    dates_after = df_after["Last_Update"].min(), df_after["Last_Update"].max()
+    # Envelopes filled window by window while fitting
+    env_after = WindowEnvelope(len(df_after))
+    window_wise_fitting(
+        df=series_after,
+        population=population,
+        window_size=settings["window_size"],
+        step=settings["step"],
+        cost_type=cost_type,
         n_particles=NUM_PARTICLES,
         max_iter=MAX_ITER,
         use_norm=False,
+        seed=0,
+        cache=cache,
+        checkpoint=os.path.join(checkpoint_dir, "windows_after.jsonl"),
+        resume=resume,
+        compact=True,
+        envelope=env_after,
     )
-    plot_compartments_fits(
+    renderer.submit(
+        plot_compartments_fits,
         df_after,
-        wresults_after,
-        title_suffix="(od 21.10.2020)",
-        save_path="plot_after_20102020.pdf",
+        env_after,
+        title_suffix=suffix_after,
+        save_path=os.path.join(out_dir, FIGURE_FILES["envelope_after"]),
         ds=1,
     )
+    manifest.add_figure(
+        name,
+        "envelope_after",
+        FIGURE_FILES["envelope_after"],
+        *dates_after,
+    )
 
-    plot_params_wresults(
+    renderer.submit(
+        plot_params_wresults,
         df_before,
-        wresults_before,
-        title_suffix="(do 20.10.2020)",
-        save_path="params1_20102020.pdf",
+        env_before,
+        title_suffix=suffix_before,
+        save_path=os.path.join(out_dir, FIGURE_FILES["params_before"]),
     )
-    plot_params_wresults(
+    manifest.add_figure(
+        name, "params_before", FIGURE_FILES["params_before"], *dates_before
+    )
+    renderer.submit(
+        plot_params_wresults,
         df_after,
-        wresults_after,
-        title_suffix="(od 21.10.2020)",
-        save_path="params_2_after_20102020.pdf",
+        env_after,
+        title_suffix=suffix_after,
+        save_path=os.path.join(out_dir, FIGURE_FILES["params_after"]),
+    )
+    manifest.add_figure(
+        name,
+        "params_after",
+        FIGURE_FILES["params_after"],
+        *dates_after,
     )
 
+    # The manifest lists the figures once they are all written
+    renderer.close()
+    manifest.save()
+    print(f"[INFO] Results manifest updated: {manifest.path}")
+    print(f"[INFO] Fit cache: {cache.hits} hits, {cache.misses} misses")
     print("\n[DONE] Skrypt zakończył działanie.")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(prog="python -m covid_project.main")
+    parser.add_argument("--country", default="Poland", help="a row of --config")
+    parser.add_argument("--config", default=COUNTRY_CONFIG)
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--pipelined", action="store_true")
+    args = parser.parse_args()
+    main(args.resume, args.country, args.pipelined, args.config)
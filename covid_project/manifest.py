@@ -0,0 +1,97 @@
+"""
+Manifest of the result figures (results/manifest.json), written by the pipeline and
+read by the results viewer (cov_fin.py) to build its layout.
+
+    {"version": 1,
+     "countries": {"Poland": {"label": "Polska",
+                              "figures": [{"kind": "params_before",
+                                           "file": "params1_20102020.pdf",
+                                           "title": "...",
+                                           "start": "2020-03-18", "end": "2020-10-20"},
+                                          ...]},
+                   ...}}
+
+Countries are keyed by their directory in results/; a figure's file is relative to
+it. A figure is identified by its kind, so re-running the pipeline replaces the
+entry (even under a new file name) and keeps the order of the sections.
+"""
+
+import json
+import os
+import tempfile
+
+from covid_project.constants import RESULTS_DIR
+
+MANIFEST_VERSION = 1
+MANIFEST_PATH = os.path.join(RESULTS_DIR, "manifest.json")
+
+# Section titles shown by the viewer, per figure kind
+FIGURE_TITLES = {
+    "daily": "Dzienny rozkład nowych przypadków/zgonów/zmiany w liczbie aktywnych",
+    "params_before": "Rozkład parametrów w okresie {start} do {end}",
+    "params_after": "Rozkład parametrów w okresie {start} do {end}",
+    "envelope_before": "Obwiednia minmax w okresie {start} do {end}",
+    "envelope_after": "Obwiednia minmax w okresie {start} do {end}",
+    "runs_1": "Wynik {num_runs} dopasowan w okresie {start} do {end}"
+    " + {forecast_days}-dniowe przewidywanie",
+    "runs_2": "Wynik {num_runs} dopasowan w okresie {start} do {end}"
+    " + {forecast_days}-dniowe przewidywanie",
+}
+
+
+class ResultsManifest:
+    """The manifest at path (loaded if it exists); save() writes it back atomically."""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+            if self.data.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"{path}: unsupported manifest version")
+        else:
+            self.data = {"version": MANIFEST_VERSION, "countries": {}}
+
+    @property
+    def countries(self):
+        return self.data["countries"]
+
+    def country(self, name, label=None):
+        """Entry of a country (created if missing); label is the name shown."""
+        entry = self.countries.setdefault(name, {"label": label or name, "figures": []})
+        if label is not None:
+            entry["label"] = label
+        return entry
+
+    def add_figure(self, country, kind, file, start=None, end=None, title=None, **info):
+        """
+        Adds or replaces the figure `kind` of a country. start/end: its date range
+        (stored as YYYY-MM-DD); title defaults to FIGURE_TITLES[kind] filled with the
+        dates and info (e.g. num_runs, forecast_days), which are stored too.
+        """
+        figure = {"kind": kind, "file": file}
+        if start is not None:
+            figure["start"] = str(start)[:10]
+        if end is not None:
+            figure["end"] = str(end)[:10]
+        figure.update(info)
+        figure["title"] = title or FIGURE_TITLES[kind].format(**figure)
+        figures = self.country(country)["figures"]
+        for i, other in enumerate(figures):
+            if other["kind"] == kind:
+                figures[i] = figure
+                break
+        else:
+            figures.append(figure)
+
+    def figure_path(self, country, figure):
+        """Path of a figure file, relative to the working directory."""
+        return os.path.join(os.path.dirname(self.path), country, figure["file"])
+
+    def save(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,539 @@
+"""
+Alternative optimizers of the SIRD fit: differential evolution and CMA-ES (and the
+PSO loop, for comparison), behind one interface:
+
+    result = fit(objective, bounds, budget, method="cmaes", seed=0)
+
+objective(pos) -> costs evaluates a float32 (n_params, n) matrix of candidates in one
+call, e.g. the batched cost evaluator of the PSO (pso_fitting.make_cost_evaluator,
+on any backend); bounds: {name: (lo, hi)} (e.g. PARAM_BOUNDS) or one (lo, hi) per row;
+budget: the number of candidate evaluations allowed. Each generation is one
+objective call. The FitResult holds the best point and cost and the best-so-far
+cost after each generation against the evaluations spent.
+
+run_sird_fit is the counterpart of run_pso_sird_gpu (same data arguments, returns
+(gbest_params, history)); the command line compares the engines on one window,
+the cost reached against the evaluations spent:
+
+    python -m covid_project.optimizers compare --backend numba --budget 100000
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from .data_loader import country_csv, load_country
+from .pso_fitting import cache_key, make_cost_evaluator, pso_loop, store_fit
+from .window_fitting import window_data
+from covid_project.constants import (
+    BACKEND,
+    C1,
+    C2,
+    DT,
+    INTEGRATOR,
+    MAX_ITER,
+    NUM_PARTICLES,
+    PARAM_BOUNDS,
+    SUBSTEPS,
+    W,
+)
+
+DE_POP_SIZE = 64  # candidates per differential evolution generation
+CMA_POP_SIZE = 16  # candidates per CMA-ES generation (doubled at every restart)
+MAX_BATCH = 4096  # candidates per objective call of run_sird_fit (evaluator size)
+
+
+class FitResult:
+    """
+    Best point x (n_params,) and its cost; evals[k] is the number of evaluations
+    spent after generation k and best[k] the best cost found until then.
+    """
+
+    def __init__(self, method, x, cost, evals, best):
+        self.method = method
+        self.x = np.asarray(x, dtype=np.float64)
+        self.cost = float(cost)
+        self.evals = np.asarray(evals, dtype=np.int64)
+        self.best = np.minimum.accumulate(np.asarray(best, dtype=np.float64))
+
+    @property
+    def n_evals(self):
+        return int(self.evals[-1]) if self.evals.size else 0
+
+    def cost_at(self, n_evals):
+        """Best cost after at most n_evals evaluations (inf before the first)."""
+        k = np.searchsorted(self.evals, n_evals, side="right")
+        return float(self.best[k - 1]) if k > 0 else np.inf
+
+    def evals_to_reach(self, target):
+        """Evaluations spent until the best cost was <= target (None if never)."""
+        k = np.flatnonzero(self.best <= target)
+        return int(self.evals[k[0]]) if k.size else None
+
+
+def _unit_objective(objective, lower, upper, max_batch=None):
+    """
+    Costs (float64, NaN -> inf) of candidates u (n_params, n) in the unit cube,
+    mapped to the bounds and evaluated at most max_batch at a time.
+    """
+    width = upper - lower
+
+    def evaluate(u):
+        pos = (lower[:, None] + u * width[:, None]).astype(np.float32)
+        step = max_batch or pos.shape[1]
+        costs = [
+            np.array(objective(np.ascontiguousarray(pos[:, i : i + step])))
+            for i in range(0, pos.shape[1], step)
+        ]
+        return np.nan_to_num(np.concatenate(costs).astype(np.float64), nan=np.inf)
+
+    return evaluate
+
+
+def differential_evolution(
+    objective,
+    lower,
+    upper,
+    budget,
+    rng,
+    pop_size=DE_POP_SIZE,
+    cr=0.9,
+    f_range=(0.5, 1.0),
+    p_best=0.1,
+    max_batch=None,
+):
+    """
+    DE/current-to-pbest/1/bin: each trial moves its parent towards a random one of
+    the p_best fraction of best candidates plus a scaled difference of two random
+    candidates (F drawn from f_range per trial), then binomial crossover with rate
+    cr. Out-of-bound coordinates are put back between the parent and the bound.
+    ValueError if the budget (or pop_size) leaves fewer than 2 candidates.
+    """
+    n = min(pop_size, budget)
+    if n < 2:
+        raise ValueError(f"DE needs at least 2 candidates (budget {budget})")
+    evaluate = _unit_objective(objective, lower, upper, max_batch)
+    d = lower.size
+    cols = np.arange(n)
+    pop = rng.random((d, n))
+    cost = evaluate(pop)
+    evals, best = [n], [cost.min()]
+    while evals[-1] + n <= budget:
+        top = np.argsort(cost)[: max(int(round(p_best * n)), 1)]
+        pbest = pop[:, rng.choice(top, n)]
+        r1 = (cols + rng.integers(1, n, n)) % n
+        r2 = (cols + rng.integers(1, n, n)) % n
+        f = rng.uniform(*f_range, n)
+        mutant = pop + f * (pbest - pop) + f * (pop[:, r1] - pop[:, r2])
+
+        cross = rng.random((d, n)) < cr
+        cross[rng.integers(0, d, n), cols] = True  # at least one coordinate
+        trial = np.where(cross, mutant, pop)
+        trial = np.where(trial < 0.0, pop * rng.random((d, n)), trial)
+        trial = np.where(trial > 1.0, pop + (1.0 - pop) * rng.random((d, n)), trial)
+
+        trial_cost = evaluate(trial)
+        better = trial_cost <= cost
+        pop[:, better] = trial[:, better]
+        cost[better] = trial_cost[better]
+        evals.append(evals[-1] + n)
+        best.append(cost.min())
+    k = np.argmin(cost)
+    return FitResult("de", pop[:, k], cost[k], evals, best)
+
+
+def cma_es(
+    objective,
+    lower,
+    upper,
+    budget,
+    rng,
+    pop_size=CMA_POP_SIZE,
+    sigma0=0.3,
+    tol_x=1e-7,
+    max_pop_size=1024,
+    max_batch=None,
+):
+    """
+    (mu/mu_w, lambda)-CMA-ES in the unit cube with IPOP restarts: when the step
+    size falls below tol_x (or the covariance degenerates) it restarts from a random
+    mean with twice the population (up to max_pop_size) while the budget lasts.
+    Candidates are evaluated clipped to the bounds; the ranking adds a penalty on
+    the squared distance to the bounds.
+    ValueError if the budget (or pop_size) leaves fewer than 2 candidates.
+    """
+    lam = min(pop_size, budget)
+    if lam < 2:
+        raise ValueError(f"CMA-ES needs at least 2 candidates (budget {budget})")
+    evaluate = _unit_objective(objective, lower, upper, max_batch)
+    d = lower.size
+    chi_n = np.sqrt(d) * (1.0 - 1.0 / (4.0 * d) + 1.0 / (21.0 * d**2))
+    best_x, best_cost = None, np.inf
+    evals, best = [], []
+    spent = 0
+
+    while spent + lam <= budget:
+        mu = lam // 2
+        weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+        weights /= weights.sum()
+        mueff = 1.0 / np.sum(weights**2)
+        cc = (4.0 + mueff / d) / (d + 4.0 + 2.0 * mueff / d)
+        cs = (mueff + 2.0) / (d + mueff + 5.0)
+        c1 = 2.0 / ((d + 1.3) ** 2 + mueff)
+        cmu = 2.0 * (mueff - 2.0 + 1.0 / mueff) / ((d + 2.0) ** 2 + mueff)
+        cmu = min(1.0 - c1, cmu)
+        damps = 1.0 + 2.0 * max(0.0, np.sqrt((mueff - 1.0) / (d + 1.0)) - 1.0) + cs
+
+        mean = rng.random(d)
+        sigma = sigma0
+        C = np.eye(d)
+        B, D = np.eye(d), np.ones(d)
+        p_c, p_s = np.zeros(d), np.zeros(d)
+        gen = 0
+        while spent + lam <= budget:
+            y = B @ (D[:, None] * rng.standard_normal((d, lam)))
+            x = mean[:, None] + sigma * y
+            x_in = np.clip(x, 0.0, 1.0)
+            cost = evaluate(x_in)
+            spent += lam
+            gen += 1
+            k = np.argmin(cost)
+            if cost[k] < best_cost:
+                best_x, best_cost = x_in[:, k].copy(), cost[k]
+            evals.append(spent)
+            best.append(best_cost)
+
+            finite = np.isfinite(cost)
+            scale = np.abs(np.median(cost[finite])) if finite.any() else 1.0
+            penalty = np.sum((x - x_in) ** 2, axis=0) * max(scale, 1e-12)
+            order = np.argsort(cost + penalty)[:mu]
+
+            y_w = y[:, order] @ weights
+            mean = mean + sigma * y_w
+            inv_sqrt_y = B @ ((B.T @ y_w) / D)
+            p_s = (1.0 - cs) * p_s + np.sqrt(cs * (2.0 - cs) * mueff) * inv_sqrt_y
+            norm_ps = np.linalg.norm(p_s)
+            h_sig = norm_ps / np.sqrt(1.0 - (1.0 - cs) ** (2 * gen)) / chi_n < (
+                1.4 + 2.0 / (d + 1.0)
+            )
+            p_c = (1.0 - cc) * p_c + h_sig * np.sqrt(cc * (2.0 - cc) * mueff) * y_w
+            y_sel = y[:, order]
+            C = (
+                (1.0 - c1 - cmu + (1.0 - h_sig) * c1 * cc * (2.0 - cc)) * C
+                + c1 * np.outer(p_c, p_c)
+                + cmu * (y_sel * weights) @ y_sel.T
+            )
+            sigma *= np.exp((cs / damps) * (norm_ps / chi_n - 1.0))
+
+            D2, B = np.linalg.eigh((C + C.T) / 2.0)
+            D = np.sqrt(np.maximum(D2, 1e-20))
+            if sigma * D.max() < tol_x or D.max() > 1e7 * D.min():
+                break
+        lam = min(2 * lam, max_pop_size)
+    return FitResult("cmaes", best_x, best_cost, evals, best)
+
+
+def particle_swarm(
+    objective, lower, upper, budget, rng, n_particles=NUM_PARTICLES, **pso_options
+):
+    """
+    The PSO loop of pso_fitting (max_iter = budget // n_particles iterations).
+    ValueError if the budget (or n_particles) leaves fewer than 2 candidates.
+    """
+    n_particles = min(n_particles, budget)
+    if n_particles < 2:
+        raise ValueError(f"PSO needs at least 2 candidates (budget {budget})")
+    gbest, (history,), _ = pso_loop(
+        lambda pos, run_ids=None: objective(pos),
+        lower.astype(np.float32),
+        upper.astype(np.float32),
+        1,
+        n_particles,
+        max(budget // n_particles, 1),
+        pso_options.pop("W", W),
+        pso_options.pop("C1", C1),
+        pso_options.pop("C2", C2),
+        rng,
+        **pso_options,
+    )
+    evals = n_particles * np.arange(1, len(history) + 1)
+    return FitResult("pso", gbest[0], history[-1], evals, history)
+
+
+ENGINES = {"pso": particle_swarm, "de": differential_evolution, "cmaes": cma_es}
+
+
+def _bounds_arrays(bounds):
+    """(lower, upper) float64 arrays of {name: (lo, hi)} or a sequence of (lo, hi)."""
+    pairs = list(bounds.values()) if isinstance(bounds, dict) else list(bounds)
+    lower, upper = np.array(pairs, dtype=np.float64).T
+    return lower, upper
+
+
+def fit(objective, bounds, budget, method="cmaes", seed=None, **options):
+    """
+    Minimizes objective (batched, see the module docstring) within bounds with at
+    most budget evaluations; method: "cmaes", "de" or "pso" (options: the keyword
+    arguments of cma_es, differential_evolution or particle_swarm). The unit-cube
+    engines map the candidates to the bounds. Returns a FitResult (x in bounds units).
+    """
+    if method not in ENGINES:
+        raise ValueError(f"Unknown method {method!r}")
+    lower, upper = _bounds_arrays(bounds)
+    rng = np.random.default_rng(seed)
+    result = ENGINES[method](objective, lower, upper, budget, rng, **options)
+    if method != "pso":
+        result.x = lower + result.x * (upper - lower)
+    return result
+
+
+def run_sird_fit(
+    days,
+    D_emp,
+    I_emp=None,
+    R_emp=None,
+    S0=0.0,
+    I0=0.0,
+    R0=0.0,
+    D0=0.0,
+    dt=DT,
+    substeps=SUBSTEPS,
+    Npop=38e6,
+    cost_type=10,
+    use_norm=False,
+    i_min=0.0,
+    i_rng=1.0,
+    r_min=0.0,
+    r_rng=1.0,
+    d_min=0.0,
+    d_rng=1.0,
+    method="cmaes",
+    budget=20_000,
+    bounds=None,
+    backend=BACKEND,
+    seed=None,
+    integrator=INTEGRATOR,
+    options=None,
+    return_info=False,
+    cache=None,
+):
+    """
+    Fits the SIRD parameters with `method` ("cmaes", "de" or "pso", see fit) and at
+    most `budget` cost evaluations, on the batched cost evaluator of run_pso_sird_gpu
+    (same data arguments and backends). bounds: {name: (lo, hi)} overriding
+    PARAM_BOUNDS; options: keyword arguments of the engine.
+    Returns (gbest_params, history) like run_pso_sird_gpu, history being the best
+    cost after each generation; return_info=True adds a dict with method, n_iter
+    and n_evals. Seeded calls are stored in / reused from `cache` (fit_cache.FitCache).
+    """
+    key = cache_key(cache, locals())
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return tuple(cached) if return_info else tuple(cached[:2])
+
+    if I_emp is None:
+        I_emp = np.zeros(days, dtype=np.float32)
+    if R_emp is None:
+        R_emp = np.zeros(days, dtype=np.float32)
+    table = {**PARAM_BOUNDS, **(bounds or {})}
+    options = dict(options or {})
+    batch = MAX_BATCH
+    if method == "pso":
+        batch = max(batch, min(options.get("n_particles", NUM_PARTICLES), budget))
+    evaluate = make_cost_evaluator(
+        backend,
+        days,
+        I_emp,
+        R_emp,
+        D_emp,
+        S0,
+        I0,
+        R0,
+        D0,
+        dt,
+        substeps,
+        Npop,
+        batch,
+        cost_type,
+        use_norm,
+        i_min,
+        i_rng,
+        r_min,
+        r_rng,
+        d_min,
+        d_rng,
+        integrator=integrator,
+    )
+    if method != "pso":
+        options["max_batch"] = batch
+    result = fit(evaluate, table, budget, method, seed, **options)
+    gbest_params = {name: float(v) for name, v in zip(PARAM_BOUNDS, result.x)}
+    info = {"method": method, "n_iter": len(result.best), "n_evals": result.n_evals}
+    return store_fit(
+        cache, key, (gbest_params, result.best.tolist(), info), return_info
+    )
+
+
+def compare_optimizers(
+    csv_path,
+    start_date,
+    end_date,
+    methods=("pso", "de", "cmaes"),
+    budget=100_000,
+    pso_budget=NUM_PARTICLES * MAX_ITER,
+    pso_particles=NUM_PARTICLES,
+    seeds=(0, 1, 2),
+    population=38e6,
+    cost_type=30,
+    use_norm=True,
+    backend=BACKEND,
+    integrator=INTEGRATOR,
+):
+    """
+    Fits the window start_date..end_date of the CSV (as multiple_runs_fit_sird does)
+    with every method and seed; PSO gets pso_budget evaluations in swarms of
+    pso_particles, the other methods `budget`. Returns {method: [FitResult per seed]}.
+    """
+    window = load_country(csv_path).between(start_date, end_date)
+    data = window_data(
+        window.active, window.recovered, window.deaths, population, use_norm
+    )
+    norm = dict(i_min=0.0, i_rng=1.0, r_min=0.0, r_rng=1.0, d_min=0.0, d_rng=1.0)
+    evaluate = make_cost_evaluator(
+        backend,
+        dt=DT,
+        substeps=SUBSTEPS,
+        Npop=population,
+        n_particles=max(MAX_BATCH, pso_particles),
+        cost_type=cost_type,
+        use_norm=use_norm,
+        integrator=integrator,
+        **{**norm, **data},
+    )
+
+    results = {}
+    for method in methods:
+        results[method] = []
+        for seed in seeds:
+            t0 = time.perf_counter()
+            if method == "pso":
+                options = dict(n_particles=pso_particles)
+            else:
+                options = dict(max_batch=MAX_BATCH)
+            result = fit(
+                evaluate,
+                PARAM_BOUNDS,
+                pso_budget if method == "pso" else budget,
+                method,
+                seed,
+                **options,
+            )
+            result.seconds = time.perf_counter() - t0
+            results[method].append(result)
+            print(
+                f"[INFO] {method} seed={seed}: cost {result.cost:.6g} after "
+                f"{result.n_evals} evaluations ({result.seconds:.2f} s)"
+            )
+    return results
+
+
+def print_comparison(results, milestones=None, tolerance=0.01):
+    """
+    Median best cost of every method after each number of evaluations in milestones,
+    and the median evaluations needed to come within `tolerance` (relative) of the
+    median final PSO cost.
+    """
+    if milestones is None:
+        top = max(r.n_evals for rs in results.values() for r in rs)
+        milestones = [
+            m for m in (10**e * f for e in range(3, 8) for f in (1, 3)) if m <= top
+        ]
+
+    def fmt(x):
+        return "-" if x is None or not np.isfinite(x) else f"{x:.4g}"
+
+    print(f"{'evaluations':>12} " + " ".join(f"{m:>10}" for m in results))
+    for m in milestones:
+        row = [statistics.median(r.cost_at(m) for r in rs) for rs in results.values()]
+        print(f"{m:>12} " + " ".join(f"{fmt(c):>10}" for c in row))
+
+    if "pso" in results:
+        target = statistics.median(r.cost for r in results["pso"])
+        target += tolerance * abs(target)
+        print(f"\nEvaluations to reach the PSO cost {fmt(target)} (+{tolerance:.0%}):")
+        for method, rs in results.items():
+            needed = [r.evals_to_reach(target) for r in rs]
+            reached = [n for n in needed if n is not None]
+            median = f"{statistics.median(reached):.0f}" if reached else "-"
+            print(
+                f"  {method:<6} {median:>10}  "
+                f"({len(reached)}/{len(rs)} seeds reached it)"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m covid_project.optimizers")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    cmp = sub.add_parser("compare", help="cost reached against evaluations spent")
+    cmp.add_argument("--csv", default=country_csv("Poland"))
+    cmp.add_argument("--start", default="2020-05-10")
+    cmp.add_argument("--end", default="2020-06-13")
+    cmp.add_argument("--population", type=float, default=38e6)
+    cmp.add_argument("--cost-type", type=int, default=30)
+    cmp.add_argument("--no-norm", action="store_true", help="fit the raw I/R/D")
+    cmp.add_argument("--methods", nargs="+", default=["pso", "de", "cmaes"])
+    cmp.add_argument("--budget", type=int, default=100_000, help="DE/CMA-ES")
+    cmp.add_argument("--pso-budget", type=int, default=NUM_PARTICLES * MAX_ITER)
+    cmp.add_argument("--pso-particles", type=int, default=NUM_PARTICLES)
+    cmp.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    cmp.add_argument("--backend", choices=("cuda", "numba", "numpy"), default=BACKEND)
+    cmp.add_argument("--integrator", default=INTEGRATOR)
+    cmp.add_argument("--out", help="JSON file of the cost traces")
+    args = parser.parse_args(argv)
+
+    results = compare_optimizers(
+        args.csv,
+        args.start,
+        args.end,
+        methods=args.methods,
+        budget=args.budget,
+        pso_budget=args.pso_budget,
+        pso_particles=args.pso_particles,
+        seeds=args.seeds,
+        population=args.population,
+        cost_type=args.cost_type,
+        use_norm=not args.no_norm,
+        backend=args.backend,
+        integrator=args.integrator,
+    )
+    print()
+    print_comparison(results)
+    if args.out:
+        traces = {
+            method: [
+                {
+                    "seed": seed,
+                    "x": dict(zip(PARAM_BOUNDS, r.x.tolist())),
+                    "cost": r.cost,
+                    "seconds": r.seconds,
+                    "evals": r.evals.tolist(),
+                    "best": r.best.tolist(),
+                }
+                for seed, r in zip(args.seeds, rs)
+            ]
+            for method, rs in results.items()
+        }
+        with open(args.out, "w") as f:
+            json.dump(traces, f, indent=2)
+        print(f"[INFO] Traces written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
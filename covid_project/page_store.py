@@ -0,0 +1,136 @@
+"""
+Pre-rendered pages of the result PDFs for the results viewer (cov_fin.py).
+
+Every PDF under results/<country>/ is rasterized once (pdf2image, downscaled to the
+viewer width) into WebP or PNG files in PAGE_STORE_DIR. An entry is keyed by the
+path, mtime and size of the PDF and the render settings, so a re-generated figure
+gets new pages and an unchanged one is never converted again. Entries are written
+atomically (pages first, the index last), so concurrent viewers can share the store.
+
+Command line (run from the repository root, after the pipeline wrote results/):
+
+    python -m covid_project.page_store render
+    python -m covid_project.page_store prune
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from covid_project.constants import PAGE_STORE_DIR, RESULTS_DIR
+
+PAGE_WIDTH = 850  # px, the width the viewer shows the figures at
+PAGE_FORMAT = "webp"
+
+
+def page_key(pdf_path, width=PAGE_WIDTH, fmt=PAGE_FORMAT):
+    """Key of the rendered pages of a PDF: its path, mtime, size and the settings."""
+    st = os.stat(pdf_path)
+    ident = f"{os.path.abspath(pdf_path)}:{st.st_mtime_ns}:{st.st_size}:{width}:{fmt}"
+    return hashlib.sha256(ident.encode()).hexdigest()[:32]
+
+
+def _entry_dir(store_dir, key):
+    return os.path.join(store_dir, key[:2], key)
+
+
+def cached_pages(pdf_path, store_dir=PAGE_STORE_DIR, width=PAGE_WIDTH, fmt=PAGE_FORMAT):
+    """Paths of the stored pages of the PDF, or None if it was not rendered yet."""
+    entry = _entry_dir(store_dir, page_key(pdf_path, width, fmt))
+    try:
+        with open(os.path.join(entry, "index.json")) as f:
+            names = json.load(f)["pages"]
+    except (OSError, ValueError, KeyError):
+        return None
+    return [os.path.join(entry, name) for name in names]
+
+
+def render_pdf(pdf_path, store_dir=PAGE_STORE_DIR, width=PAGE_WIDTH, fmt=PAGE_FORMAT):
+    """Paths of the pages of the PDF as images, rasterized now if not stored yet."""
+    pages = cached_pages(pdf_path, store_dir, width, fmt)
+    if pages is not None:
+        return pages
+
+    from pdf2image import convert_from_path
+
+    key = page_key(pdf_path, width, fmt)
+    entry = _entry_dir(store_dir, key)
+    os.makedirs(entry, exist_ok=True)
+    names = []
+    for i, image in enumerate(convert_from_path(pdf_path, size=(width, None))):
+        name = f"page-{i}.{fmt}"
+        _write_atomic(entry, name, lambda f: image.save(f, format=fmt.upper()))
+        names.append(name)
+    _write_atomic(
+        entry,
+        "index.json",
+        lambda f: f.write(json.dumps({"pdf": pdf_path, "pages": names}).encode()),
+    )
+    return [os.path.join(entry, name) for name in names]
+
+
+def _write_atomic(directory, name, write):
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        write(f)
+    os.replace(tmp_path, os.path.join(directory, name))
+
+
+def result_pdfs(results_dir=RESULTS_DIR):
+    """All results/<country>/*.pdf, sorted."""
+    return sorted(glob.glob(os.path.join(results_dir, "*", "*.pdf")))
+
+
+def render_all(
+    results_dir=RESULTS_DIR, store_dir=PAGE_STORE_DIR, width=PAGE_WIDTH, fmt=PAGE_FORMAT
+):
+    """Renders the result PDFs not stored yet; returns (rendered, up to date) counts."""
+    rendered = fresh = 0
+    for pdf_path in result_pdfs(results_dir):
+        if cached_pages(pdf_path, store_dir, width, fmt) is not None:
+            fresh += 1
+            continue
+        render_pdf(pdf_path, store_dir, width, fmt)
+        print(f"[INFO] Rendered {pdf_path}")
+        rendered += 1
+    return rendered, fresh
+
+
+def prune(
+    results_dir=RESULTS_DIR, store_dir=PAGE_STORE_DIR, width=PAGE_WIDTH, fmt=PAGE_FORMAT
+):
+    """Removes the entries of changed or deleted PDFs; returns their number."""
+    live = {page_key(pdf_path, width, fmt) for pdf_path in result_pdfs(results_dir)}
+    removed = 0
+    for entry in glob.glob(os.path.join(store_dir, "*", "*")):
+        if os.path.basename(entry) not in live:
+            shutil.rmtree(entry)
+            removed += 1
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m covid_project.page_store")
+    parser.add_argument("command", choices=("render", "prune"))
+    parser.add_argument("--results", default=RESULTS_DIR)
+    parser.add_argument("--dir", default=PAGE_STORE_DIR)
+    parser.add_argument("--width", type=int, default=PAGE_WIDTH)
+    parser.add_argument("--format", choices=("webp", "png"), default=PAGE_FORMAT)
+    args = parser.parse_args(argv)
+
+    if args.command == "render":
+        rendered, fresh = render_all(args.results, args.dir, args.width, args.format)
+        print(f"[INFO] {rendered} PDFs rendered, {fresh} up to date in {args.dir}")
+    else:
+        removed = prune(args.results, args.dir, args.width, args.format)
+        print(f"[INFO] Removed {removed} stale entries from {args.dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,12 @@
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.collections import LineCollection
+from matplotlib.colors import LinearSegmentedColormap, LogNorm
 import numpy as np
 import pandas as pd
 
+from .envelope import WindowEnvelope
+
 
 def plot_all_trajectories_SIRD(
     all_trajectories,
@@ -13,16 +17,30 @@ def plot_all_trajectories_SIRD(
     title="Multiple runs",
     population=38e6,
     tick_step=7,
+    mode="lines",
+    density_bins=200,
 ):
     """
     We draw 4 subplots: S,I,R,D - all (N) runs + empirical points.
+    all_trajectories: list of (S, I, R, D) per run, an (N, 4, L) array or a
+    fit_results.RunFits.
+    mode: "lines" - one Line2D per run, phase and compartment (slow for many runs),
+    "collection" - one rasterized LineCollection per compartment and phase,
+    "density" - a 2D histogram (density_bins value bins per day) of the runs over
+    time, drawn as one raster image per compartment.
     """
+    if mode not in ("lines", "collection", "density"):
+        raise ValueError(f"Unknown mode {mode!r}")
     num_runs = len(all_trajectories)
     if num_runs == 0:
         print("No trajectory to draw.")
         return None
 
-    L = len(all_trajectories[0][0])
+    if hasattr(all_trajectories, "trajectories"):
+        trajectories = all_trajectories.trajectories(np.float32)
+    else:
+        trajectories = np.asarray(all_trajectories)
+    L = trajectories.shape[2]
 
     end_date_ext = end_date + pd.Timedelta(days=forecast_days)
     df_ext = df[
@@ -37,98 +55,45 @@ def plot_all_trajectories_SIRD(
         df_ext["Active"] + df_ext["Recovered"] + df_ext["Deaths"]
     )
 
-    S_emp_ext = df_ext["S_calc"].values
-    I_emp_ext = df_ext["Active"].values
-    R_emp_ext = df_ext["Recovered"].values
-    D_emp_ext = df_ext["Deaths"].values
+    emp_ext = (
+        df_ext["S_calc"].values,
+        df_ext["Active"].values,
+        df_ext["Recovered"].values,
+        df_ext["Deaths"].values,
+    )
 
     fig, axs = plt.subplots(4, 1, figsize=(10, 14), sharex=True)
 
     fc_start_idx = L - forecast_days if forecast_days > 0 else L
-
-    # S(t)
-    for run_idx in range(num_runs):
-        S_run = all_trajectories[run_idx][0]
-        if forecast_days > 0:
-            axs[0].plot(
-                np.arange(fc_start_idx), S_run[:fc_start_idx], color="blue", alpha=0.03
-            )
-            axs[0].plot(
-                np.arange(fc_start_idx, L),
-                S_run[fc_start_idx:],
-                color="magenta",
-                alpha=0.03,
-                linestyle="--",
-            )
-        else:
-            axs[0].plot(S_run, color="blue", alpha=0.03)
-    axs[0].plot(x_data, S_emp_ext, "ko", ms=3, label="Empiryczne S")
-    axs[0].set_ylabel("S(t)")
-    axs[0].legend()
-    axs[0].set_title(f"S(t) – {title}")
-
-    # I(t)
-    for run_idx in range(num_runs):
-        I_run = all_trajectories[run_idx][1]
-        if forecast_days > 0:
-            axs[1].plot(
-                np.arange(fc_start_idx), I_run[:fc_start_idx], color="red", alpha=0.03
-            )
-            axs[1].plot(
-                np.arange(fc_start_idx, L),
-                I_run[fc_start_idx:],
-                color="magenta",
-                alpha=0.03,
-                linestyle="--",
-            )
-        else:
-            axs[1].plot(I_run, color="red", alpha=0.03)
-    axs[1].plot(x_data, I_emp_ext, "ko", ms=3, label="Empiryczne I")
-    axs[1].set_ylabel("I(t)")
-    axs[1].legend()
-    axs[1].set_title(f"I(t) – {title}")
-
-    # R(t)
-    for run_idx in range(num_runs):
-        R_run = all_trajectories[run_idx][2]
-        if forecast_days > 0:
-            axs[2].plot(
-                np.arange(fc_start_idx), R_run[:fc_start_idx], color="green", alpha=0.03
-            )
-            axs[2].plot(
-                np.arange(fc_start_idx, L),
-                R_run[fc_start_idx:],
-                color="magenta",
-                alpha=0.03,
-                linestyle="--",
-            )
-        else:
-            axs[2].plot(R_run, color="green", alpha=0.03)
-    axs[2].plot(x_data, R_emp_ext, "ko", ms=3, label="Empiryczne R")
-    axs[2].set_ylabel("R(t)")
-    axs[2].legend()
-    axs[2].set_title(f"R(t) – {title}")
-
-    # D(t)
-    for run_idx in range(num_runs):
-        D_run = all_trajectories[run_idx][3]
-        if forecast_days > 0:
-            axs[3].plot(
-                np.arange(fc_start_idx), D_run[:fc_start_idx], color="black", alpha=0.03
-            )
-            axs[3].plot(
-                np.arange(fc_start_idx, L),
-                D_run[fc_start_idx:],
-                color="magenta",
-                alpha=0.03,
-                linestyle="--",
+    phases = [(0, fc_start_idx)]
+    if forecast_days > 0:
+        phases.append((fc_start_idx, L))
+
+    for k, (name, color, marker) in enumerate(
+        zip("SIRD", ("blue", "red", "green", "black"), ("ko", "ko", "ko", "ro"))
+    ):
+        ax = axs[k]
+        runs = trajectories[:, k, :]
+        value_range = (float(np.min(runs)), float(np.max(runs)))
+        for phase, (lo, hi) in enumerate(phases):
+            style = (
+                dict(color="magenta", alpha=0.03, linestyle="--")
+                if phase == 1
+                else dict(color=color, alpha=0.03)
             )
-        else:
-            axs[3].plot(D_run, color="black", alpha=0.03)
-    axs[3].plot(x_data, D_emp_ext, "ro", ms=3, label="Empiryczne D")
-    axs[3].set_ylabel("D(t)")
-    axs[3].legend()
-    axs[3].set_title(f"D(t) – {title}")
+            if mode == "density":
+                _draw_density(
+                    ax, runs, lo, hi, value_range, style["color"], density_bins
+                )
+            elif mode == "collection":
+                _draw_line_collection(ax, runs, lo, hi, style)
+            else:
+                for run_idx in range(num_runs):
+                    ax.plot(np.arange(lo, hi), runs[run_idx, lo:hi], **style)
+        ax.plot(x_data, emp_ext[k], marker, ms=3, label=f"Empiryczne {name}")
+        ax.set_ylabel(f"{name}(t)")
+        ax.legend()
+        ax.set_title(f"{name}(t) – {title}")
 
     if forecast_days > 0:
         for ax in axs:
@@ -145,13 +110,57 @@ def plot_all_trajectories_SIRD(
     return fig
 
 
-def plot_compartments_fits(df, wresults, title_suffix="", save_path=None, ds=0):
+def _draw_line_collection(ax, runs, lo, hi, style):
+    """Days lo..hi-1 of every run (rows of runs) as one rasterized LineCollection."""
+    x = np.arange(lo, hi)
+    segments = np.empty((runs.shape[0], hi - lo, 2))
+    segments[:, :, 0] = x
+    segments[:, :, 1] = runs[:, lo:hi]
+    lines = LineCollection(
+        segments,
+        colors=style["color"],
+        alpha=style["alpha"],
+        linestyles=style.get("linestyle", "-"),
+        rasterized=True,
+    )
+    ax.add_collection(lines)
+    ax.autoscale_view()
+
+
+def _draw_density(ax, runs, first, last, value_range, color, bins):
     """
-    We draw min-max envelopes based on wresults (window list),
-    we superimpose the empirical data (I,R,D) on it.
+    Density of days first..last-1 of the runs (N, L) over (day, value) in
+    value_range as one image, log color scale.
     """
-    import numpy as np
+    lo, hi = value_range
+    hi = hi if hi > lo else lo + 1.0
+    days = last - first
+    idx = ((runs[:, first:last] - lo) / (hi - lo) * bins).astype(np.int64)
+    np.clip(idx, 0, bins - 1, out=idx)
+    counts = np.bincount(
+        (idx + np.arange(days) * bins).ravel(), minlength=days * bins
+    ).reshape(days, bins)
+    ax.imshow(
+        np.ma.masked_equal(counts.T, 0),
+        origin="lower",
+        aspect="auto",
+        interpolation="nearest",
+        extent=(first - 0.5, last - 0.5, lo, hi),
+        cmap=LinearSegmentedColormap.from_list("density", ["white", color]),
+        norm=LogNorm(vmin=1, vmax=max(counts.max(), 2)),
+    )
+
 
+def plot_compartments_fits(
+    df, wresults, title_suffix="", save_path=None, ds=0, bands=False, show=True
+):
+    """
+    We draw min-max envelopes based on wresults (window list, WindowFits
+    or an envelope.WindowEnvelope filled during the fitting),
+    we superimpose the empirical data (I,R,D) on it.
+    bands=True: also the outer quantile band (5-95%) and the median.
+    show=False: only save the figure (e.g. headless, see render.py).
+    """
     T = len(df)
     x_dates = df["Last_Update"].values
 
@@ -159,31 +168,10 @@ def plot_compartments_fits(df, wresults, title_suffix="", save_path=None, ds=0):
     R_data = df["Recovered"].values if "Recovered" in df.columns else np.zeros(T)
     D_data = df["Deaths"].values if "Deaths" in df.columns else np.zeros(T)
 
-    minI = np.full(T, np.inf)
-    maxI = np.full(T, -np.inf)
-    minR = np.full(T, np.inf)
-    maxR = np.full(T, -np.inf)
-    minD = np.full(T, np.inf)
-    maxD = np.full(T, -np.inf)
-
-    for res in wresults:
-        start_day = res["start_day"]
-        I_fit = res["I_fit"]
-        R_fit = res["R_fit"]
-        D_fit = res["D_fit"]
-
-        for d in range(len(I_fit)):
-            global_day = start_day + d
-            if global_day < T:
-                minI[global_day] = min(minI[global_day], I_fit[d])
-                maxI[global_day] = max(maxI[global_day], I_fit[d])
-                minR[global_day] = min(minR[global_day], R_fit[d])
-                maxR[global_day] = max(maxR[global_day], R_fit[d])
-                minD[global_day] = min(minD[global_day], D_fit[d])
-                maxD[global_day] = max(maxD[global_day], D_fit[d])
-
-    for arr in (minI, maxI, minR, maxR, minD, maxD):
-        arr[np.isinf(arr)] = np.nan
+    env = _window_envelope(wresults, T)
+    minI, maxI = env.min_max("I")
+    minR, maxR = env.min_max("R")
+    minD, maxD = env.min_max("D")
 
     fig, axes = plt.subplots(3, 1, figsize=(10, 12), sharex=True)
 
@@ -193,7 +181,6 @@ def plot_compartments_fits(df, wresults, title_suffix="", save_path=None, ds=0):
     )
     axes[0].plot(x_dates, I_data, "k.", label="I empirical (Active)")
     axes[0].set_title(f"Active (I) {title_suffix}")
-    axes[0].legend()
 
     # R
     axes[1].fill_between(
@@ -201,7 +188,6 @@ def plot_compartments_fits(df, wresults, title_suffix="", save_path=None, ds=0):
     )
     axes[1].plot(x_dates, R_data, "k.", label="R empirical (Recovered)")
     axes[1].set_title(f"Recovered (R) {title_suffix}")
-    axes[1].legend()
 
     # D
     axes[2].fill_between(
@@ -209,7 +195,12 @@ def plot_compartments_fits(df, wresults, title_suffix="", save_path=None, ds=0):
     )
     axes[2].plot(x_dates, D_data, "k.", label="D empirical (Deaths)")
     axes[2].set_title(f"Deaths (D) {title_suffix}")
-    axes[2].legend()
+
+    if bands:
+        for ax, name, color in zip(axes, "IRD", ("blue", "green", "red")):
+            _draw_quantile_band(ax, x_dates, env, name, color)
+    for ax in axes:
+        ax.legend()
 
     if ds == 0:
         axes[0].set_ylim([0, 25000])
@@ -225,73 +216,31 @@ def plot_compartments_fits(df, wresults, title_suffix="", save_path=None, ds=0):
     if save_path is not None:
         plt.savefig(save_path, bbox_inches="tight")
 
-    plt.show()
+    if show:
+        plt.show()
 
 
-def plot_params_wresults(df, wresults, title_suffix="", save_path=None):
+def plot_params_wresults(
+    df, wresults, title_suffix="", save_path=None, bands=False, show=True
+):
     """
     Drawing 4 subplots:
       1) Beta(t) envelope
       2) Gamma(t) envelope
       3) Mu(t) envelope
       4) R0(t) envelope
-    Based on results from window_wise_fitting (wresults).
+    Based on results from window_wise_fitting (wresults, WindowFits or an
+    envelope.WindowEnvelope). bands=True: also the 5-95% band and the median.
+    show=False: only save the figure (e.g. headless, see render.py).
     """
-    import numpy as np
-    import matplotlib.pyplot as plt
-    import matplotlib.dates as mdates
-    from .sird_simulation import piecewise_beta
-
     T = len(df)
     x_dates = df["Last_Update"].values
 
-    minBeta = np.full(T, np.inf)
-    maxBeta = np.full(T, -np.inf)
-    minGamma = np.full(T, np.inf)
-    maxGamma = np.full(T, -np.inf)
-    minMu = np.full(T, np.inf)
-    maxMu = np.full(T, -np.inf)
-    minR0 = np.full(T, np.inf)
-    maxR0 = np.full(T, -np.inf)
-
-    for res in wresults:
-        start_day = res["start_day"]
-        best_params = res["best_params"]
-
-        beta1 = best_params["beta1"]
-        beta2 = best_params["beta2"]
-        t1 = best_params["t1"]
-        t2 = best_params["t2"]
-        gamma_ = best_params["gamma"]
-        mu_ = best_params["mu"]
-
-        window_size = len(res["I_fit"])
-
-        for dlocal in range(window_size):
-            dglobal = start_day + dlocal
-            if dglobal >= T:
-                break
-
-            beta_d = piecewise_beta(dlocal, t1, t2, beta1, beta2)
-            gamma_d = gamma_
-            mu_d = mu_
-            denom = max(gamma_d + mu_d, 1e-12)
-            r0_d = beta_d / denom
-
-            minBeta[dglobal] = min(minBeta[dglobal], beta_d)
-            maxBeta[dglobal] = max(maxBeta[dglobal], beta_d)
-
-            minGamma[dglobal] = min(minGamma[dglobal], gamma_d)
-            maxGamma[dglobal] = max(maxGamma[dglobal], gamma_d)
-
-            minMu[dglobal] = min(minMu[dglobal], mu_d)
-            maxMu[dglobal] = max(maxMu[dglobal], mu_d)
-
-            minR0[dglobal] = min(minR0[dglobal], r0_d)
-            maxR0[dglobal] = max(maxR0[dglobal], r0_d)
-
-    for arr in (minBeta, maxBeta, minGamma, maxGamma, minMu, maxMu, minR0, maxR0):
-        arr[np.isinf(arr)] = np.nan
+    env = _window_envelope(wresults, T)
+    minBeta, maxBeta = env.min_max("beta")
+    minGamma, maxGamma = env.min_max("gamma")
+    minMu, maxMu = env.min_max("mu")
+    minR0, maxR0 = env.min_max("R0")
 
     fig, axs = plt.subplots(4, 1, figsize=(10, 12), sharex=True)
 
@@ -331,6 +280,13 @@ def plot_params_wresults(df, wresults, title_suffix="", save_path=None):
     axs[3].set_title(f"R0(t) = β(t)/(γ+μ) {title_suffix}")
     axs[3].legend()
 
+    if bands:
+        for ax, name, color in zip(
+            axs, ("beta", "gamma", "mu", "R0"), ("blue", "green", "red", "orange")
+        ):
+            _draw_quantile_band(ax, x_dates, env, name, color)
+            ax.legend()
+
     for ax in axs:
         ax.xaxis.set_major_locator(mdates.DayLocator(interval=14))
         ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))
@@ -342,4 +298,26 @@ def plot_params_wresults(df, wresults, title_suffix="", save_path=None):
     if save_path is not None:
         plt.savefig(save_path, bbox_inches="tight")
 
-    plt.show()
+    if show:
+        plt.show()
+
+
+def _window_envelope(wresults, n_days):
+    if isinstance(wresults, WindowEnvelope):
+        return wresults
+    return WindowEnvelope.from_results(wresults, n_days)
+
+
+def _draw_quantile_band(ax, x, env, name, color):
+    """Outer quantile band of env (e.g. 5-95%) and the median, if computed."""
+    q_lo, q_hi = min(env.quantiles), max(env.quantiles)
+    ax.fill_between(
+        x,
+        env.quantile(name, q_lo),
+        env.quantile(name, q_hi),
+        color=color,
+        alpha=0.3,
+        label=f"{name} {q_lo:.0%}-{q_hi:.0%}",
+    )
+    if 0.5 in env.quantiles:
+        ax.plot(x, env.quantile(name, 0.5), color=color, lw=1, label=f"{name} mediana")
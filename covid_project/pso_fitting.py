@@ -1,7 +1,511 @@
+import time
+
 import numpy as np
 from numba import cuda
-from .gpu_kernels import sird_euler_gpu
-from covid_project.constants import W, C1, C2, DT, SUBSTEPS
+from numba.cuda.random import create_xoroshiro128p_states
+from .gpu_kernels import (
+    sird_euler_gpu,
+    sird_euler_cpu_parallel,
+    sird_euler_windows_gpu,
+    sird_euler_windows_cpu_parallel,
+    pso_pbest_reduce_gpu,
+    pso_gbest_gpu,
+    pso_move_gpu,
+    PSO_THREADS,
+)
+from .cpu_kernels import sird_euler_cpu
+from .integrators import integrator_code
+from .pso_stats import NO_STATS
+from .fit_cache import fit_key
+from covid_project.constants import (
+    W,
+    C1,
+    C2,
+    DT,
+    SUBSTEPS,
+    BACKEND,
+    INTEGRATOR,
+    PARAM_BOUNDS,
+)
+
+
+def _bounds_table(
+    bounds_beta1,
+    bounds_beta2,
+    bounds_t1,
+    bounds_t2,
+    bounds_gamma,
+    bounds_mu,
+    bounds=None,
+):
+    """
+    Returns (names, lower, upper) of the fitted parameters. The order is the
+    order of rows in the particle matrix. `bounds` (name -> (lo, hi)) overrides
+    the bounds_* arguments.
+    """
+    table = dict(PARAM_BOUNDS)
+    table.update(
+        beta1=bounds_beta1,
+        beta2=bounds_beta2,
+        t1=bounds_t1,
+        t2=bounds_t2,
+        gamma=bounds_gamma,
+        mu=bounds_mu,
+    )
+    if bounds is not None:
+        table.update(bounds)
+    names = tuple(PARAM_BOUNDS)
+    lower = np.array([table[k][0] for k in names], dtype=np.float32)
+    upper = np.array([table[k][1] for k in names], dtype=np.float32)
+    return names, lower, upper
+
+
+# Arguments of the PSO functions that do not change the fit (left out of the cache key)
+_UNCACHED_ARGS = ("cache", "stats", "return_info", "return_swarm")
+
+
+def cache_key(cache, args):
+    """
+    Fit cache key of a PSO call from its arguments (locals() at the start of the call),
+    or None when the call is not cached (no cache, or no seed: the fit is random).
+    """
+    if cache is None or args["seed"] is None:
+        return None
+    return fit_key(**{k: v for k, v in args.items() if k not in _UNCACHED_ARGS})
+
+
+def make_cost_evaluator(  # noqa: PLR0915
+    backend,
+    days,
+    I_emp,
+    R_emp,
+    D_emp,
+    S0,
+    I0,
+    R0,
+    D0,
+    dt,
+    substeps,
+    Npop,
+    n_particles,
+    cost_type,
+    use_norm,
+    i_min,
+    i_rng,
+    r_min,
+    r_rng,
+    d_min,
+    d_rng,
+    windows=None,
+    integrator=INTEGRATOR,
+    stats=NO_STATS,
+):
+    """
+    Returns a function evaluate(pos, run_ids=None) -> cost array, where pos is a float32
+    (n_params, n_particles) particle matrix (rows: beta1, beta2, t1, t2, gamma, mu),
+    computed with the chosen backend ("cuda", "numba" or "numpy") and the SIRD
+    integrator ("euler", "rk2", "rk4" or "rk45").
+
+    windows: optional (offsets, S0s, I0s, R0s, D0s), arrays with one entry per PSO run.
+    Then I_emp/R_emp/D_emp are the full series, S0..D0 are ignored, and the particles
+    of run r (pos columns grouped by run, run_ids = the runs in pos) are compared with
+    the series from offsets[r] and start from that window's initial conditions.
+
+    stats: the "cuda" evaluator reports its "h2d", "kernel" and "d2h" times there.
+    """
+    # Convert to float32 (the same inputs for every backend).
+    d_emp_f32 = D_emp.astype(np.float32)
+    i_emp_f32 = I_emp.astype(np.float32)
+    r_emp_f32 = R_emp.astype(np.float32)
+
+    use_norm_flag = 1 if use_norm else 0
+    norm_data = np.array([i_min, i_rng, r_min, r_rng, d_min, d_rng], dtype=np.float32)
+
+    if windows is not None:
+        offsets = np.asarray(windows[0], dtype=np.int32)
+        initial = np.array(windows[1:], dtype=np.float64)
+    per_particle = {}
+    scheme = integrator_code(integrator)
+
+    def expand(run_ids, n):
+        """Per-particle (offsets, S0, I0, R0, D0) for the given runs, cached."""
+        if run_ids is None:
+            run_ids = np.arange(offsets.size)
+        key = (n, run_ids.tobytes())
+        if key not in per_particle:
+            per_particle.clear()
+            reps = n // run_ids.size
+            per_particle[key] = (
+                np.repeat(offsets[run_ids], reps),
+                *np.repeat(initial[:, run_ids], reps, axis=1),
+            )
+        return per_particle[key]
+
+    if backend == "numpy":
+
+        def evaluate(pos, run_ids=None):
+            if windows is None:
+                return sird_euler_cpu(
+                    *pos,
+                    dt,
+                    substeps,
+                    Npop,
+                    days,
+                    i_emp_f32,
+                    r_emp_f32,
+                    d_emp_f32,
+                    cost_type,
+                    S0,
+                    I0,
+                    R0,
+                    D0,
+                    use_norm_flag,
+                    *norm_data,
+                    integrator=integrator,
+                )
+            offs, S0s, I0s, R0s, D0s = expand(run_ids, pos.shape[1])
+            return sird_euler_cpu(
+                *pos,
+                dt,
+                substeps,
+                Npop,
+                days,
+                i_emp_f32,
+                r_emp_f32,
+                d_emp_f32,
+                cost_type,
+                S0s,
+                I0s,
+                R0s,
+                D0s,
+                use_norm_flag,
+                *norm_data,
+                offsets=offs,
+                integrator=integrator,
+            )
+
+        return evaluate
+
+    if backend == "numba":
+        cost_host = np.empty(n_particles, dtype=np.float32)
+
+        def evaluate(pos, run_ids=None):
+            cost = cost_host[: pos.shape[1]]
+            if windows is None:
+                sird_euler_cpu_parallel(
+                    *pos,
+                    cost,
+                    float(dt),
+                    substeps,
+                    float(Npop),
+                    days,
+                    i_emp_f32,
+                    r_emp_f32,
+                    d_emp_f32,
+                    cost_type,
+                    float(S0),
+                    float(I0),
+                    float(R0),
+                    float(D0),
+                    use_norm_flag,
+                    *norm_data,
+                    scheme,
+                )
+            else:
+                sird_euler_windows_cpu_parallel(
+                    *pos,
+                    *expand(run_ids, pos.shape[1]),
+                    cost,
+                    float(dt),
+                    substeps,
+                    float(Npop),
+                    days,
+                    i_emp_f32,
+                    r_emp_f32,
+                    d_emp_f32,
+                    cost_type,
+                    use_norm_flag,
+                    *norm_data,
+                    scheme,
+                )
+            return cost
+
+        return evaluate
+
+    if backend != "cuda":
+        raise ValueError(f"Unknown backend: {backend!r}")
+
+    # Copy to GPU.
+    D_emp_dev = cuda.to_device(d_emp_f32)
+    I_emp_dev = cuda.to_device(i_emp_f32)
+    R_emp_dev = cuda.to_device(r_emp_f32)
+
+    # Particle matrices on the GPU, by number of particles (fewer when PSO runs stop early)
+    pos_devs = {
+        n_particles: cuda.device_array(
+            (len(PARAM_BOUNDS), n_particles), dtype=np.float32
+        )
+    }
+    cost_dev = cuda.device_array(n_particles, dtype=np.float32)
+    cost_host = cuda.pinned_array(n_particles, dtype=np.float32)
+    windows_dev = {}
+
+    threadsperblock = 128
+
+    def evaluate(pos, run_ids=None):
+        n = pos.shape[1]
+        if n not in pos_devs:
+            pos_devs[n] = cuda.device_array(pos.shape, dtype=np.float32)
+        pos_dev = pos_devs[n]
+        blockspergrid = (n + threadsperblock - 1) // threadsperblock
+
+        # Copying to the GPU (one transfer for the whole particle matrix)
+        pos_dev.copy_to_device(pos)
+        stats.lap("h2d")
+
+        if windows is None:
+            sird_euler_gpu[blockspergrid, threadsperblock](
+                *(pos_dev[k] for k in range(pos_dev.shape[0])),
+                cost_dev[:n],
+                dt,
+                substeps,
+                Npop,
+                days,
+                I_emp_dev,
+                R_emp_dev,
+                D_emp_dev,
+                cost_type,
+                S0,
+                I0,
+                R0,
+                D0,
+                use_norm_flag,
+                *norm_data,
+                scheme,
+            )
+        else:
+            # Per-particle windows are uploaded only when the set of runs changes
+            host_arrays = expand(run_ids, n)
+            if windows_dev.get("src") is not host_arrays:
+                windows_dev["src"] = host_arrays
+                windows_dev["dev"] = [cuda.to_device(a) for a in host_arrays]
+                stats.lap("h2d")
+            sird_euler_windows_gpu[blockspergrid, threadsperblock](
+                *(pos_dev[k] for k in range(pos_dev.shape[0])),
+                *windows_dev["dev"],
+                cost_dev[:n],
+                dt,
+                substeps,
+                Npop,
+                days,
+                I_emp_dev,
+                R_emp_dev,
+                D_emp_dev,
+                cost_type,
+                use_norm_flag,
+                *norm_data,
+                scheme,
+            )
+        cuda.synchronize()
+        stats.lap("kernel")
+
+        cost_dev[:n].copy_to_host(cost_host[:n])
+        stats.lap("d2h")
+        return cost_host[:n]
+
+    return evaluate
+
+
+def _work_buffers(pos):
+    """Per-iteration buffers of pso_loop for a (n_params, m, n_particles) swarm."""
+    n_params, m, n_particles = pos.shape
+    rand = np.empty((2, *pos.shape), dtype=np.float32)
+    tmp = np.empty(pos.shape, dtype=np.float32)
+    better_idx = np.empty((m, n_particles), dtype=bool)
+    flat = pos.reshape(n_params, m * n_particles)
+    return rand, tmp, better_idx, flat, np.arange(m)
+
+
+def pso_loop(  # noqa: PLR0912, PLR0915
+    evaluate,
+    lower,
+    upper,
+    num_runs,
+    n_particles,
+    max_iter,
+    W,
+    C1,
+    C2,
+    rng,
+    stall_iter=None,
+    cost_tol=0.0,
+    diameter_tol=None,
+    time_budget=None,
+    restart_stall=None,
+    init_pos=None,
+    return_swarm=False,
+    stats=NO_STATS,
+):
+    """
+    PSO over a float32 particle matrix of shape (n_params, num_runs, n_particles):
+    every run has its own pbest/gbest, all runs are evaluated in one call.
+
+    A run stops early when (checked in this order):
+    - "stall": gbest has not improved by more than cost_tol (relative) for stall_iter iterations,
+    - "diameter": the swarm spread (max over parameters of range / bound width) < diameter_tol,
+    - "time": time_budget seconds have passed since the start,
+    otherwise after max_iter iterations ("max_iter"). Stopped runs are dropped from
+    the swarm, so they cost no more evaluations.
+    With restart_stall, particles whose pbest has not improved for restart_stall
+    iterations are re-initialized uniformly within the bounds.
+    init_pos (n_params, k) seeds the first k particles of every run (warm start);
+    with return_swarm the infos also hold the final pbest matrix and pbest costs.
+    stats (pso_stats.PSOStats) collects phase times, evaluations and improvements.
+
+    Returns (gbest, histories, infos): gbest has shape (num_runs, n_params),
+    histories is a list of per-run arrays of gbest costs, infos a list of dicts
+    with stop_reason, n_iter and n_evals.
+    """
+    t_start = time.perf_counter()
+    stats.start()
+    n_params = lower.size
+    lo = lower[:, None, None]
+    hi = upper[:, None, None]
+    width = np.maximum(upper - lower, 1e-12)[:, None]
+
+    # Initialize
+    pos = rng.uniform(lo, hi, (n_params, num_runs, n_particles)).astype(np.float32)
+    if init_pos is not None:
+        k = min(init_pos.shape[1], n_particles)
+        pos[:, :, :k] = np.clip(init_pos[:, None, :k], lo, hi)
+    vel = np.zeros_like(pos)
+    pbest = pos.copy()
+    pbest_cost = np.full((num_runs, n_particles), 1e30, dtype=np.float32)
+    pbest_age = np.zeros((num_runs, n_particles), dtype=np.int32)
+
+    gbest = np.zeros((n_params, num_runs), dtype=np.float32)
+    gbest_cost = np.full(num_runs, 1e30, dtype=np.float32)
+    ref_cost = np.full(num_runs, 1e30, dtype=np.float32)
+    last_improve = np.zeros(num_runs, dtype=np.int64)
+
+    # Active runs (original indices) and the results of finished runs
+    run_ids = np.arange(num_runs)
+    hist = np.empty((num_runs, max_iter), dtype=np.float32)
+    final_gbest = np.zeros((num_runs, n_params), dtype=np.float32)
+    infos = [None] * num_runs
+
+    # Work buffers, reused until the set of active runs changes
+    m = num_runs
+    rand, tmp, better_idx, flat, runs = _work_buffers(pos)
+    for it in range(max_iter):
+        # 1) Cost of every particle of every run in one call
+        cost_vals = evaluate(flat, run_ids).reshape(m, n_particles)
+        stats.evaluated(m * n_particles)
+        stats.lap("evaluate")
+
+        # 2) Update pbest
+        np.less(cost_vals, pbest_cost, out=better_idx)
+        np.copyto(pbest_cost, cost_vals, where=better_idx)
+        np.copyto(pbest, pos, where=better_idx)
+        if restart_stall is not None:
+            pbest_age += 1
+            pbest_age[better_idx] = 0
+        stats.lap("pbest")
+
+        # 3) Update gbest of every run
+        min_cost_idx = np.argmin(cost_vals, axis=1)
+        min_cost_val = cost_vals[runs, min_cost_idx]
+        improved = min_cost_val < gbest_cost
+        gbest_cost[improved] = min_cost_val[improved]
+        gbest[:, improved] = pos[:, runs, min_cost_idx][:, improved]
+
+        hist[run_ids, it] = gbest_cost
+        stats.lap("gbest")
+        stats.iteration(it, run_ids, gbest_cost, improved)
+
+        # 4) Stopping criteria
+        significant = gbest_cost < ref_cost - cost_tol * np.abs(ref_cost)
+        ref_cost[significant] = gbest_cost[significant]
+        last_improve[significant] = it
+
+        reasons = np.full(m, "", dtype=object)
+        if it == max_iter - 1:
+            reasons[:] = "max_iter"
+        if time_budget is not None and time.perf_counter() - t_start >= time_budget:
+            reasons[:] = "time"
+        if diameter_tol is not None:
+            diameter = (np.ptp(pos, axis=2) / width).max(axis=0)
+            reasons[diameter < diameter_tol] = "diameter"
+        if stall_iter is not None:
+            reasons[it - last_improve >= stall_iter] = "stall"
+
+        done = reasons != ""
+        if done.any():
+            stats.final_spread(run_ids[done], pos[:, done], width)
+            for a in np.nonzero(done)[0]:
+                r = run_ids[a]
+                final_gbest[r] = gbest[:, a]
+                infos[r] = {
+                    "stop_reason": reasons[a],
+                    "n_iter": it + 1,
+                    "n_evals": (it + 1) * n_particles,
+                }
+                if return_swarm:
+                    infos[r]["pbest"] = pbest[:, a].copy()
+                    infos[r]["pbest_cost"] = pbest_cost[a].copy()
+            if done.all():
+                stats.lap("stopping")
+                break
+
+            # Drop the finished runs from the swarm
+            keep = ~done
+            run_ids = run_ids[keep]
+            pos = np.ascontiguousarray(pos[:, keep])
+            vel = np.ascontiguousarray(vel[:, keep])
+            pbest = np.ascontiguousarray(pbest[:, keep])
+            pbest_cost = pbest_cost[keep]
+            pbest_age = pbest_age[keep]
+            gbest = np.ascontiguousarray(gbest[:, keep])
+            gbest_cost = gbest_cost[keep]
+            ref_cost = ref_cost[keep]
+            last_improve = last_improve[keep]
+            m = run_ids.size
+            rand, tmp, better_idx, flat, runs = _work_buffers(pos)
+        stats.lap("stopping")
+
+        # 5) Speed and position update: one random matrix, in-place arithmetic
+        rng.random(out=rand, dtype=np.float32)
+        stats.lap("rng")
+        vel *= W
+        np.subtract(pbest, pos, out=tmp)
+        tmp *= rand[0]
+        tmp *= C1
+        vel += tmp
+        np.subtract(gbest[:, :, None], pos, out=tmp)
+        tmp *= rand[1]
+        tmp *= C2
+        vel += tmp
+        pos += vel
+        stats.lap("move")
+
+        # 6) clip
+        np.clip(pos, lo, hi, out=pos)
+        stats.lap("clip")
+
+        # 7) Restart of stagnated particles
+        if restart_stall is not None:
+            stale_runs, stale_particles = np.nonzero(pbest_age >= restart_stall)
+            if stale_runs.size:
+                pos[:, stale_runs, stale_particles] = rng.uniform(
+                    lower[:, None], upper[:, None], (n_params, stale_runs.size)
+                )
+                vel[:, stale_runs, stale_particles] = 0.0
+                pbest_age[stale_runs, stale_particles] = 0
+            stats.lap("restart")
+
+    stats.finish()
+    histories = [hist[r, : infos[r]["n_iter"]] for r in range(num_runs)]
+    return final_gbest, histories, infos
 
 
 def run_pso_sird_gpu(
@@ -20,12 +524,12 @@ def run_pso_sird_gpu(
     max_iter=50,
     cost_type=10,
     # bounds
-    bounds_beta1=(0.0, 1.5),
-    bounds_beta2=(0.0, 1.5),
-    bounds_t1=(0.0, 10.0),
-    bounds_t2=(10.0, 36.0),
-    bounds_gamma=(0.0, 0.3),
-    bounds_mu=(0.0, 0.05),
+    bounds_beta1=PARAM_BOUNDS["beta1"],
+    bounds_beta2=PARAM_BOUNDS["beta2"],
+    bounds_t1=PARAM_BOUNDS["t1"],
+    bounds_t2=PARAM_BOUNDS["t2"],
+    bounds_gamma=PARAM_BOUNDS["gamma"],
+    bounds_mu=PARAM_BOUNDS["mu"],
     # normalize
     use_norm=False,
     i_min=0.0,
@@ -37,80 +541,247 @@ def run_pso_sird_gpu(
     W=W,
     C1=C1,
     C2=C2,
+    backend=BACKEND,
+    device_resident=False,
+    bounds=None,
+    seed=None,
+    # stopping criteria
+    stall_iter=None,
+    cost_tol=0.0,
+    diameter_tol=None,
+    time_budget=None,
+    restart_stall=None,
+    return_info=False,
+    # warm start
+    init_pos=None,
+    return_swarm=False,
+    integrator=INTEGRATOR,
+    stats=None,
+    cache=None,
 ):
     """
     The main PSO function that returns:
     - gbest_params: dict with best parameters
     - history: a list of the best cost values in each iteration
+    The cost is evaluated with `backend`: "cuda" (GPU kernel), "numba" (multi-core CPU)
+    or "numpy" (vectorized CPU).
+    With device_resident=True (backend "cuda" only) the whole swarm stays on the GPU
+    and only the gbest cost is copied back in each iteration.
+    `bounds` (name -> (lo, hi)) overrides the bounds_* arguments; `seed` seeds the RNG.
+    stall_iter/cost_tol/diameter_tol/time_budget stop the swarm early and restart_stall
+    re-initializes stagnated particles (see pso_loop). With return_info=True a third
+    value is returned: dict with stop_reason, n_iter and n_evals.
+    init_pos (n_params, k) seeds the first k particles (warm start); with
+    return_swarm=True the info dict also holds the final "pbest" matrix and "pbest_cost".
+    integrator: SIRD time integrator, "euler", "rk2", "rk4" or "rk45" (integrators.py).
+    stats: optional pso_stats.PSOStats, filled with phase times, evaluation counts,
+    the improvement curve and the final swarm spread.
+    cache: optional fit_cache.FitCache; seeded calls (seed is not None) are looked up
+    there by a hash of all their inputs and stored after fitting (not with
+    return_swarm; a cache hit leaves `stats` empty).
     """
+    key = None if return_swarm else cache_key(cache, locals())
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return tuple(cached) if return_info else tuple(cached[:2])
+    stats = NO_STATS if stats is None else stats
 
     if I_emp is None:
         I_emp = np.zeros(days, dtype=np.float32)
     if R_emp is None:
         R_emp = np.zeros(days, dtype=np.float32)
 
-    # Initialize
-    beta1 = np.random.uniform(bounds_beta1[0], bounds_beta1[1], n_particles)
-    beta2 = np.random.uniform(bounds_beta2[0], bounds_beta2[1], n_particles)
-    t1_ = np.random.uniform(bounds_t1[0], bounds_t1[1], n_particles)
-    t2_ = np.random.uniform(bounds_t2[0], bounds_t2[1], n_particles)
-    gamma_ = np.random.uniform(bounds_gamma[0], bounds_gamma[1], n_particles)
-    mu_ = np.random.uniform(bounds_mu[0], bounds_mu[1], n_particles)
-
-    v_beta1 = np.zeros(n_particles)
-    v_beta2 = np.zeros(n_particles)
-    v_t1 = np.zeros(n_particles)
-    v_t2 = np.zeros(n_particles)
-    v_gamma = np.zeros(n_particles)
-    v_mu = np.zeros(n_particles)
-
-    pbest_beta1 = beta1.copy()
-    pbest_beta2 = beta2.copy()
-    pbest_t1 = t1_.copy()
-    pbest_t2 = t2_.copy()
-    pbest_gamma = gamma_.copy()
-    pbest_mu = mu_.copy()
-    pbest_cost = np.ones(n_particles) * 1e30
-
-    gbest_cost = 1e30
-    gbest_params = {}
-
-    # Convert to float32 and copy to GPU.
-    d_emp_f32 = D_emp.astype(np.float32)
-    i_emp_f32 = I_emp.astype(np.float32)
-    r_emp_f32 = R_emp.astype(np.float32)
+    names, lower, upper = _bounds_table(
+        bounds_beta1,
+        bounds_beta2,
+        bounds_t1,
+        bounds_t2,
+        bounds_gamma,
+        bounds_mu,
+        bounds,
+    )
+    rng = np.random.default_rng(seed)
 
-    D_emp_dev = cuda.to_device(d_emp_f32)
-    I_emp_dev = cuda.to_device(i_emp_f32)
-    R_emp_dev = cuda.to_device(r_emp_f32)
+    if device_resident:
+        if backend != "cuda":
+            raise ValueError("device_resident=True requires backend='cuda'")
+        if any(x is not None for x in (diameter_tol, restart_stall, init_pos)):
+            raise ValueError(
+                "diameter_tol, restart_stall and init_pos"
+                " are not supported with device_resident=True"
+            )
+        gbest_params, history, info = _run_pso_sird_device(
+            days,
+            D_emp,
+            I_emp,
+            R_emp,
+            S0,
+            I0,
+            R0,
+            D0,
+            dt,
+            substeps,
+            Npop,
+            n_particles,
+            max_iter,
+            cost_type,
+            names,
+            lower,
+            upper,
+            use_norm,
+            (i_min, i_rng, r_min, r_rng, d_min, d_rng),
+            W,
+            C1,
+            C2,
+            rng,
+            stall_iter,
+            cost_tol,
+            time_budget,
+            integrator,
+            return_swarm,
+            stats,
+        )
+        return store_fit(cache, key, (gbest_params, history, info), return_info)
+
+    evaluate = make_cost_evaluator(
+        backend,
+        days,
+        I_emp,
+        R_emp,
+        D_emp,
+        S0,
+        I0,
+        R0,
+        D0,
+        dt,
+        substeps,
+        Npop,
+        n_particles,
+        cost_type,
+        use_norm,
+        i_min,
+        i_rng,
+        r_min,
+        r_rng,
+        d_min,
+        d_rng,
+        integrator=integrator,
+        stats=stats,
+    )
 
-    beta1_dev = cuda.to_device(beta1.astype(np.float32))
-    beta2_dev = cuda.to_device(beta2.astype(np.float32))
-    t1_dev = cuda.to_device(t1_.astype(np.float32))
-    t2_dev = cuda.to_device(t2_.astype(np.float32))
-    gamma_dev = cuda.to_device(gamma_.astype(np.float32))
-    mu_dev = cuda.to_device(mu_.astype(np.float32))
+    gbest, histories, infos = pso_loop(
+        evaluate,
+        lower,
+        upper,
+        1,
+        n_particles,
+        max_iter,
+        W,
+        C1,
+        C2,
+        rng,
+        stall_iter,
+        cost_tol,
+        diameter_tol,
+        time_budget,
+        restart_stall,
+        init_pos,
+        return_swarm,
+        stats,
+    )
+    gbest_params = {name: float(gbest[0, k]) for k, name in enumerate(names)}
+    return store_fit(
+        cache, key, (gbest_params, histories[0].tolist(), infos[0]), return_info
+    )
 
+
+def store_fit(cache, key, fit, return_info):
+    """Stores (gbest_params, history, info) under key (if any), returns the PSO result."""
+    if key is not None:
+        cache.put(key, list(fit))
+    return fit if return_info else fit[:2]
+
+
+def _run_pso_sird_device(
+    days,
+    D_emp,
+    I_emp,
+    R_emp,
+    S0,
+    I0,
+    R0,
+    D0,
+    dt,
+    substeps,
+    Npop,
+    n_particles,
+    max_iter,
+    cost_type,
+    names,
+    lower,
+    upper,
+    use_norm,
+    norm,
+    W,
+    C1,
+    C2,
+    rng,
+    stall_iter=None,
+    cost_tol=0.0,
+    time_budget=None,
+    integrator=INTEGRATOR,
+    return_swarm=False,
+    stats=NO_STATS,
+):
+    """
+    Device-resident variant of run_pso_sird_gpu: positions, velocities, pbest,
+    random numbers and the gbest reduction live on the GPU.
+    Returns (gbest_params, history, info); with return_swarm, pbest and pbest_cost
+    are copied back into info at the end.
+    With stats, the GPU is synchronized after every phase so that the times are exact.
+    """
+    t_start = time.perf_counter()
+    stats.start()
+    sync = cuda.synchronize if stats.enabled else None
+    # Initialize (one upload)
+    pos = rng.uniform(
+        lower[:, None], upper[:, None], (len(names), n_particles)
+    ).astype(np.float32)
+    pos_dev = cuda.to_device(pos)
+    vel_dev = cuda.to_device(np.zeros_like(pos))
+    pbest_dev = cuda.to_device(pos)
+    pbest_cost_dev = cuda.to_device(np.full(n_particles, 3.0e38, dtype=np.float32))
+    gbest_dev = cuda.to_device(pos[:, 0].copy())
+    gbest_cost_dev = cuda.to_device(np.full(1, 3.0e38, dtype=np.float32))
+    lower_dev = cuda.to_device(lower)
+    upper_dev = cuda.to_device(upper)
     cost_dev = cuda.device_array(n_particles, dtype=np.float32)
 
-    use_norm_flag = 1 if use_norm else 0
-    norm_data = np.array([i_min, i_rng, r_min, r_rng, d_min, d_rng], dtype=np.float32)
-    norm_data_dev = cuda.to_device(norm_data)
+    blockspergrid = (n_particles + PSO_THREADS - 1) // PSO_THREADS
+    block_min_cost_dev = cuda.device_array(blockspergrid, dtype=np.float32)
+    block_min_idx_dev = cuda.device_array(blockspergrid, dtype=np.int32)
+    rng_states = create_xoroshiro128p_states(
+        n_particles, seed=int(rng.integers(2**31 - 1))
+    )
 
-    threadsperblock = 128
-    blockspergrid = (n_particles + threadsperblock - 1) // threadsperblock
+    D_emp_dev = cuda.to_device(D_emp.astype(np.float32))
+    I_emp_dev = cuda.to_device(I_emp.astype(np.float32))
+    R_emp_dev = cuda.to_device(R_emp.astype(np.float32))
+    norm_data = np.array(norm, dtype=np.float32)
+    use_norm_flag = 1 if use_norm else 0
+    scheme = integrator_code(integrator)
+    stats.lap("h2d", sync)
 
     history = []
+    ref_cost = 1e30
+    last_improve = 0
+    stop_reason = "max_iter"
 
     for it in range(max_iter):
         # 1) Kernel on GPU
-        sird_euler_gpu[blockspergrid, threadsperblock](
-            beta1_dev,
-            beta2_dev,
-            t1_dev,
-            t2_dev,
-            gamma_dev,
-            mu_dev,
+        sird_euler_gpu[blockspergrid, PSO_THREADS](
+            *(pos_dev[k] for k in range(len(names))),
             cost_dev,
             dt,
             substeps,
@@ -125,107 +796,225 @@ def run_pso_sird_gpu(
             R0,
             D0,
             use_norm_flag,
-            norm_data_dev[0],
-            norm_data_dev[1],
-            norm_data_dev[2],
-            norm_data_dev[3],
-            norm_data_dev[4],
-            norm_data_dev[5],
+            *norm_data,
+            scheme,
         )
-        cuda.synchronize()
+        stats.evaluated(n_particles)
+        stats.lap("kernel", sync)
 
-        # 2) Matching cost with GPU
-        cost_vals = cost_dev.copy_to_host()
-
-        # 3) Update pbest
-        better_idx = cost_vals < pbest_cost
-        pbest_cost[better_idx] = cost_vals[better_idx]
-        pbest_beta1[better_idx] = beta1[better_idx]
-        pbest_beta2[better_idx] = beta2[better_idx]
-        pbest_t1[better_idx] = t1_[better_idx]
-        pbest_t2[better_idx] = t2_[better_idx]
-        pbest_gamma[better_idx] = gamma_[better_idx]
-        pbest_mu[better_idx] = mu_[better_idx]
-
-        # 4) Update gbest
-        min_cost_idx = np.argmin(cost_vals)
-        min_cost_val = cost_vals[min_cost_idx]
-        if min_cost_val < gbest_cost:
-            gbest_cost = min_cost_val
-            gbest_params = {
-                "beta1": beta1[min_cost_idx],
-                "beta2": beta2[min_cost_idx],
-                "t1": t1_[min_cost_idx],
-                "t2": t2_[min_cost_idx],
-                "gamma": gamma_[min_cost_idx],
-                "mu": mu_[min_cost_idx],
-            }
-
-        history.append(gbest_cost)
-
-        # 5) Speed and position update
-        r1 = np.random.rand(n_particles)
-        r2 = np.random.rand(n_particles)
-        v_beta1 = (
-            W * v_beta1
-            + C1 * r1 * (pbest_beta1 - beta1)
-            + C2 * r2 * (gbest_params["beta1"] - beta1)
-        )
-        beta1 += v_beta1
-
-        r1 = np.random.rand(n_particles)
-        r2 = np.random.rand(n_particles)
-        v_beta2 = (
-            W * v_beta2
-            + C1 * r1 * (pbest_beta2 - beta2)
-            + C2 * r2 * (gbest_params["beta2"] - beta2)
+        # 2) Update pbest + argmin in every block
+        pso_pbest_reduce_gpu[blockspergrid, PSO_THREADS](
+            pos_dev,
+            cost_dev,
+            pbest_dev,
+            pbest_cost_dev,
+            block_min_cost_dev,
+            block_min_idx_dev,
         )
-        beta2 += v_beta2
 
-        r1 = np.random.rand(n_particles)
-        r2 = np.random.rand(n_particles)
-        v_t1 = (
-            W * v_t1 + C1 * r1 * (pbest_t1 - t1_) + C2 * r2 * (gbest_params["t1"] - t1_)
+        # 3) Update gbest
+        pso_gbest_gpu[1, PSO_THREADS](
+            pos_dev, block_min_cost_dev, block_min_idx_dev, gbest_dev, gbest_cost_dev
         )
-        t1_ += v_t1
+        stats.lap("reduce", sync)
 
-        r1 = np.random.rand(n_particles)
-        r2 = np.random.rand(n_particles)
-        v_t2 = (
-            W * v_t2 + C1 * r1 * (pbest_t2 - t2_) + C2 * r2 * (gbest_params["t2"] - t2_)
+        # Only the scalar gbest cost goes back to the host
+        history.append(float(gbest_cost_dev.copy_to_host()[0]))
+        stats.lap("d2h")
+        stats.iteration(
+            it,
+            np.zeros(1, dtype=np.int64),
+            np.array(history[-1:]),
+            np.array([len(history) == 1 or history[-1] < history[-2]]),
         )
-        t2_ += v_t2
-
-        r1 = np.random.rand(n_particles)
-        r2 = np.random.rand(n_particles)
-        v_gamma = (
-            W * v_gamma
-            + C1 * r1 * (pbest_gamma - gamma_)
-            + C2 * r2 * (gbest_params["gamma"] - gamma_)
-        )
-        gamma_ += v_gamma
 
-        r1 = np.random.rand(n_particles)
-        r2 = np.random.rand(n_particles)
-        v_mu = (
-            W * v_mu + C1 * r1 * (pbest_mu - mu_) + C2 * r2 * (gbest_params["mu"] - mu_)
+        # Stopping criteria (on the scalar gbest cost)
+        if history[-1] < ref_cost - cost_tol * abs(ref_cost):
+            ref_cost = history[-1]
+            last_improve = it
+        if stall_iter is not None and it - last_improve >= stall_iter:
+            stop_reason = "stall"
+            break
+        if time_budget is not None and time.perf_counter() - t_start >= time_budget:
+            stop_reason = "time"
+            break
+
+        # 4) Speed and position update + clip
+        pso_move_gpu[blockspergrid, PSO_THREADS](
+            pos_dev,
+            vel_dev,
+            pbest_dev,
+            gbest_dev,
+            rng_states,
+            np.float32(W),
+            np.float32(C1),
+            np.float32(C2),
+            lower_dev,
+            upper_dev,
         )
-        mu_ += v_mu
+        stats.lap("move", sync)
 
-        # 6) clip
-        beta1 = np.clip(beta1, bounds_beta1[0], bounds_beta1[1])
-        beta2 = np.clip(beta2, bounds_beta2[0], bounds_beta2[1])
-        t1_ = np.clip(t1_, bounds_t1[0], bounds_t1[1])
-        t2_ = np.clip(t2_, bounds_t2[0], bounds_t2[1])
-        gamma_ = np.clip(gamma_, bounds_gamma[0], bounds_gamma[1])
-        mu_ = np.clip(mu_, bounds_mu[0], bounds_mu[1])
-
-        # 7) Copying back to the GPU
-        beta1_dev.copy_to_device(beta1.astype(np.float32))
-        beta2_dev.copy_to_device(beta2.astype(np.float32))
-        t1_dev.copy_to_device(t1_.astype(np.float32))
-        t2_dev.copy_to_device(t2_.astype(np.float32))
-        gamma_dev.copy_to_device(gamma_.astype(np.float32))
-        mu_dev.copy_to_device(mu_.astype(np.float32))
-
-    return gbest_params, history
+    if stats.enabled:
+        width = np.maximum(upper - lower, 1e-12)[:, None]
+        stats.final_spread([0], pos_dev.copy_to_host()[:, None, :], width)
+    stats.finish()
+    gbest = gbest_dev.copy_to_host()
+    gbest_params = {name: float(gbest[k]) for k, name in enumerate(names)}
+    info = {
+        "stop_reason": stop_reason,
+        "n_iter": len(history),
+        "n_evals": len(history) * n_particles,
+    }
+    if return_swarm:
+        info["pbest"] = pbest_dev.copy_to_host()
+        info["pbest_cost"] = pbest_cost_dev.copy_to_host()
+    return gbest_params, history, info
+
+
+def run_pso_sird_batched(
+    num_runs,
+    days,
+    D_emp,
+    I_emp=None,
+    R_emp=None,
+    S0=0.0,
+    I0=0.0,
+    R0=0.0,
+    D0=0.0,
+    dt=DT,
+    substeps=SUBSTEPS,
+    Npop=38e6,
+    n_particles=1000,
+    max_iter=50,
+    cost_type=10,
+    # bounds
+    bounds_beta1=PARAM_BOUNDS["beta1"],
+    bounds_beta2=PARAM_BOUNDS["beta2"],
+    bounds_t1=PARAM_BOUNDS["t1"],
+    bounds_t2=PARAM_BOUNDS["t2"],
+    bounds_gamma=PARAM_BOUNDS["gamma"],
+    bounds_mu=PARAM_BOUNDS["mu"],
+    # normalize
+    use_norm=False,
+    i_min=0.0,
+    i_rng=1.0,
+    r_min=0.0,
+    r_rng=1.0,
+    d_min=0.0,
+    d_rng=1.0,
+    W=W,
+    C1=C1,
+    C2=C2,
+    backend=BACKEND,
+    bounds=None,
+    seed=None,
+    # stopping criteria
+    stall_iter=None,
+    cost_tol=0.0,
+    diameter_tol=None,
+    time_budget=None,
+    restart_stall=None,
+    return_info=False,
+    windows=None,
+    integrator=INTEGRATOR,
+    stats=None,
+    cache=None,
+):
+    """
+    num_runs independent PSO runs advanced together: the population has shape
+    (n_params, num_runs, n_particles), every run keeps its own gbest and all particles
+    of all runs are evaluated in one backend call per iteration.
+    Returns a list of (gbest_params, history), one per run
+    ((gbest_params, history, info) with return_info=True).
+    Runs that meet a stopping criterion leave the swarm independently.
+
+    windows=(offsets, S0s, I0s, R0s, D0s), one entry per run (num_runs = len(offsets)):
+    D_emp/I_emp/R_emp are then the full series and run r fits the `days` long window
+    starting at offsets[r] from its own initial conditions, so one backend call
+    scores the swarms of all windows.
+    integrator: SIRD time integrator (see run_pso_sird_gpu).
+    stats: optional pso_stats.PSOStats for the whole batch (improvement and spread
+    are keyed by run index).
+    cache: optional fit_cache.FitCache for the whole batch (see run_pso_sird_gpu).
+    """
+    key = cache_key(cache, locals())
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return [tuple(fit) if return_info else tuple(fit[:2]) for fit in cached]
+    stats = NO_STATS if stats is None else stats
+
+    if I_emp is None:
+        I_emp = np.zeros_like(D_emp, dtype=np.float32)
+    if R_emp is None:
+        R_emp = np.zeros_like(D_emp, dtype=np.float32)
+    if windows is not None and len(windows[0]) != num_runs:
+        raise ValueError("windows must have one entry per run")
+
+    names, lower, upper = _bounds_table(
+        bounds_beta1,
+        bounds_beta2,
+        bounds_t1,
+        bounds_t2,
+        bounds_gamma,
+        bounds_mu,
+        bounds,
+    )
+
+    # The empirical data is uploaded once for all runs.
+    evaluate = make_cost_evaluator(
+        backend,
+        days,
+        I_emp,
+        R_emp,
+        D_emp,
+        S0,
+        I0,
+        R0,
+        D0,
+        dt,
+        substeps,
+        Npop,
+        num_runs * n_particles,
+        cost_type,
+        use_norm,
+        i_min,
+        i_rng,
+        r_min,
+        r_rng,
+        d_min,
+        d_rng,
+        windows,
+        integrator,
+        stats,
+    )
+
+    gbest, histories, infos = pso_loop(
+        evaluate,
+        lower,
+        upper,
+        num_runs,
+        n_particles,
+        max_iter,
+        W,
+        C1,
+        C2,
+        np.random.default_rng(seed),
+        stall_iter,
+        cost_tol,
+        diameter_tol,
+        time_budget,
+        restart_stall,
+        stats=stats,
+    )
+    fits = [
+        (
+            {name: float(gbest[r, k]) for k, name in enumerate(names)},
+            histories[r].tolist(),
+            infos[r],
+        )
+        for r in range(num_runs)
+    ]
+    if key is not None:
+        cache.put(key, [list(fit) for fit in fits])
+    return [fit if return_info else fit[:2] for fit in fits]
@@ -0,0 +1,125 @@
+"""Instrumentation of the PSO: wall time per phase, evaluation counts, improvement curves."""
+
+import json
+import time
+
+import numpy as np
+
+from covid_project.constants import PARAM_BOUNDS
+
+
+class PSOStats:
+    """
+    Filled by run_pso_sird_gpu / run_pso_sird_batched when passed as stats=...
+
+    - phase_time: seconds per phase ("h2d", "kernel", "d2h" for the GPU evaluator,
+      "evaluate" for the CPU ones, then "pbest", "gbest", "stopping", "rng", "move",
+      "clip", "restart"; the device-resident loop reports "kernel", "reduce", "d2h",
+      "move"),
+    - n_evals / n_iter: cost evaluations and PSO iterations in total,
+    - improvement: per run, [iteration, n_evals, gbest cost] whenever gbest improved,
+    - spread: per run, the final swarm range per parameter divided by the bound width,
+    - wall_time: seconds from start() to finish().
+    hook(stats, iteration, gbest_cost) is called after every iteration
+    (gbest_cost of the active runs).
+    """
+
+    enabled = True
+
+    def __init__(self, hook=None, param_names=None):
+        self.hook = hook
+        self.param_names = list(PARAM_BOUNDS) if param_names is None else param_names
+        self.phase_time = {}
+        self.n_evals = 0
+        self.n_iter = 0
+        self.improvement = {}
+        self.spread = {}
+        self.wall_time = 0.0
+        self._t_start = None
+        self._mark = None
+
+    def start(self):
+        self._t_start = self._mark = time.perf_counter()
+
+    def lap(self, phase, sync=None):
+        """Adds the time since the previous lap to `phase`; sync() waits for the GPU first."""
+        if sync is not None:
+            sync()
+        now = time.perf_counter()
+        self.phase_time[phase] = self.phase_time.get(phase, 0.0) + now - self._mark
+        self._mark = now
+
+    def evaluated(self, n):
+        self.n_evals += int(n)
+
+    def iteration(self, it, run_ids, gbest_cost, improved):
+        """End of iteration `it`: gbest_cost of the active runs run_ids, improved mask."""
+        self.n_iter += 1
+        for r, cost in zip(run_ids[improved], gbest_cost[improved]):
+            self.improvement.setdefault(int(r), []).append(
+                [it, self.n_evals, float(cost)]
+            )
+        if self.hook is not None:
+            self.hook(self, it, gbest_cost)
+            self._mark = time.perf_counter()  # the hook is not a PSO phase
+
+    def final_spread(self, run_ids, pos, width):
+        """pos: (n_params, len(run_ids), n_particles) swarm of the finishing runs."""
+        ranges = np.ptp(pos, axis=2) / width
+        for a, r in enumerate(run_ids):
+            self.spread[int(r)] = dict(zip(self.param_names, ranges[:, a].tolist()))
+
+    def finish(self):
+        self.wall_time = time.perf_counter() - self._t_start
+
+    def to_dict(self):
+        """JSON-ready summary."""
+        return {
+            "wall_time": self.wall_time,
+            "phase_time": dict(self.phase_time),
+            "n_evals": self.n_evals,
+            "n_iter": self.n_iter,
+            "improvement": {str(r): c for r, c in sorted(self.improvement.items())},
+            "spread": {str(r): s for r, s in sorted(self.spread.items())},
+        }
+
+
+class _NoStats:
+    """Stand-in when no stats are collected (every call is a no-op)."""
+
+    enabled = False
+
+    def start(self):
+        pass
+
+    def lap(self, phase, sync=None):
+        pass
+
+    def evaluated(self, n):
+        pass
+
+    def iteration(self, it, run_ids, gbest_cost, improved):
+        pass
+
+    def final_spread(self, run_ids, pos, width):
+        pass
+
+    def finish(self):
+        pass
+
+
+NO_STATS = _NoStats()
+
+
+def append_jsonl(path, record):
+    """Appends one JSON record (a line) to the file at path."""
+    with open(path, "a") as f:
+        f.write(json.dumps(record, default=_json_default) + "\n")
+
+
+def _json_default(x):
+    if isinstance(x, np.generic):
+        return x.item()
+    if isinstance(x, np.ndarray):
+        return x.tolist()
+    return str(x)
@@ -0,0 +1,123 @@
+"""
+Background rendering of the result figures (headless, matplotlib Agg backend).
+
+RenderPipeline starts one rendering process that takes figure jobs from a queue: a
+module-level plotting function and its arguments (e.g. a compact RunFits or a filled
+WindowEnvelope, which pickle small). submit() returns at once, so the next fit
+starts while the previous figures are drawn and saved; close() waits until the
+queue is drained and raises if a figure failed. InlineRenderer has the same
+interface and draws in the calling process (interactive, the figures are shown).
+"""
+
+import multiprocessing
+import pickle
+import queue
+import traceback
+
+import matplotlib.pyplot as plt
+
+from .plotting import plot_all_trajectories_SIRD
+
+MAX_PENDING = 8  # queued figure jobs; submit() blocks while the renderer is this far behind
+
+
+def save_trajectories(save_path, *args, show=False, **kwargs):
+    """plot_all_trajectories_SIRD(*args, **kwargs) saved to save_path."""
+    fig = plot_all_trajectories_SIRD(*args, **kwargs)
+    if fig is None:
+        return
+    if show:
+        plt.show()
+    fig.savefig(save_path)
+    plt.close(fig)
+
+
+class InlineRenderer:
+    """Draws every figure job right away in this process and shows it."""
+
+    def submit(self, function, *args, **kwargs):
+        function(*args, show=True, **kwargs)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RenderPipeline:
+    """
+    Figure jobs drawn by a separate process with the Agg backend (never shown).
+    submit(function, *args, **kwargs) calls function(*args, show=False, **kwargs)
+    there; the arguments are pickled at submit, so they may change afterwards.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING):
+        ctx = multiprocessing.get_context("spawn")
+        self._jobs = ctx.Queue(max_pending)
+        self._failures = ctx.Queue()
+        self._process = ctx.Process(
+            target=_render_loop, args=(self._jobs, self._failures), daemon=True
+        )
+        self._process.start()
+        self.submitted = 0
+        self._closed = False
+
+    def submit(self, function, *args, **kwargs):
+        if not self._process.is_alive():
+            raise RuntimeError("The rendering process is not running")
+        self._jobs.put(pickle.dumps((function, args, kwargs)))
+        self.submitted += 1
+
+    def close(self):
+        """Waits for the queued figures; RuntimeError if any of them failed."""
+        if self._closed:
+            return
+        self._closed = True
+        self._jobs.put(None)
+        failures = None
+        alive = True
+        while failures is None and alive:
+            alive = self._process.is_alive()  # its last message may still be in transit
+            try:
+                failures = self._failures.get(timeout=1.0)
+            except queue.Empty:
+                pass
+        self._process.join()
+        if failures is None or self._process.exitcode != 0:
+            raise RuntimeError(
+                f"The rendering process died (exit code {self._process.exitcode})"
+            )
+        if failures:
+            raise RuntimeError(
+                f"{len(failures)} of {self.submitted} figures failed:\n"
+                + "\n".join(failures)
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            # Do not wait for the figures of a failed run
+            self._process.terminate()
+            self._process.join()
+
+
+def _render_loop(jobs, failures_out):
+    plt.switch_backend("Agg")
+    failures = []
+    for job in iter(jobs.get, None):
+        function, args, kwargs = pickle.loads(job)
+        try:
+            function(*args, show=False, **kwargs)
+        except Exception:
+            failures.append(f"{function.__name__}: {traceback.format_exc()}")
+        finally:
+            plt.close("all")
+    failures_out.put(failures)
@@ -2,6 +2,9 @@
 
 import numpy as np
 
+from covid_project.constants import INTEGRATOR, PARAM_BOUNDS
+from covid_project.integrators import sird_advance_numpy
+
 
 def piecewise_beta(d, t1, t2, beta1, beta2):
     if d < t1:
@@ -12,59 +15,120 @@ def piecewise_beta(d, t1, t2, beta1, beta2):
     return beta2
 
 
-def simulate_sird(params, days, S0, I0, R0, D0, dt=0.5, substeps=2, Npop=38e6):
-    beta1 = params["beta1"]
-    beta2 = params["beta2"]
-    t1 = params["t1"]
-    t2 = params["t2"]
-    gamma_ = params["gamma"]
-    mu_ = params["mu"]
+def beta_curve(params_matrix, days):
+    """piecewise_beta of every parameter set over days 0..days-1: (N, days) array."""
+    params_matrix = np.asarray(params_matrix, dtype=np.float64)
+    names = list(PARAM_BOUNDS)
+    beta1, beta2, t1, t2 = (
+        params_matrix[:, [names.index(name)]] for name in ("beta1", "beta2", "t1", "t2")
+    )
+    d = np.arange(days)
+    frac = (d - t1) / np.maximum(t2 - t1, 1e-8)
+    return np.where(
+        d < t1, beta1, np.where(d < t2, beta1 + frac * (beta2 - beta1), beta2)
+    )
+
+
+def params_to_matrix(params_list):
+    """List of parameter dicts -> (N, n_params) matrix (columns in PARAM_BOUNDS order)."""
+    return np.array(
+        [[p[name] for name in PARAM_BOUNDS] for p in params_list], dtype=np.float64
+    ).reshape(-1, len(PARAM_BOUNDS))
+
+
+def forecast_params(params_matrix):
+    """
+    Parameters for the forecast after a fit: constant beta = beta2 from day 0
+    (beta1 = beta2, t1 = t2 = 0), the same gamma and mu.
+    """
+    names = list(PARAM_BOUNDS)
+    fc = np.array(params_matrix, dtype=np.float64)
+    fc[:, names.index("beta1")] = fc[:, names.index("beta2")]
+    fc[:, names.index("t1")] = 0
+    fc[:, names.index("t2")] = 0
+    return fc
+
 
-    S_arr = np.zeros(days)
-    I_arr = np.zeros(days)
-    R_arr = np.zeros(days)
-    D_arr = np.zeros(days)
+def simulate_sird_batch(
+    params_matrix,
+    days,
+    S0,
+    I0,
+    R0,
+    D0,
+    dt=0.5,
+    substeps=2,
+    Npop=38e6,
+    out=None,
+    integrator=INTEGRATOR,
+):
+    """
+    Simulation of N parameter sets at once, with the given integrator
+    ("euler", "rk2", "rk4" or "rk45", see integrators.py).
+    params_matrix: (N, n_params) array (columns in PARAM_BOUNDS order) or a list of dicts.
+    S0, I0, R0, D0: scalars or (N,) arrays (e.g. different start states for forecasts).
+    Returns an (N, 4, days) array with S, I, R, D at the start of every day
+    (written into `out` if given, e.g. a float32 or memory-mapped block).
+    """
+    if not isinstance(params_matrix, np.ndarray):
+        params_matrix = params_to_matrix(params_matrix)
+    params_matrix = np.asarray(params_matrix, dtype=np.float64)
+    beta1, beta2, t1, t2, gamma_, mu_ = params_matrix.T
+    N = params_matrix.shape[0]
 
-    S = S0
-    I = I0
-    R = R0
-    D = D0
+    if out is None:
+        out = np.zeros((N, 4, days))
 
+    S = np.array(np.broadcast_to(S0, N), dtype=np.float64)
+    I = np.array(np.broadcast_to(I0, N), dtype=np.float64)
+    R = np.array(np.broadcast_to(R0, N), dtype=np.float64)
+    D = np.array(np.broadcast_to(D0, N), dtype=np.float64)
+
+    span = t2 - t1 + 1e-8
     for day_idx in range(days):
-        S_arr[day_idx] = S
-        I_arr[day_idx] = I
-        R_arr[day_idx] = R
-        D_arr[day_idx] = D
-
-        for _ in range(substeps):
-            if day_idx < t1:
-                beta_t = beta1
-            elif day_idx < t2:
-                frac = (day_idx - t1) / (t2 - t1 + 1e-8)
-                beta_t = beta1 + frac * (beta2 - beta1)
-            else:
-                beta_t = beta2
-
-            dS = -beta_t * (S * I / Npop)
-            dI = beta_t * (S * I / Npop) - (gamma_ + mu_) * I
-            dR = gamma_ * I
-            dD = mu_ * I
-
-            S_new = S + dS * dt
-            I_new = I + dI * dt
-            R_new = R + dR * dt
-            D_new = D + dD * dt
-
-            S_new = max(S_new, 0)
-            I_new = max(I_new, 0)
-            R_new = max(R_new, 0)
-            D_new = max(D_new, 0)
-
-            S_new = min(S_new, 1e15)
-            I_new = min(I_new, 1e15)
-            R_new = min(R_new, 1e15)
-            D_new = min(D_new, 1e15)
-
-            S, I, R, D = S_new, I_new, R_new, D_new
+        out[:, 0, day_idx] = S
+        out[:, 1, day_idx] = I
+        out[:, 2, day_idx] = R
+        out[:, 3, day_idx] = D
+
+        # beta(t) - stałe w obrębie dnia
+        frac = (day_idx - t1) / span
+        beta_t = np.where(
+            day_idx < t1,
+            beta1,
+            np.where(day_idx < t2, beta1 + frac * (beta2 - beta1), beta2),
+        )
+
+        S, I, R, D = sird_advance_numpy(
+            integrator, S, I, R, D, beta_t, gamma_, mu_, Npop, dt, substeps
+        )
+
+    return out
+
 
+def simulate_sird(
+    params,
+    days,
+    S0,
+    I0,
+    R0,
+    D0,
+    dt=0.5,
+    substeps=2,
+    Npop=38e6,
+    integrator=INTEGRATOR,
+):
+    """Single parameter set (dict); returns the S, I, R, D arrays."""
+    S_arr, I_arr, R_arr, D_arr = simulate_sird_batch(
+        [params],
+        days,
+        S0,
+        I0,
+        R0,
+        D0,
+        dt=dt,
+        substeps=substeps,
+        Npop=Npop,
+        integrator=integrator,
+    )[0]
     return S_arr, I_arr, R_arr, D_arr
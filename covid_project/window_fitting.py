@@ -1,9 +1,102 @@
 import numpy as np
 
 
-from .pso_fitting import run_pso_sird_gpu
-from .sird_simulation import simulate_sird
-from covid_project.constants import DT, SUBSTEPS, NUM_PARTICLES, MAX_ITER
+from .pso_fitting import run_pso_sird_gpu, run_pso_sird_batched
+from .checkpoint import Checkpoint, job_signature
+from .data_loader import as_country_series
+from .fit_results import RunFits, WindowFits
+from .pso_stats import PSOStats, append_jsonl
+from .sird_simulation import (
+    params_to_matrix,
+)
+from covid_project.constants import (
+    DT,
+    SUBSTEPS,
+    NUM_PARTICLES,
+    MAX_ITER,
+    BACKEND,
+    INTEGRATOR,
+    RUNS_PER_BATCH,
+    PARAM_BOUNDS,
+)
+
+
+# window_wise_fitting arguments that do not change the fits (left out of the
+# checkpoint signature; the data of df is signed separately)
+_UNSIGNED_ARGS = (
+    "df",
+    "stats_path",
+    "cache",
+    "checkpoint",
+    "resume",
+    "compact",
+    "envelope",
+)
+
+
+def window_data(I_emp, R_emp, D_emp, population, rescale=False):
+    """
+    PSO keyword arguments of the data of one window: days, the I/R/D series and the
+    initial state S0..D0. rescale=True: the series scaled to [0, 1], with their
+    minimum and range (i_min, i_rng, ...).
+    """
+    I0, R0, D0 = I_emp[0], R_emp[0], D_emp[0]
+    data = dict(
+        days=len(I_emp),
+        I_emp=I_emp,
+        R_emp=R_emp,
+        D_emp=D_emp,
+        S0=population - (I0 + R0 + D0),
+        I0=I0,
+        R0=R0,
+        D0=D0,
+    )
+    if rescale:
+        for name, emp in (("i", I_emp), ("r", R_emp), ("d", D_emp)):
+            lo = emp.min()
+            rng = max(emp.max() - lo, 1e-6)
+            data[f"{name.upper()}_emp"] = (emp - lo) / rng
+            data[f"{name}_min"], data[f"{name}_rng"] = lo, rng
+    return data
+
+
+def multi_run_settings(
+    population,
+    use_norm,
+    n_particles,
+    max_iter,
+    cost_type,
+    dt,
+    substeps,
+    backend,
+    integrator,
+    cache,
+):
+    """PSO keyword arguments of multiple_runs_fit_sird other than the data."""
+    return dict(
+        dt=dt,
+        substeps=substeps,
+        Npop=population,
+        n_particles=n_particles,
+        max_iter=max_iter,
+        cost_type=cost_type,
+        use_norm=use_norm,
+        i_min=0.0,
+        i_rng=1.0,
+        r_min=0.0,
+        r_rng=1.0,
+        d_min=0.0,
+        d_rng=1.0,
+        backend=backend,
+        integrator=integrator,
+        cache=cache,
+    )
+
+
+def _dump_stats(stats_path, stats, record, **extra):
+    """Appends record + extra + the PSOStats summary to the JSONL file (if stats_path)."""
+    if stats_path is not None:
+        append_jsonl(stats_path, {**record, **extra, **stats.to_dict()})
 
 
 def multiple_runs_fit_sird(
@@ -19,131 +112,242 @@ def multiple_runs_fit_sird(
     population=38e6,
     DT=DT,
     SUBSTEPS=SUBSTEPS,
+    backend=BACKEND,
+    batched=False,
+    runs_per_batch=RUNS_PER_BATCH,
+    pso_options=None,
+    integrator=INTEGRATOR,
+    stats_path=None,
+    seed=None,
+    cache=None,
+    checkpoint=None,
+    resume=False,
+    compact=False,
 ):
     """
     Performs num_runs of PSO matches in the selected [start_date..end_date] window.
     Returns a list (S,I,R,D) of length (days_window + forecast_days) for each trial.
+    df: DataFrame (load_covid_data) or data_loader.CountrySeries (load_country).
+    With batched=True, runs_per_batch runs are advanced together as one swarm
+    (run_pso_sird_batched) instead of calling the PSO num_runs times.
+    pso_options: extra keyword arguments for the PSO (e.g. stall_iter, cost_tol).
+    integrator: SIRD time integrator of the fit and of the trajectories
+    ("euler", "rk2", "rk4" or "rk45").
+    stats_path: if given, a pso_stats.PSOStats record of every PSO call (each run,
+    or each batch with batched=True) is appended to this JSONL file.
+    seed: seeds the PSO runs (a different derived seed per run/batch); only seeded
+    fits are stored in / reused from `cache` (fit_cache.FitCache).
+    checkpoint: path of an append-only checkpoint file (checkpoint.Checkpoint); every
+    finished run (or batch) is recorded there with the RNG state. With resume=True
+    the runs already in the file are not fitted again.
+    compact=True: returns a fit_results.RunFits (parameter matrix, initial state and
+    costs only; the trajectories are simulated on demand) instead of the list.
     """
-    dfw = df[(df["Last_Update"] >= start_date) & (df["Last_Update"] <= end_date)].copy()
-    dfw.reset_index(drop=True, inplace=True)
-    days_window = len(dfw)
+    window = as_country_series(df).between(start_date, end_date)
+    days_window = len(window)
     if days_window < 2:
         print("Za mało danych w oknie:", start_date, end_date)
+        if compact:
+            return RunFits.empty(
+                days_window,
+                forecast_days,
+                dt=DT,
+                substeps=SUBSTEPS,
+                population=population,
+                integrator=integrator,
+            )
         return []
 
-    I_emp = dfw["Active"].values.astype(float)
-    R_emp = dfw["Recovered"].values.astype(float)
-    D_emp = dfw["Deaths"].values.astype(float)
-
-    # Initial conditions
-    row0 = dfw.iloc[0]
-    S0 = population - (row0["Active"] + row0["Recovered"] + row0["Deaths"])
-    I0 = row0["Active"]
-    R0 = row0["Recovered"]
-    D0 = row0["Deaths"]
-
-    # Normalize
-    if use_norm:
-        i_min, i_max = I_emp.min(), I_emp.max()
-        r_min, r_max = R_emp.min(), R_emp.max()
-        d_min, d_max = D_emp.min(), D_emp.max()
-        i_rng = max(i_max - i_min, 1e-6)
-        r_rng = max(r_max - r_min, 1e-6)
-        d_rng = max(d_max - d_min, 1e-6)
-
-        I_emp_norm = (I_emp - i_min) / i_rng
-        R_emp_norm = (R_emp - r_min) / r_rng
-        D_emp_norm = (D_emp - d_min) / d_rng
-    else:
-        I_emp_norm = I_emp
-        R_emp_norm = R_emp
-        D_emp_norm = D_emp
-        i_min, i_rng = 0.0, 1.0
-        r_min, r_rng = 0.0, 1.0
-        d_min, d_rng = 0.0, 1.0
-
-    all_trajectories = []
-    for run_idx in range(num_runs):
-        gbest_params, hist = run_pso_sird_gpu(
-            days=days_window,
-            D_emp=D_emp_norm,
-            I_emp=I_emp_norm,
-            R_emp=R_emp_norm,
-            S0=S0,
-            I0=I0,
-            R0=R0,
-            D0=D0,
-            dt=DT,
-            substeps=SUBSTEPS,
-            Npop=population,
-            n_particles=n_particles,
-            max_iter=max_iter,
-            cost_type=cost_type,
-            use_norm=use_norm,
-            i_min=i_min,
-            i_rng=i_rng,
-            r_min=r_min,
-            r_rng=r_rng,
-            d_min=d_min,
-            d_rng=d_rng,
-        )
+    data = window_data(
+        window.active, window.recovered, window.deaths, population, use_norm
+    )
+    S0, I0, R0, D0 = (data[name] for name in ("S0", "I0", "R0", "D0"))
+    pso_kwargs = {
+        **multi_run_settings(
+            population,
+            use_norm,
+            n_particles,
+            max_iter,
+            cost_type,
+            DT,
+            SUBSTEPS,
+            backend,
+            integrator,
+            cache if seed is not None else None,
+        ),
+        **data,
+        **(pso_options or {}),
+    }
+    rng = np.random.default_rng(seed)
+
+    def run_seed():
+        return None if seed is None else rng.integers(2**63)
 
-        # “Fit in the window” simulation
-        S_fit, I_fit, R_fit, D_fit = simulate_sird(
-            gbest_params,
-            days_window,
-            S0,
-            I0,
-            R0,
-            D0,
-            dt=DT,
-            substeps=SUBSTEPS,
-            Npop=population,
+    record = dict(
+        source="multiple_runs_fit_sird",
+        start_date=str(start_date),
+        end_date=str(end_date),
+        backend=backend,
+        integrator=integrator,
+        n_particles=n_particles,
+        max_iter=max_iter,
+    )
+
+    ckpt = None
+    if checkpoint is not None:
+        ckpt = Checkpoint(
+            checkpoint,
+            job_signature(
+                **{k: v for k, v in pso_kwargs.items() if k != "cache"},
+                batched=batched,
+                runs_per_batch=runs_per_batch,
+                seed=seed,
+            ),
+            resume=resume,
         )
+        ckpt.restore_rng(rng)
 
-        # Forecast
-        if forecast_days > 0:
-            s_last = S_fit[-1]
-            i_last = I_fit[-1]
-            r_last = R_fit[-1]
-            d_last = D_fit[-1]
-
-            beta2 = gbest_params["beta2"]
-            gamma_ = gbest_params["gamma"]
-            mu_ = gbest_params["mu"]
-            tmp_params = {
-                "beta1": beta2,
-                "beta2": beta2,
-                "t1": 0,
-                "t2": 0,
-                "gamma": gamma_,
-                "mu": mu_,
-            }
-            S_ext, I_ext, R_ext, D_ext = simulate_sird(
-                tmp_params,
-                forecast_days,
-                s_last,
-                i_last,
-                r_last,
-                d_last,
-                dt=DT,
-                substeps=SUBSTEPS,
-                Npop=population,
-            )
+    # Units of work: single runs, or batches of runs_per_batch runs
+    unit = runs_per_batch if batched else 1
+    fits = []
+    for first_run in range(0, num_runs, unit):
+        batch_runs = min(unit, num_runs - first_run)
+        done = ckpt.done.get(first_run) if ckpt is not None else None
+        if done is not None and len(done["fits"]) == batch_runs:
+            fits.extend(tuple(fit) for fit in done["fits"])
+            continue
 
-            S_full = np.concatenate([S_fit, S_ext])
-            I_full = np.concatenate([I_fit, I_ext])
-            R_full = np.concatenate([R_fit, R_ext])
-            D_full = np.concatenate([D_fit, D_ext])
+        stats = PSOStats() if stats_path else None
+        if batched:
+            batch_fits = run_pso_sird_batched(
+                batch_runs, stats=stats, seed=run_seed(), **pso_kwargs
+            )
         else:
-            S_full = S_fit
-            I_full = I_fit
-            R_full = R_fit
-            D_full = D_fit
+            batch_fits = [run_pso_sird_gpu(stats=stats, seed=run_seed(), **pso_kwargs)]
+        fits.extend(batch_fits)
+        _dump_stats(stats_path, stats, record, first_run=first_run, num_runs=batch_runs)
+        if ckpt is not None:
+            ckpt.save(first_run, rng, fits=[list(fit) for fit in batch_fits])
+
+    result = RunFits(
+        params_to_matrix([gbest_params for gbest_params, *_ in fits]),
+        (S0, I0, R0, D0),
+        [hist[-1] for _, hist, *_ in fits],
+        days_window,
+        forecast_days,
+        dt=DT,
+        substeps=SUBSTEPS,
+        population=population,
+        integrator=integrator,
+    )
+    return result if compact else result.to_list()
 
-        all_trajectories.append((S_full, I_full, R_full, D_full))
 
-    return all_trajectories
+def _warm_start_swarm(pbest, pbest_cost, step, n_seeds, spread, rng):
+    """
+    Seeds for the next window: the n_seeds best pbest particles of the previous
+    window with t1/t2 shifted by -step (the window moved forward by step days)
+    and a Gaussian jitter of spread * bound width (the best particle is kept exact).
+    """
+    names = list(PARAM_BOUNDS)
+    order = np.argsort(pbest_cost)[:n_seeds]
+    seeds = pbest[:, order].astype(np.float64)
+    seeds[names.index("t1")] -= step
+    seeds[names.index("t2")] -= step
+
+    width = np.array([hi - lo for lo, hi in PARAM_BOUNDS.values()])
+    seeds[:, 1:] += rng.normal(0.0, spread, seeds[:, 1:].shape) * width[:, None]
+    return seeds.astype(np.float32)
+
+
+def _fit_windows_batched(
+    offsets, initial, series, window_size, seed, pso_options, pso_kwargs, stats_path
+):
+    """The batched PSO of all windows (offsets, initial (S0s, I0s, R0s, D0s))."""
+    D_full, I_full, R_full = series
+    stats = PSOStats() if stats_path else None
+    fits = run_pso_sird_batched(
+        offsets.size,
+        days=window_size,
+        D_emp=D_full,
+        I_emp=I_full,
+        R_emp=R_full,
+        windows=(offsets, *initial),
+        seed=seed,
+        stats=stats,
+        **{**pso_kwargs, **(pso_options or {})},
+    )
+    _dump_stats(
+        stats_path,
+        stats,
+        dict(
+            source="window_wise_fitting",
+            backend=pso_kwargs["backend"],
+            integrator=pso_kwargs["integrator"],
+            n_particles=pso_kwargs["n_particles"],
+            max_iter=pso_kwargs["max_iter"],
+        ),
+        start_days=offsets.tolist(),
+    )
+    return fits
+
+
+def _window_wise_fitting_batched(
+    series,
+    population,
+    window_size,
+    step,
+    seed,
+    pso_options,
+    pso_kwargs,
+    stats_path,
+    ckpt,
+    compact,
+    envelope,
+):
+    """window_wise_fitting(batched=True): all windows in one batched PSO."""
+    T = len(series)
+    I_full, R_full, D_full = series.active, series.recovered, series.deaths
+
+    # Offsets and initial conditions of every window
+    offsets = np.arange(0, T - window_size + 1, step)
+    if offsets.size == 0:
+        return WindowFits.empty(window_size) if compact else []
+    I0s = I_full[offsets]
+    R0s = R_full[offsets]
+    D0s = D_full[offsets]
+    S0s = population - (I0s + R0s + D0s)
+
+    if ckpt is not None and 0 in ckpt.done:
+        fits = [tuple(fit) for fit in ckpt.done[0]["fits"]]
+    else:
+        fits = _fit_windows_batched(
+            offsets,
+            (S0s, I0s, R0s, D0s),
+            (D_full, I_full, R_full),
+            window_size,
+            seed,
+            pso_options,
+            pso_kwargs,
+            stats_path,
+        )
+        if ckpt is not None:
+            ckpt.save(0, fits=[list(fit) for fit in fits])
+
+    result = WindowFits(
+        offsets,
+        params_to_matrix([gbest_params for gbest_params, *_ in fits]),
+        np.column_stack([S0s, I0s, R0s, D0s]),
+        [hist[-1] for _, hist, *_ in fits],
+        window_size,
+        dt=pso_kwargs["dt"],
+        substeps=pso_kwargs["substeps"],
+        population=population,
+        integrator=pso_kwargs["integrator"],
+    )
+    if envelope is not None:
+        envelope.add_fits(result)
+    return result if compact else result.to_list([hist for _, hist, *_ in fits])
 
 
 def window_wise_fitting(
@@ -163,80 +367,202 @@ def window_wise_fitting(
     d_rng=1.0,
     DT=DT,
     SUBSTEPS=SUBSTEPS,
+    backend=BACKEND,
+    pso_options=None,
+    seed=None,
+    warm_start=False,
+    warm_fraction=0.5,
+    warm_n_particles=None,
+    warm_max_iter=None,
+    warm_spread=0.02,
+    batched=False,
+    integrator=INTEGRATOR,
+    stats_path=None,
+    cache=None,
+    checkpoint=None,
+    resume=False,
+    compact=False,
+    envelope=None,
 ):
     """
     We take a window of 36 days, move every 3 days,
     we adjust the SIRD parameters in this window to I,R,D with cost_type=30 (MXSE(IRD)).
+    df: DataFrame (load_covid_data) or data_loader.CountrySeries (load_country).
+    pso_options: extra keyword arguments for run_pso_sird_gpu (e.g. stall_iter, cost_tol).
+
+    warm_start=True: only the first window starts from a uniform random swarm.
+    Every next window runs with a smaller budget (warm_n_particles, default
+    n_particles // 4; warm_max_iter, default max_iter // 2) and warm_fraction of
+    its particles are seeded from the best pbests of the previous window
+    (see _warm_start_swarm), the rest stays uniform for exploration.
+
+    batched=True: the full I/R/D series is loaded once and the swarms of all windows
+    are fitted together (run_pso_sird_batched with windows=...), one backend call
+    per iteration for every window.
+
+    integrator: SIRD time integrator ("euler", "rk2", "rk4" or "rk45").
+    stats_path: if given, a pso_stats.PSOStats record of every window (or of the whole
+    batch, with the window start days) is appended to this JSONL file.
+    cache: fit_cache.FitCache for the window fits; used only when `seed` is given
+    (the fits are then reproducible).
+    checkpoint: path of a checkpoint.Checkpoint file; every finished window (the whole
+    batch with batched=True) is recorded in it. resume=True skips the windows already
+    recorded there by a previous, interrupted call with the same inputs.
+    compact=True: returns a fit_results.WindowFits (start days, parameter matrix,
+    initial states and final costs; S_fit..D_fit are simulated on demand) instead
+    of the list of dicts.
+    envelope: an envelope.WindowEnvelope (n_days = len(df)) that every window is
+    added to as soon as it is fitted; the plotting functions accept it directly.
     """
-    T = len(df)
-    results = []
+    inputs = {k: v for k, v in locals().items() if k not in _UNSIGNED_ARGS}
+    series = as_country_series(df)
+    ckpt = None
+    if checkpoint is not None:
+        data = [series.active, series.recovered, series.deaths]
+        ckpt = Checkpoint(checkpoint, job_signature(data=data, **inputs), resume=resume)
 
-    for start_day in range(0, T - window_size + 1, step):
-        df_window = df.iloc[start_day : start_day + window_size]
+    cache = cache if seed is not None else None
+    T = len(series)
 
-        D_emp = df_window["Deaths"].values
-        I_emp = (
-            df_window["Active"].values
-            if "Active" in df_window.columns
-            else np.zeros_like(D_emp)
-        )
-        R_emp = (
-            df_window["Recovered"].values
-            if "Recovered" in df_window.columns
-            else np.zeros_like(D_emp)
+    # PSO keyword arguments of every window other than its data
+    settings = dict(
+        dt=DT,
+        substeps=SUBSTEPS,
+        Npop=population,
+        n_particles=n_particles,
+        max_iter=max_iter,
+        cost_type=cost_type,
+        use_norm=use_norm,
+        i_min=i_min,
+        i_rng=i_rng,
+        r_min=r_min,
+        r_rng=r_rng,
+        d_min=d_min,
+        d_rng=d_rng,
+        backend=backend,
+        integrator=integrator,
+        cache=cache,
+    )
+
+    if batched:
+        if warm_start:
+            raise ValueError("warm_start and batched cannot be combined")
+        return _window_wise_fitting_batched(
+            series,
+            population,
+            window_size,
+            step,
+            seed,
+            pso_options,
+            settings,
+            stats_path,
+            ckpt,
+            compact,
+            envelope,
         )
 
+    rng = np.random.default_rng(seed)
+    if ckpt is not None:
+        ckpt.restore_rng(rng)
+    if warm_n_particles is None:
+        warm_n_particles = max(n_particles // 4, 1)
+    if warm_max_iter is None:
+        warm_max_iter = max(max_iter // 2, 1)
+    warm_pos = None
+
+    start_days, fitted_params, initial, hists = [], [], [], []
+    for start_day in range(0, T - window_size + 1, step):
+        window = series[start_day : start_day + window_size]
+        I_emp, R_emp, D_emp = window.active, window.recovered, window.deaths
+
         # Initial conditions
-        row_0 = df_window.iloc[0]
-        S0 = population - (row_0["Active"] + row_0["Recovered"] + row_0["Deaths"])
-        I0 = row_0["Active"]
-        R0 = row_0["Recovered"]
-        D0 = row_0["Deaths"]
-
-        gbest_params, hist = run_pso_sird_gpu(
-            days=window_size,
-            D_emp=D_emp,
-            I_emp=I_emp,
-            R_emp=R_emp,
-            S0=S0,
-            I0=I0,
-            R0=R0,
-            D0=D0,
-            dt=DT,
-            substeps=SUBSTEPS,
-            Npop=population,
-            n_particles=n_particles,
-            max_iter=max_iter,
-            cost_type=cost_type,
-            use_norm=use_norm,
-            i_min=i_min,
-            i_rng=i_rng,
-            r_min=r_min,
-            r_rng=r_rng,
-            d_min=d_min,
-            d_rng=d_rng,
-        )
+        I0, R0, D0 = I_emp[0], R_emp[0], D_emp[0]
+        S0 = population - (I0 + R0 + D0)
 
-        S_fit, I_fit, R_fit, D_fit = simulate_sird(
-            gbest_params,
-            window_size,
-            S0,
-            I0,
-            R0,
-            D0,
-            dt=DT,
-            substeps=SUBSTEPS,
-            Npop=population,
-        )
+        done = ckpt.done.get(start_day) if ckpt is not None else None
+        if done is not None:
+            gbest_params, hist = done["best_params"], done["cost_history"]
+            if warm_start:
+                warm_pos = np.asarray(done["warm_pos"], dtype=np.float32)
+        else:
+            pso_kwargs = {
+                **settings,
+                **window_data(I_emp, R_emp, D_emp, population),
+                "seed": rng.integers(2**63),
+            }
+            if warm_start:
+                pso_kwargs.update(return_info=True, return_swarm=True)
+                if warm_pos is not None:
+                    pso_kwargs.update(
+                        n_particles=warm_n_particles,
+                        max_iter=warm_max_iter,
+                        init_pos=warm_pos,
+                    )
+            pso_kwargs.update(pso_options or {})
+
+            stats = PSOStats() if stats_path else None
+            gbest_params, hist, *info = run_pso_sird_gpu(stats=stats, **pso_kwargs)
+            _dump_stats(
+                stats_path,
+                stats,
+                dict(
+                    source="window_wise_fitting",
+                    backend=backend,
+                    integrator=integrator,
+                    n_particles=pso_kwargs["n_particles"],
+                    max_iter=pso_kwargs["max_iter"],
+                ),
+                start_day=start_day,
+            )
+
+            if warm_start:
+                warm_pos = _warm_start_swarm(
+                    info[0]["pbest"],
+                    info[0]["pbest_cost"],
+                    step,
+                    max(int(warm_fraction * warm_n_particles), 1),
+                    warm_spread,
+                    rng,
+                )
+            if ckpt is not None:
+                ckpt.save(
+                    start_day,
+                    rng,
+                    best_params=gbest_params,
+                    cost_history=hist,
+                    warm_pos=warm_pos.tolist() if warm_start else None,
+                )
+
+        start_days.append(start_day)
+        fitted_params.append(gbest_params)
+        initial.append((S0, I0, R0, D0))
+        hists.append(hist)
+        if envelope is not None:
+            envelope.add_fits(
+                WindowFits(
+                    [start_day],
+                    params_to_matrix([gbest_params]),
+                    (S0, I0, R0, D0),
+                    [hist[-1]],
+                    window_size,
+                    dt=DT,
+                    substeps=SUBSTEPS,
+                    population=population,
+                    integrator=integrator,
+                )
+            )
 
-        results.append({
-            "start_day": start_day,
-            "best_params": gbest_params,
-            "cost_history": hist,
-            "S_fit": S_fit,
-            "I_fit": I_fit,
-            "R_fit": R_fit,
-            "D_fit": D_fit,
-        })
-
-    return results
+    if not start_days:
+        return WindowFits.empty(window_size) if compact else []
+    result = WindowFits(
+        start_days,
+        params_to_matrix(fitted_params),
+        initial,
+        [hist[-1] for hist in hists],
+        window_size,
+        dt=DT,
+        substeps=SUBSTEPS,
+        population=population,
+        integrator=integrator,
+    )
+    return result if compact else result.to_list(hists)
@@ -0,0 +1,464 @@
+"""
+Distributed fitting over a durable work queue in a SQLite file.
+
+The coordinator plans the jobs of the study (executor.plan_runs / plan_windows: one
+task per batch of runs or per window, with its seed and PSO settings) and stores
+them, together with the I/R/D columns of the countries, in the queue database.
+Any number of workers, on any node that can open the file, lease one task at a
+time, fit it (run_pso_sird_batched / run_pso_sird_gpu, on the CPU or a GPU) and post
+the parameter matrix and costs back. A lease expires after lease_seconds unless
+the worker's heartbeat renews it, so the task of a crashed or killed worker is
+handed out again; a task that raised is retried up to max_attempts times. The seeds
+are fixed at submission, so the results do not depend on which worker fitted what.
+
+SQLite needs working file locks: put the database on a local disk (workers on the
+same node) or on a shared filesystem with reliable locking.
+
+Command line (run from the repository root):
+
+    python -m covid_project.work_queue submit --db queue.sqlite --backend numba
+    python -m covid_project.work_queue work --db queue.sqlite  (any number, any node)
+    python -m covid_project.work_queue status --db queue.sqlite
+    python -m covid_project.work_queue collect --db queue.sqlite
+
+`collect` draws the figures of every country whose jobs are all finished into
+results/<results_dir>/ (as batch.py does) and updates the results manifest.
+"""
+
+import argparse
+import io
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+import numpy as np
+
+from .batch import country_jobs, discover_countries, load_config, plot_country
+from .data_loader import COLUMNS, CountrySeries, country_csv, load_country
+from .executor import PLANNERS, run_task
+from .fit_cache import FitCache
+from .manifest import ResultsManifest
+from covid_project.constants import (
+    COUNTRY_CONFIG,
+    DATA_DIR,
+    MAX_ITER,
+    NUM_PARTICLES,
+    PARAM_BOUNDS,
+    RESULTS_DIR,
+    RUNS_PER_BATCH,
+)
+
+LEASE_SECONDS = 300.0  # a task is handed out again if its lease is not renewed
+MAX_ATTEMPTS = 3  # leases of a task before it is marked failed
+POLL_SECONDS = 5.0  # wait of an idle worker while other workers hold leases
+BACKENDS = ("cuda", "numba", "numpy")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    key TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    country TEXT NOT NULL,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    options TEXT NOT NULL,
+    UNIQUE (country, name)
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    job_id INTEGER NOT NULL REFERENCES jobs (id),
+    idx INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_until REAL,
+    result TEXT,
+    error TEXT,
+    UNIQUE (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_until);
+"""
+
+
+class WorkQueue:
+    """
+    The queue database at path (created if missing). One connection per object,
+    so use one WorkQueue per thread.
+    """
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._db = sqlite3.connect(path, timeout=60.0, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._series = {}
+
+    def close(self):
+        self._db.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction (BEGIN IMMEDIATE: one writer at a time, no deadlocks)."""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def add_series(self, key, series):
+        """Stores the dates and columns of a CountrySeries under key."""
+        buf = io.BytesIO()
+        np.savez(buf, dates=series.dates.view(np.int64), **series.columns)
+        with self._transaction():
+            self._db.execute(
+                "INSERT OR REPLACE INTO series (key, data) VALUES (?, ?)",
+                (key, buf.getvalue()),
+            )
+        self._series.pop(key, None)
+
+    def series(self, key):
+        """The CountrySeries stored under key (read once per WorkQueue)."""
+        if key not in self._series:
+            (data,) = self._db.execute(
+                "SELECT data FROM series WHERE key = ?", (key,)
+            ).fetchone()
+            with np.load(io.BytesIO(data)) as arrays:
+                self._series[key] = CountrySeries(
+                    arrays["dates"].view("datetime64[ns]"),
+                    {name: arrays[name] for name in COLUMNS},
+                )
+        return self._series[key]
+
+    def submit(self, country, name, kind, key, options):
+        """
+        Plans the job `name` of a country (kind "runs" or "windows", see
+        executor.PLANNERS; the series `key` must be stored) and enqueues its tasks.
+        A job that is already in the queue is left as it is. Returns its id.
+        """
+        row = self._db.execute(
+            "SELECT id FROM jobs WHERE country = ? AND name = ?", (country, name)
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        tasks, _ = PLANNERS[kind](self.series(key), key, **options)
+        with self._transaction():
+            job_id = self._db.execute(
+                "INSERT INTO jobs (country, name, kind, key, options) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (country, name, kind, key, json.dumps(options)),
+            ).lastrowid
+            self._db.executemany(
+                "INSERT INTO tasks (job_id, idx, payload) VALUES (?, ?, ?)",
+                [(job_id, idx, json.dumps(task)) for idx, task in enumerate(tasks)],
+            )
+        return job_id
+
+    def lease(self, owner):
+        """
+        (task id, task) of the next pending task (or of one whose lease expired),
+        leased to owner; None if there is none right now.
+        """
+        now = time.time()
+        with self._transaction():
+            while True:
+                row = self._db.execute(
+                    "SELECT id, payload, attempts FROM tasks WHERE status = 'pending' "
+                    "OR (status = 'leased' AND lease_until < ?) ORDER BY id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    return None
+                task_id, payload, attempts = row
+                if attempts >= self.max_attempts:
+                    self._db.execute(
+                        "UPDATE tasks SET status = 'failed', owner = NULL, error = ? "
+                        "WHERE id = ?",
+                        (f"lease expired after {attempts} attempts", task_id),
+                    )
+                    continue
+                self._db.execute(
+                    "UPDATE tasks SET status = 'leased', owner = ?, lease_until = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (owner, now + self.lease_seconds, task_id),
+                )
+                return task_id, tuple(json.loads(payload))
+
+    def renew(self, task_id, owner):
+        """Extends the lease of owner's task; False if owner lost it."""
+        with self._transaction():
+            cursor = self._db.execute(
+                "UPDATE tasks SET lease_until = ? "
+                "WHERE id = ? AND owner = ? AND status = 'leased'",
+                (time.time() + self.lease_seconds, task_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, task_id, owner, params, cost):
+        """Posts the result of owner's task; False if the lease was lost meanwhile."""
+        result = json.dumps({"params": params.tolist(), "cost": cost.tolist()})
+        with self._transaction():
+            cursor = self._db.execute(
+                "UPDATE tasks SET status = 'done', result = ?, lease_until = NULL "
+                "WHERE id = ? AND owner = ? AND status = 'leased'",
+                (result, task_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, task_id, owner, error):
+        """Gives owner's task back (retried) or marks it failed after max_attempts."""
+        with self._transaction():
+            self._db.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts < ? THEN 'pending' "
+                "ELSE 'failed' END, owner = NULL, lease_until = NULL, error = ? "
+                "WHERE id = ? AND owner = ? AND status = 'leased'",
+                (self.max_attempts, error, task_id, owner),
+            )
+
+    def counts(self):
+        """{status: number of tasks}."""
+        rows = self._db.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")
+        return dict(rows.fetchall())
+
+    def unfinished(self):
+        """Number of tasks still pending or leased."""
+        counts = self.counts()
+        return counts.get("pending", 0) + counts.get("leased", 0)
+
+    def failures(self):
+        """[(country, job, task index, error)] of the failed tasks."""
+        return self._db.execute(
+            "SELECT jobs.country, jobs.name, tasks.idx, tasks.error FROM tasks "
+            "JOIN jobs ON jobs.id = tasks.job_id WHERE tasks.status = 'failed'"
+        ).fetchall()
+
+    def finished_jobs(self):
+        """{country: {job name: result}} of the jobs whose tasks are all done."""
+        jobs = {}
+        for job_id, country, name, kind, key, options in self._db.execute(
+            "SELECT id, country, name, kind, key, options FROM jobs WHERE NOT EXISTS "
+            "(SELECT 1 FROM tasks WHERE tasks.job_id = jobs.id "
+            "AND tasks.status != 'done') ORDER BY id"
+        ).fetchall():
+            _, assemble = PLANNERS[kind](self.series(key), key, **json.loads(options))
+            results = self._db.execute(
+                "SELECT result FROM tasks WHERE job_id = ? ORDER BY idx", (job_id,)
+            )
+            parts = []
+            for (result,) in results:
+                result = json.loads(result)
+                parts.append(
+                    (
+                        np.array(result["params"]).reshape(-1, len(PARAM_BOUNDS)),
+                        np.array(result["cost"]),
+                    )
+                )
+            jobs.setdefault(country, {})[name] = assemble(parts)
+        return jobs
+
+
+def work(
+    path, owner=None, backend=None, cache=None, poll=POLL_SECONDS, **queue_options
+):
+    """
+    Worker loop: leases and fits tasks of the queue at path until none is pending or
+    leased. backend: overrides the planned backend (e.g. "cuda" on a GPU node).
+    Returns the number of tasks this worker finished.
+    """
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+    queue = WorkQueue(path, **queue_options)
+    finished = 0
+    while True:
+        leased = queue.lease(owner)
+        if leased is None:
+            if queue.unfinished() == 0:
+                break
+            time.sleep(poll)  # other workers hold leases that may still expire
+            continue
+        task_id, task = leased
+        series = queue.series(task[1])
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat, args=(path, task_id, owner, stop, queue_options)
+        )
+        heartbeat.start()
+        try:
+            params, cost = run_task(
+                task,
+                series.active,
+                series.recovered,
+                series.deaths,
+                cache,
+                backend,
+            )
+        except Exception:
+            # Any error of the fit counts as an attempt; it is retried up to
+            # max_attempts and its traceback is kept in the queue
+            error = traceback.format_exc()
+            print(f"[WARN] {owner}: task {task_id} failed\n{error}")
+            queue.fail(task_id, owner, error)
+            continue
+        finally:
+            stop.set()
+            heartbeat.join()
+        if queue.complete(task_id, owner, params, cost):
+            finished += 1
+    queue.close()
+    return finished
+
+
+def _heartbeat(path, task_id, owner, stop, queue_options):
+    """Renews the lease of a task every third of the lease time until stop is set."""
+    queue = WorkQueue(path, **queue_options)
+    while not stop.wait(queue.lease_seconds / 3):
+        if not queue.renew(task_id, owner):
+            break
+    queue.close()
+
+
+def study_jobs(settings, series, **fit_options):
+    """
+    {job name: (kind, options)} of one country (settings: a row of the config table,
+    see batch.load_config): the jobs of batch.country_jobs.
+    fit_options: n_particles, max_iter, backend, runs_per_batch, seed.
+    """
+    jobs = country_jobs(None, settings, series, **fit_options)
+    return {name: (kind, options) for name, (kind, _, options) in jobs.items()}
+
+
+def submit_study(
+    path, countries=None, config_path=COUNTRY_CONFIG, data_dir=DATA_DIR, **fit_options
+):
+    """
+    Enqueues the jobs of the countries (default: all with data and a config row).
+    fit_options: see study_jobs.
+    """
+    config = load_config(config_path)
+    countries = countries or [c for c in discover_countries(data_dir) if c in config]
+    queue = WorkQueue(path)
+    for country in countries:
+        series = load_country(country_csv(country, data_dir))
+        queue.add_series(country, series)
+        for name, (kind, options) in study_jobs(
+            config[country], series, **fit_options
+        ).items():
+            queue.submit(country, name, kind, country, options)
+    print(f"[INFO] Queue {path}: {queue.counts()} tasks of {countries}")
+    queue.close()
+
+
+def collect(
+    path, config_path=COUNTRY_CONFIG, data_dir=DATA_DIR, results_dir=RESULTS_DIR
+):
+    """Draws the figures of the countries whose jobs are all finished; returns them."""
+    config = load_config(config_path)
+    queue = WorkQueue(path)
+    manifest = ResultsManifest(os.path.join(results_dir, "manifest.json"))
+    done = []
+    for country, jobs in queue.finished_jobs().items():
+        expected = study_jobs(config[country], queue.series(country))
+        if set(jobs) != set(expected):
+            continue
+        plot_country(
+            country,
+            config[country],
+            jobs,
+            manifest,
+            data_dir,
+            results_dir,
+        )
+        done.append(country)
+    manifest.save()
+    queue.close()
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m covid_project.work_queue")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    submit = sub.add_parser("submit", help="enqueue the jobs of the study")
+    submit.add_argument("--countries", nargs="+", help="default: all in data/")
+    submit.add_argument("--config", default=COUNTRY_CONFIG)
+    submit.add_argument("--data", default=DATA_DIR)
+    submit.add_argument("--backend", choices=BACKENDS, default="numba")
+    submit.add_argument("--n-particles", type=int, default=NUM_PARTICLES)
+    submit.add_argument("--max-iter", type=int, default=MAX_ITER)
+    submit.add_argument("--runs-per-batch", type=int, default=RUNS_PER_BATCH)
+    submit.add_argument("--seed", type=int, default=0)
+
+    worker = sub.add_parser("work", help="fit tasks until the queue is finished")
+    worker.add_argument("--backend", choices=BACKENDS, help="override the planned one")
+    worker.add_argument("--threads", type=int, help="numba threads of this worker")
+    worker.add_argument("--cache", action="store_true", help="use the fit cache")
+    worker.add_argument("--lease", type=float, default=LEASE_SECONDS)
+    worker.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    worker.add_argument("--poll", type=float, default=POLL_SECONDS)
+
+    sub.add_parser("status", help="task counts and failures")
+
+    coll = sub.add_parser("collect", help="figures of the finished countries")
+    coll.add_argument("--config", default=COUNTRY_CONFIG)
+    coll.add_argument("--data", default=DATA_DIR)
+    coll.add_argument("--results", default=RESULTS_DIR)
+
+    for command in sub.choices.values():
+        command.add_argument("--db", default="queue.sqlite", help="queue database")
+    args = parser.parse_args(argv)
+
+    if args.command == "submit":
+        submit_study(
+            args.db,
+            args.countries,
+            args.config,
+            args.data,
+            n_particles=args.n_particles,
+            max_iter=args.max_iter,
+            backend=args.backend,
+            runs_per_batch=args.runs_per_batch,
+            seed=args.seed,
+        )
+    elif args.command == "work":
+        if args.threads:
+            import numba
+
+            numba.set_num_threads(args.threads)
+        finished = work(
+            args.db,
+            backend=args.backend,
+            cache=FitCache() if args.cache else None,
+            poll=args.poll,
+            lease_seconds=args.lease,
+            max_attempts=args.max_attempts,
+        )
+        print(f"[INFO] {finished} tasks fitted, queue finished")
+    elif args.command == "status":
+        queue = WorkQueue(args.db)
+        print(f"[INFO] Tasks: {queue.counts()}")
+        for country, name, idx, error in queue.failures():
+            print(f"[FAIL] {country} {name} task {idx}:\n{error}")
+        queue.close()
+    else:
+        import matplotlib.pyplot as plt
+
+        plt.switch_backend("Agg")  # figures are only saved
+        done = collect(args.db, args.config, args.data, args.results)
+        print(f"[INFO] Figures of {done} in {args.results}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The CUDA kernels run on the Numba simulator; it must be selected before numba
+# is imported.
+os.environ.setdefault("NUMBA_ENABLE_CUDASIM", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,66 @@
+import numpy as np
+
+from covid_project import pso_fitting
+from covid_project.constants import PARAM_BOUNDS
+
+N_PARTICLES = 300  # three blocks of PSO_THREADS, the last one partial
+MAX_ITER = 6
+DAYS = 15
+
+
+class _RecordingKernel:
+    """sird_euler_gpu that keeps a host copy of every evaluated particle matrix."""
+
+    def __init__(self, kernel):
+        self.kernel = kernel
+        self.positions = []
+
+    def __getitem__(self, config):
+        launch = self.kernel[config]
+
+        def record(*args):
+            self.positions.append(np.stack([row.copy_to_host() for row in args[:6]]))
+            launch(*args)
+
+        return record
+
+
+def test_device_resident_swarm(monkeypatch):
+    kernel = _RecordingKernel(pso_fitting.sird_euler_gpu)
+    monkeypatch.setattr(pso_fitting, "sird_euler_gpu", kernel)
+    D_emp = np.linspace(100.0, 300.0, DAYS)
+    I_emp = np.linspace(2000.0, 1000.0, DAYS)
+    R_emp = np.linspace(1000.0, 5000.0, DAYS)
+
+    gbest_params, history, info = pso_fitting.run_pso_sird_gpu(
+        DAYS,
+        D_emp,
+        I_emp,
+        R_emp,
+        S0=38e6 - 3100.0,
+        I0=2000.0,
+        R0=1000.0,
+        D0=100.0,
+        n_particles=N_PARTICLES,
+        max_iter=MAX_ITER,
+        backend="cuda",
+        device_resident=True,
+        seed=3,
+        return_info=True,
+        return_swarm=True,
+    )
+
+    assert len(history) == info["n_iter"] == MAX_ITER
+    assert np.all(np.diff(history) <= 0.0)
+
+    best = np.argmin(info["pbest_cost"])
+    assert history[-1] == info["pbest_cost"][best]
+    gbest = np.array([gbest_params[name] for name in PARAM_BOUNDS])
+    np.testing.assert_array_equal(gbest, info["pbest"][:, best])
+
+    lower = np.array([lo for lo, _ in PARAM_BOUNDS.values()], dtype=np.float32)
+    upper = np.array([hi for _, hi in PARAM_BOUNDS.values()], dtype=np.float32)
+    assert len(kernel.positions) == MAX_ITER
+    for pos in kernel.positions:
+        assert pos.shape == (len(PARAM_BOUNDS), N_PARTICLES)
+        assert np.all(pos >= lower[:, None]) and np.all(pos <= upper[:, None])
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from covid_project.data_loader import load_country
+from covid_project.executor import FitExecutor
+from covid_project.window_fitting import multiple_runs_fit_sird, window_wise_fitting
+
+RUNS = dict(
+    start_date="2020-05-10",
+    end_date="2020-06-13",
+    num_runs=4,
+    cost_type=30,
+    use_norm=True,
+    n_particles=16,
+    max_iter=2,
+    population=38e6,
+    backend="numba",
+    batched=True,
+    runs_per_batch=2,
+    seed=0,
+)
+WINDOWS = dict(
+    population=38e6,
+    window_size=36,
+    step=28,
+    cost_type=30,
+    n_particles=16,
+    max_iter=2,
+    use_norm=False,
+    backend="numba",
+    seed=0,
+)
+
+
+@pytest.fixture(scope="module")
+def series():
+    poland = load_country("Poland")
+    return poland[poland.span("2020-04-01", "2020-07-31")]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_executor_matches_serial_drivers(series, workers):
+    with FitExecutor({"Poland": series}, workers=workers) as ex:
+        runs, windows = ex.run_jobs(
+            [("runs", "Poland", RUNS), ("windows", "Poland", WINDOWS)]
+        )
+
+    expected = multiple_runs_fit_sird(series, **RUNS, compact=True)
+    np.testing.assert_array_equal(runs.params, expected.params)
+    np.testing.assert_array_equal(runs.cost, expected.cost)
+
+    expected = window_wise_fitting(series, **WINDOWS, compact=True)
+    assert len(windows) == len(expected) > 1
+    np.testing.assert_array_equal(windows.start_days, expected.start_days)
+    np.testing.assert_array_equal(windows.params, expected.params)
+    np.testing.assert_array_equal(windows.cost, expected.cost)
@@ -0,0 +1,156 @@
+import numpy as np
+import pytest
+from numba import cuda
+
+from covid_project.constants import PARAM_BOUNDS
+from covid_project.cpu_kernels import sird_euler_cpu
+from covid_project.gpu_kernels import (
+    sird_euler_cpu_parallel,
+    sird_euler_gpu,
+    sird_euler_windows_cpu_parallel,
+)
+from covid_project.integrators import INTEGRATORS
+
+N_PARTICLES = 64
+DAYS = 20
+NPOP = 38e6
+
+
+def _inputs(cost_type, seed=0, use_norm=None):
+    rng = np.random.default_rng(seed)
+    lower = np.array([lo for lo, _ in PARAM_BOUNDS.values()])
+    upper = np.array([hi for _, hi in PARAM_BOUNDS.values()])
+    pos = rng.uniform(lower[:, None], upper[:, None], (len(PARAM_BOUNDS), N_PARTICLES))
+    I_emp = np.linspace(1000.0, 3000.0, DAYS).astype(np.float32)
+    R_emp = np.linspace(500.0, 4000.0, DAYS).astype(np.float32)
+    D_emp = np.linspace(50.0, 200.0, DAYS).astype(np.float32)
+    if use_norm is None:
+        use_norm = 1 if cost_type == 30 else 0
+    norm = [0.0, 1.0, 0.0, 1.0, 0.0, 1.0]
+    if use_norm:
+        norm = []
+        for emp in (I_emp, R_emp, D_emp):
+            norm += [float(emp.min()), float(emp.max() - emp.min())]
+    S0 = NPOP - float(I_emp[0] + R_emp[0] + D_emp[0])
+    initial = [S0, float(I_emp[0]), float(R_emp[0]), float(D_emp[0])]
+    return pos.astype(np.float32), (I_emp, R_emp, D_emp), initial, use_norm, norm
+
+
+@pytest.mark.parametrize("integrator", sorted(INTEGRATORS))
+@pytest.mark.parametrize("cost_type", [10, 20, 3, 30])
+def test_cpu_parallel_matches_gpu(cost_type, integrator):
+    pos, emp, initial, use_norm, norm = _inputs(cost_type)
+    scheme = INTEGRATORS[integrator]
+    tail = (cost_type, *initial, use_norm, *norm, scheme)
+
+    cost_cpu = np.empty(N_PARTICLES, dtype=np.float32)
+    sird_euler_cpu_parallel(*pos, cost_cpu, 1.0, 2, NPOP, DAYS, *emp, *tail)
+
+    cost_dev = cuda.device_array(N_PARTICLES, dtype=np.float32)
+    sird_euler_gpu[1, N_PARTICLES](
+        *(cuda.to_device(row) for row in pos),
+        cost_dev,
+        1.0,
+        2,
+        NPOP,
+        DAYS,
+        *(cuda.to_device(e) for e in emp),
+        *tail,
+    )
+    cost_gpu = cost_dev.copy_to_host()
+
+    assert np.all(np.isfinite(cost_cpu))
+    np.testing.assert_allclose(cost_cpu, cost_gpu, rtol=2e-5)
+
+
+@pytest.mark.parametrize("use_norm", [0, 1])
+@pytest.mark.parametrize("integrator", sorted(INTEGRATORS))
+@pytest.mark.parametrize("cost_type", [10, 20, 3, 30])
+def test_numpy_matches_cpu_parallel(cost_type, integrator, use_norm):
+    pos, emp, initial, use_norm, norm = _inputs(cost_type, use_norm=use_norm)
+    scheme = INTEGRATORS[integrator]
+
+    cost_par = np.empty(N_PARTICLES, dtype=np.float32)
+    sird_euler_cpu_parallel(
+        *pos,
+        cost_par,
+        1.0,
+        2,
+        NPOP,
+        DAYS,
+        *emp,
+        cost_type,
+        *initial,
+        use_norm,
+        *norm,
+        scheme,
+    )
+    cost_np = sird_euler_cpu(
+        *pos,
+        1.0,
+        2,
+        NPOP,
+        DAYS,
+        *emp,
+        cost_type,
+        *initial,
+        use_norm,
+        *norm,
+        integrator=integrator,
+    )
+
+    assert np.all(np.isfinite(cost_np))
+    np.testing.assert_allclose(cost_np, cost_par, rtol=2e-5)
+
+
+@pytest.mark.parametrize("use_norm", [0, 1])
+@pytest.mark.parametrize("integrator", sorted(INTEGRATORS))
+@pytest.mark.parametrize("cost_type", [10, 20, 3, 30])
+def test_numpy_windows_match_cpu_parallel(cost_type, integrator, use_norm):
+    pos, emp, _, use_norm, norm = _inputs(cost_type, use_norm=use_norm)
+    scheme = INTEGRATORS[integrator]
+    # Every particle fits its own window of the series (the `offsets` path)
+    days = DAYS // 2
+    offsets = np.arange(N_PARTICLES, dtype=np.int32) % (DAYS - days + 1)
+    I0s, R0s, D0s = (e[offsets].astype(np.float64) for e in emp)
+    S0s = NPOP - I0s - R0s - D0s
+
+    cost_par = np.empty(N_PARTICLES, dtype=np.float32)
+    sird_euler_windows_cpu_parallel(
+        *pos,
+        offsets,
+        S0s,
+        I0s,
+        R0s,
+        D0s,
+        cost_par,
+        1.0,
+        2,
+        NPOP,
+        days,
+        *emp,
+        cost_type,
+        use_norm,
+        *norm,
+        scheme,
+    )
+    cost_np = sird_euler_cpu(
+        *pos,
+        1.0,
+        2,
+        NPOP,
+        days,
+        *emp,
+        cost_type,
+        S0s,
+        I0s,
+        R0s,
+        D0s,
+        use_norm,
+        *norm,
+        offsets=offsets,
+        integrator=integrator,
+    )
+
+    assert np.all(np.isfinite(cost_np))
+    np.testing.assert_allclose(cost_np, cost_par, rtol=2e-5)
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from covid_project.optimizers import ENGINES, fit
+
+BOUNDS = [(-1.0, 2.0)] * 4
+
+
+def sphere(pos):
+    return ((pos - 0.5) ** 2).sum(axis=0)
+
+
+@pytest.mark.parametrize("method", sorted(ENGINES))
+def test_fit_respects_budget_and_bounds(method):
+    options = dict(n_particles=50) if method == "pso" else {}
+    result = fit(sphere, BOUNDS, 2000, method, seed=0, **options)
+    assert result.n_evals <= 2000
+    assert np.all(np.diff(result.best) <= 0.0)
+    assert np.all((result.x >= -1.0) & (result.x <= 2.0))
+    assert result.cost < 1e-2
+
+
+@pytest.mark.parametrize("method", sorted(ENGINES))
+def test_too_small_budget_is_rejected(method):
+    with pytest.raises(ValueError, match="at least 2 candidates"):
+        fit(sphere, BOUNDS, 1, method, seed=0)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        fit(sphere, BOUNDS, 100, "nelder-mead")
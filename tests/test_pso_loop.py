@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from covid_project.constants import C1, C2, W
+from covid_project.pso_fitting import pso_loop
+
+N_PARAMS = 3
+N_PARTICLES = 16
+LOWER = np.zeros(N_PARAMS, dtype=np.float32)
+UPPER = np.ones(N_PARAMS, dtype=np.float32)
+
+
+class Recorder:
+    """Evaluator that keeps a copy of the positions of every run it is called with."""
+
+    def __init__(self, cost):
+        self.cost = cost
+        self.calls = []
+
+    def __call__(self, pos, run_ids=None):
+        pos = pos.reshape(N_PARAMS, -1, N_PARTICLES)
+        self.calls.append({int(r): pos[:, a].copy() for a, r in enumerate(run_ids)})
+        return np.concatenate(
+            [
+                self.cost(pos[:, a], r, len(self.calls) - 1)
+                for a, r in enumerate(run_ids)
+            ]
+        )
+
+
+def _sphere(pos, run, call):
+    return ((pos - 0.3) ** 2).sum(axis=0).astype(np.float32)
+
+
+def _constant(pos, run, call):
+    return np.ones(pos.shape[1], dtype=np.float32)
+
+
+def _run(evaluate, num_runs=1, max_iter=20, w=W, c1=C1, c2=C2, **options):
+    return pso_loop(
+        evaluate,
+        LOWER,
+        UPPER,
+        num_runs,
+        N_PARTICLES,
+        max_iter,
+        w,
+        c1,
+        c2,
+        np.random.default_rng(0),
+        **options,
+    )
+
+
+def test_surviving_run_keeps_moving_after_a_sibling_stops():
+    # Run 0 never improves and stalls; run 1 keeps optimizing the sphere
+    evaluate = Recorder(
+        lambda pos, run, call: (_constant, _sphere)[run](pos, run, call)
+    )
+    _, histories, infos = _run(evaluate, num_runs=2, max_iter=10, stall_iter=2)
+
+    assert infos[0]["stop_reason"] == "stall"
+    stop = infos[0]["n_iter"]
+    assert infos[1]["stop_reason"] == "max_iter"
+    assert infos[1]["n_evals"] == 10 * N_PARTICLES
+    assert len(evaluate.calls) == 10
+    assert 0 not in evaluate.calls[stop]
+    for a, b in zip(evaluate.calls[stop - 1 :], evaluate.calls[stop:]):
+        assert not np.array_equal(a[1], b[1])
+    assert histories[1][-1] < histories[1][0]
+
+
+def test_cost_tol_ignores_small_improvements():
+    # The best cost shrinks by 1% per iteration
+    evaluate = Recorder(lambda pos, run, call: np.full(N_PARTICLES, 0.99**call))
+
+    _, _, (info,) = _run(evaluate, stall_iter=3)
+    assert (info["stop_reason"], info["n_iter"]) == ("max_iter", 20)
+
+    _, _, (info,) = _run(evaluate, stall_iter=3, cost_tol=0.05)
+    assert (info["stop_reason"], info["n_iter"]) == ("stall", 4)
+
+
+def test_diameter_tol_stops_a_collapsed_swarm():
+    _, _, (info,) = _run(Recorder(_sphere), max_iter=500, diameter_tol=1e-3)
+    assert info["stop_reason"] == "diameter"
+    assert info["n_iter"] < 500
+
+
+def test_time_budget_stops_after_the_first_iteration():
+    _, histories, (info,) = _run(Recorder(_sphere), time_budget=0.0)
+    assert (info["stop_reason"], info["n_iter"]) == ("time", 1)
+    assert histories[0].shape == (1,)
+
+
+@pytest.mark.parametrize("restart_stall", [None, 2])
+def test_restart_stall_reinitializes_stale_particles(restart_stall):
+    # Without attraction and inertia the particles only move when restarted
+    evaluate = Recorder(_constant)
+    _run(evaluate, max_iter=5, w=0.0, c1=0.0, c2=0.0, restart_stall=restart_stall)
+
+    positions = [call[0] for call in evaluate.calls]
+    assert all(np.array_equal(positions[0], p) for p in positions[1:3])
+    moved = not np.array_equal(positions[2], positions[3])
+    assert moved == (restart_stall is not None)
+    assert np.all((positions[-1] >= 0.0) & (positions[-1] <= 1.0))
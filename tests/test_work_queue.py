@@ -0,0 +1,133 @@
+import multiprocessing
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from covid_project.data_loader import load_country
+from covid_project.executor import FitExecutor
+from covid_project.work_queue import WorkQueue, work
+
+N_TASKS = 12
+
+
+def _options(num_runs):
+    return dict(
+        start_date="2020-05-10",
+        end_date="2020-06-13",
+        num_runs=num_runs,
+        n_particles=8,
+        max_iter=1,
+        batched=True,
+        runs_per_batch=1,
+        seed=0,
+    )
+
+
+def _queue(path, num_runs):
+    queue = WorkQueue(path)
+    queue.add_series("Poland", load_country("Poland"))
+    queue.submit("Poland", "runs_1", "runs", "Poland", _options(num_runs))
+    queue.close()
+    return path
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return _queue(str(tmp_path / "queue.sqlite"), N_TASKS)
+
+
+def _result():
+    return np.zeros((1, 6)), np.zeros(1)
+
+
+def test_concurrent_leases_are_disjoint(queue_path):
+    leased = []
+    lock = threading.Lock()
+
+    def leaser(owner):
+        queue = WorkQueue(queue_path)
+        while (item := queue.lease(owner)) is not None:
+            with lock:
+                leased.append(item[0])
+        queue.close()
+
+    threads = [threading.Thread(target=leaser, args=(f"w{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(leased) == N_TASKS
+    assert len(set(leased)) == N_TASKS
+
+
+def test_expired_lease_is_handed_out_again(queue_path):
+    queue = WorkQueue(queue_path, lease_seconds=0.05)
+    first_id, first_task = queue.lease("dead")
+    time.sleep(0.1)
+
+    task_id, task = queue.lease("alive")
+    assert (task_id, task) == (first_id, first_task)
+    assert not queue.renew(task_id, "dead")
+    assert not queue.complete(task_id, "dead", *_result())
+    assert queue.complete(task_id, "alive", *_result())
+    assert queue.counts()["done"] == 1
+
+
+def test_renewed_lease_is_kept(queue_path):
+    queue = WorkQueue(queue_path, lease_seconds=0.2)
+    task_id, _ = queue.lease("slow")
+    for _ in range(3):
+        time.sleep(0.1)
+        assert queue.renew(task_id, "slow")
+    other_id, _ = queue.lease("other")
+    assert other_id != task_id
+    assert queue.complete(task_id, "slow", *_result())
+
+
+def test_failed_task_is_retried_until_max_attempts(queue_path):
+    queue = WorkQueue(queue_path, max_attempts=2)
+    task_id, _ = queue.lease("a")
+    queue.fail(task_id, "a", "boom 1")
+    assert queue.counts()["pending"] == N_TASKS
+
+    assert queue.lease("b")[0] == task_id
+    queue.fail(task_id, "b", "boom 2")
+    assert queue.counts()["failed"] == 1
+    assert queue.failures() == [("Poland", "runs_1", 0, "boom 2")]
+    assert queue.lease("c")[0] != task_id
+
+
+def test_expired_lease_fails_after_max_attempts(queue_path):
+    queue = WorkQueue(queue_path, lease_seconds=0.01, max_attempts=2)
+    task_id, _ = queue.lease("a")
+    time.sleep(0.05)
+    assert queue.lease("b")[0] == task_id
+    time.sleep(0.05)
+    assert queue.lease("c")[0] != task_id
+    assert queue.counts()["failed"] == 1
+    assert not queue.complete(task_id, "b", *_result())
+
+
+def test_worker_processes_finish_the_queue(tmp_path):
+    path = _queue(str(tmp_path / "queue.sqlite"), 4)
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=work, args=(path,), kwargs=dict(poll=0.1))
+        for _ in range(2)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=300)
+        assert worker.exitcode == 0
+
+    queue = WorkQueue(path)
+    assert queue.counts() == {"done": 4}
+    fits = queue.finished_jobs()["Poland"]["runs_1"]
+    with FitExecutor({"Poland": load_country("Poland")}, workers=1) as ex:
+        expected = ex.multiple_runs("Poland", **_options(4))
+    np.testing.assert_array_equal(fits.params, expected.params)
+    np.testing.assert_allclose(fits.cost, expected.cost)